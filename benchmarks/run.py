@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+"""Cold start benchmarks for the lambda handlers generated by slam.
+
+This script builds a few sample projects and measures, for each of them, the
+size of the lambda package, the time it takes to import the application, the
+time it takes to import the generated handler, and the duration of cold and
+warm invocations. The per-request overhead of the default and wsgi run
+functions is also measured. The results are written as JSON, and can be
+compared against the results of a previous run to detect regressions.
+
+Usage:
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --output results.json --compare baseline.json
+
+By default the projects are built with ``slam build``, which requires
+virtualenv and network access to install their dependencies. With the
+``--no-build`` option the projects are packaged without dependencies, and are
+run against the packages installed in the current environment instead.
+"""
+from __future__ import print_function
+
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from slam import cli  # noqa: E402
+from slam.plugins import wsgi  # noqa: E402
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                            'examples')
+
+PROJECTS = {
+    'fizzbuzz': {
+        'example': 'fizzbuzz',
+        'function': 'fizzbuzz:fizzbuzz',
+        'wsgi': False,
+        'event': {'kwargs': {'number': 15}},
+    },
+    'tasks-api': {
+        'example': 'tasks-api',
+        'function': 'tasks_api:app',
+        'wsgi': True,
+        'event': {'httpMethod': 'GET', 'path': '/', 'headers': {},
+                  'queryStringParameters': None, 'body': None},
+    },
+    'heavy': {
+        'example': None,
+        'function': 'heavy_app:app',
+        'wsgi': True,
+        'event': {'httpMethod': 'GET', 'path': '/', 'headers': {},
+                  'queryStringParameters': None, 'body': None},
+    },
+}
+
+# metrics where a higher value is a regression
+METRICS = ['package_size', 'import_ms', 'init_ms', 'cold_invocation_ms',
+           'warm_invocation_ms', 'run_lambda_function_us',
+           'wsgi_run_lambda_function_us']
+
+IMPORT_CODE = '''import sys
+import time
+sys.path.insert(0, '.')
+start = time.time()
+import {module}
+print((time.time() - start) * 1000)
+'''
+
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def create_heavy_project(modules=200, functions=50):
+    """Generate a synthetic project with heavy dependencies and a large
+    amount of application code."""
+    with open('requirements.txt', 'wt') as f:
+        f.write('boto3\nflask\n')
+    os.mkdir('heavy_lib')
+    with open(os.path.join('heavy_lib', '__init__.py'), 'wt') as f:
+        for i in range(modules):
+            f.write('from . import module{}  # noqa\n'.format(i))
+    for i in range(modules):
+        with open(os.path.join('heavy_lib', 'module{}.py'.format(i)),
+                  'wt') as f:
+            for j in range(functions):
+                f.write('def function{0}(x):\n'
+                        '    return [x * {0} + n for n in range(10)]\n\n\n'
+                        .format(j))
+            f.write('class Model{}(object):\n'
+                    '    fields = {}\n'.format(i, list(range(functions))))
+    with open('heavy_app.py', 'wt') as f:
+        f.write('import boto3  # noqa\n'
+                'from flask import Flask, jsonify\n'
+                'import heavy_lib  # noqa\n\n'
+                'app = Flask(__name__)\n\n\n'
+                '@app.route(\'/\')\n'
+                'def index():\n'
+                '    return jsonify({\'status\': \'ok\'})\n')
+
+
+def create_project(spec):
+    """Create a slam project in the current directory."""
+    if spec['example']:
+        example = os.path.join(EXAMPLES_DIR, spec['example'])
+        for name in os.listdir(example):
+            shutil.copy(os.path.join(example, name), name)
+    else:
+        create_heavy_project()
+    args = ['init', spec['function']]
+    if spec['wsgi']:
+        args.append('--wsgi')
+    cli.main(args)
+    return cli._load_config()
+
+
+def create_package(config, build):
+    """Return a lambda package for the project in the current directory."""
+    if build:
+        return cli._build(config)
+    os.mkdir('.slam')
+    cli._generate_lambda_handler(config)
+    package = 'lambda_package.zip'
+    with zipfile.ZipFile(package, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.write('.slam/handler.py', 'handler.py')
+        for root, dirs, files in os.walk('.'):
+            dirs[:] = [d for d in dirs if d != '.slam']
+            for name in files:
+                if name.endswith('.py'):
+                    path = os.path.join(root, name)
+                    z.write(path, os.path.relpath(path, '.'))
+    return package
+
+
+def measure_import(sandbox, module, runs):
+    """Time the import of the application module in a fresh interpreter."""
+    durations = []
+    for i in range(runs):
+        proc = subprocess.Popen(
+            [sys.executable, '-c', IMPORT_CODE.format(module=module)],
+            cwd=sandbox, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(err.decode('utf-8').strip().splitlines()[-1])
+        durations.append(float(out.decode('utf-8').strip().splitlines()[-1]))
+    return median(durations)
+
+
+def measure_invocations(config, sandbox, event, runs, warm_runs):
+    """Time cold starts and warm invocations in emulated containers."""
+    timeout = config['aws'].get('lambda_timeout', 10)
+    init = []
+    cold = []
+    warm = []
+    for i in range(runs):
+        worker = cli._EmulatorWorker(sandbox, config)
+        try:
+            init.append(worker.init_duration)
+            for j in range(warm_runs + 1):
+                context = cli._LambdaContext(config, config['devstage'],
+                                             timeout)
+                rv = worker.invoke(event, context, timeout)
+                if 'error' in rv:
+                    raise RuntimeError(rv['error'])
+                (warm if j else cold).append(rv['duration'])
+        finally:
+            worker.close()
+    return median(init), median(cold), median(warm)
+
+
+def benchmark_project(name, spec, build, runs, warm_runs):
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='slam-benchmark-')
+    try:
+        os.chdir(workdir)
+        config = create_project(spec)
+        package = create_package(config, build)
+        sandbox = os.path.join(workdir, 'sandbox')
+        with zipfile.ZipFile(package) as z:
+            z.extractall(sandbox)
+            files = len(z.namelist())
+        result = {'package_size': os.path.getsize(package),
+                  'package_files': files}
+        result['import_ms'] = measure_import(
+            sandbox, config['function']['module'], runs)
+        result['init_ms'], result['cold_invocation_ms'], \
+            result['warm_invocation_ms'] = measure_invocations(
+                config, sandbox, spec['event'], runs, warm_runs)
+        return result
+    except Exception as e:
+        return {'error': '{}: {}'.format(e.__class__.__name__, e)}
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+def measure_overhead(iterations):
+    """Time the per-request overhead of the run functions, in microseconds,
+    with applications that do no work."""
+    context = cli._LambdaContext({'name': 'benchmark', 'aws': {},
+                                  'stage_environments': {}}, 'dev')
+
+    def function(event, context):
+        return None
+
+    def application(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'']
+
+    function_event = {'kwargs': {}}
+    wsgi_event = {'httpMethod': 'GET', 'path': '/', 'headers': {},
+                  'queryStringParameters': None, 'body': None}
+    wsgi_config = {'wsgi': {}}
+
+    start = time.time()
+    for i in range(iterations):
+        cli._run_lambda_function(function_event, context, function, {})
+    run_lambda_function = (time.time() - start) * 1e6 / iterations
+
+    start = time.time()
+    for i in range(iterations):
+        wsgi.run_lambda_function(wsgi_event, context, application,
+                                 wsgi_config)
+    wsgi_run_lambda_function = (time.time() - start) * 1e6 / iterations
+
+    return {'run_lambda_function_us': run_lambda_function,
+            'wsgi_run_lambda_function_us': wsgi_run_lambda_function}
+
+
+def compare(results, baseline, threshold, min_difference):
+    """Print a comparison against a previous run and return the list of
+    metrics that regressed by more than ``threshold`` percent. Differences
+    smaller than ``min_difference`` are considered noise."""
+    regressions = []
+    groups = [('overhead', results['overhead'],
+               baseline.get('overhead', {}))]
+    for name, result in sorted(results['projects'].items()):
+        groups.append((name, result,
+                       baseline.get('projects', {}).get(name, {})))
+    for group, current, previous in groups:
+        for metric in METRICS:
+            if not previous.get(metric):
+                continue
+            if metric not in current:
+                # the metric could not be measured, for example because the
+                # project does not build or import anymore
+                regressions.append('{}.{}'.format(group, metric))
+                print('{:<10} {:<28} {:>12.2f} {:>12} {:>9} MISSING'.format(
+                    group, metric, previous[metric], '-', '-'))
+                continue
+            change = (current[metric] - previous[metric]) * 100.0 / \
+                previous[metric]
+            flag = ''
+            if change > threshold and \
+                    current[metric] - previous[metric] > min_difference:
+                flag = ' REGRESSION'
+                regressions.append('{}.{}'.format(group, metric))
+            print('{:<10} {:<28} {:>12.2f} {:>12.2f} {:>+8.1f}%{}'.format(
+                group, metric, previous[metric], current[metric], change,
+                flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Cold start benchmarks for slam generated handlers.')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='JSON file where the results are written.')
+    parser.add_argument('--compare',
+                        help='JSON results of a previous run to compare '
+                             'against.')
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help='Percentage increase over the previous run '
+                             'that is considered a regression.')
+    parser.add_argument('--min-difference', type=float, default=0.5,
+                        help='Minimum absolute increase over the previous '
+                             'run that is considered a regression, in the '
+                             'units of each metric.')
+    parser.add_argument('--project', action='append',
+                        choices=sorted(PROJECTS.keys()),
+                        help='Project to benchmark. Can be given multiple '
+                             'times. Default is all projects.')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of cold starts to measure.')
+    parser.add_argument('--warm-runs', type=int, default=20,
+                        help='Number of warm invocations after each cold '
+                             'start.')
+    parser.add_argument('--iterations', type=int, default=10000,
+                        help='Iterations of the run function overhead '
+                             'benchmarks.')
+    parser.add_argument('--no-build', action='store_true',
+                        help='Package the projects without dependencies, '
+                             'using the current environment instead.')
+    args = parser.parse_args(argv)
+
+    results = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'build': not args.no_build,
+        'overhead': measure_overhead(args.iterations),
+        'projects': {},
+    }
+    for name in args.project or sorted(PROJECTS.keys()):
+        print('Benchmarking {}...'.format(name))
+        results['projects'][name] = benchmark_project(
+            name, PROJECTS[name], not args.no_build, args.runs,
+            args.warm_runs)
+        if 'error' in results['projects'][name]:
+            print('  ' + results['projects'][name]['error'])
+    with open(args.output, 'wt') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Results written to ' + args.output)
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold,
+                              args.min_difference)
+        if regressions:
+            print('Regressions: ' + ', '.join(regressions))
+            status = 1
+    errors = sorted(name for name, result in results['projects'].items()
+                    if 'error' in result)
+    if errors:
+        print('Failed projects: ' + ', '.join(errors))
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,6 +24,85 @@ def _get_cfn_parameters(config):
     return params
 
 
+def _profiler_enabled(config):
+    """Return True if the sampling profiler is enabled for any stage."""
+    environments = [config.get('environment') or {}] + \
+        [env or {} for env in config['stage_environments'].values()]
+    return any([float(env.get('SLAM_PROFILE_RATE') or 0) > 0
+                for env in environments])
+
+
+def _get_provisioned_concurrency(config, stage):
+    """Return the provisioned concurrency settings for a stage. These can be
+    given as a number, or as a dictionary with a concurrency number and an
+    optional scaling schedule."""
+    provisioned = (config['aws'].get('provisioned_concurrency') or {}).get(
+        stage)
+    if not provisioned:
+        return None
+    if not isinstance(provisioned, dict):
+        provisioned = {'concurrency': provisioned}
+    if not isinstance(provisioned.get('concurrency'), int):
+        raise ValueError('Invalid provisioned concurrency for stage ' + stage)
+    if stage == config.get('devstage'):
+        raise ValueError('Provisioned concurrency cannot be used with the '
+                         'development stage {}, as it does not have a '
+                         'published version.'.format(stage))
+    return provisioned
+
+
+def _get_cfn_conditions(config):
+    """Return the conditions that check if the stages with provisioned
+    concurrency have a published version, as provisioned concurrency cannot
+    be configured on an alias that points to $LATEST."""
+    conditions = collections.OrderedDict()
+    for stage in config['stage_environments'].keys():
+        if _get_provisioned_concurrency(config, stage):
+            conditions[stage.title() + 'VersionPublished'] = {
+                'Fn::Not': [{'Fn::Equals': [
+                    {'Ref': stage.title() + 'Version'}, '$LATEST']}]}
+    return conditions
+
+
+def _get_provisioned_concurrency_scalable_target(stage, provisioned):
+    actions = []
+    capacities = [provisioned['concurrency']]
+    for i, action in enumerate(provisioned['schedule']):
+        if 'schedule' not in action or 'min' not in action:
+            raise ValueError('Scheduled actions for stage {} need schedule '
+                             'and min settings'.format(stage))
+        minimum = action['min']
+        maximum = action.get('max', minimum)
+        capacities.append(maximum)
+        scheduled_action = {
+            'ScheduledActionName': '{}-provisioned-concurrency-{}'.format(
+                stage, i + 1),
+            'Schedule': action['schedule'],
+            'ScalableTargetAction': {
+                'MinCapacity': minimum,
+                'MaxCapacity': maximum
+            }
+        }
+        if action.get('timezone'):
+            scheduled_action['Timezone'] = action['timezone']
+        actions.append(scheduled_action)
+    return {
+        'Type': 'AWS::ApplicationAutoScaling::ScalableTarget',
+        'DependsOn': stage.title() + 'FunctionAlias',
+        'Properties': {
+            'ServiceNamespace': 'lambda',
+            'ScalableDimension': 'lambda:function:ProvisionedConcurrency',
+            'ResourceId': {
+                'Fn::Join': ['', ['function:', {'Ref': 'Function'},
+                                  ':' + stage]]
+            },
+            'MinCapacity': provisioned['concurrency'],
+            'MaxCapacity': max(capacities),
+            'ScheduledActions': actions
+        }
+    }
+
+
 def _get_cfn_resources(config):
     res = collections.OrderedDict()
     res['FunctionExecutionRole'] = {
@@ -58,6 +137,23 @@ def _get_cfn_resources(config):
     for policy in config['aws'].get('lambda_inline_policies') or []:
         res['FunctionExecutionRole']['Properties']['Policies'].append(
             policy)
+    if _profiler_enabled(config):
+        # allow the lambda handler to upload profiles to the project's bucket
+        res['FunctionExecutionRole']['Properties']['Policies'].append({
+            'PolicyName': 'SlamProfiles',
+            'PolicyDocument': {
+                'Version': '2012-10-17',
+                'Statement': [
+                    {
+                        'Effect': 'Allow',
+                        'Action': ['s3:PutObject'],
+                        'Resource': {'Fn::Join': ['', [
+                            'arn:aws:s3:::', {'Ref': 'LambdaS3Bucket'},
+                            '/profiles/' + config['name'] + '/*']]}
+                    }
+                ]
+            }
+        })
     res['Function'] = {
         'Type': 'AWS::Lambda::Function',
         'DependsOn': 'FunctionExecutionRole',
@@ -83,6 +179,18 @@ def _get_cfn_resources(config):
                 config['aws'].get('lambda_security_groups') or [],
             'SubnetIds': config['aws'].get('lambda_subnet_ids') or []
         }
+    tracing = config['aws'].get('tracing')
+    if tracing:
+        modes = {'active': 'Active', 'passthrough': 'PassThrough'}
+        if tracing not in modes:
+            raise ValueError('Invalid tracing mode ' + tracing)
+        res['Function']['Properties']['TracingConfig'] = {
+            'Mode': modes[tracing]}
+        res['FunctionExecutionRole']['Properties']['ManagedPolicyArns'].append(
+            'arn:aws:iam::aws:policy/AWSXRayDaemonWriteAccess')
+    if config['aws'].get('reserved_concurrency') is not None:
+        res['Function']['Properties']['ReservedConcurrentExecutions'] = \
+            config['aws']['reserved_concurrency']
     for stage in config['stage_environments'].keys():
         res[stage.title() + 'FunctionAlias'] = {
             'Type': 'AWS::Lambda::Alias',
@@ -92,6 +200,20 @@ def _get_cfn_resources(config):
                 'FunctionVersion': {'Ref': stage.title() + 'Version'}
             }
         }
+        provisioned = _get_provisioned_concurrency(config, stage)
+        if provisioned:
+            res[stage.title() + 'FunctionAlias']['Properties'][
+                'ProvisionedConcurrencyConfig'] = {
+                    'Fn::If': [stage.title() + 'VersionPublished', {
+                        'ProvisionedConcurrentExecutions':
+                            provisioned['concurrency']},
+                        {'Ref': 'AWS::NoValue'}]}
+        if provisioned and provisioned.get('schedule'):
+            target = _get_provisioned_concurrency_scalable_target(
+                stage, provisioned)
+            target['Condition'] = stage.title() + 'VersionPublished'
+            res[stage.title() + 'ProvisionedConcurrencyScalableTarget'] = \
+                target
     res.update(config['aws'].get('cfn_resources') or {})
     return res
 
@@ -114,6 +236,9 @@ def get_cfn_template(config, pretty=False):
             ('Outputs', _get_cfn_outputs(config))
         ]
     )
+    conditions = _get_cfn_conditions(config)
+    if conditions:
+        tpl['Conditions'] = conditions
     for name, plugin in plugins.items():
         if name in config and hasattr(plugin, 'cfn_template'):
             tpl = plugin.cfn_template(config, tpl)
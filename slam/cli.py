@@ -1,9 +1,11 @@
 from __future__ import print_function
 
+import base64
 from datetime import datetime
 import inspect
 import json
 import logging
+from multiprocessing.pool import ThreadPool
 import os
 try:
     import pkg_resources
@@ -15,7 +17,20 @@ import subprocess
 import shutil
 import string
 import sys
+import tempfile
+import threading
 import time
+import traceback
+import uuid
+import zipfile
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
 
 import boto3
 import botocore
@@ -227,6 +242,12 @@ def _build(config, rebuild_deps=False):
         os.mkdir('.slam')
     _generate_lambda_handler(config)
 
+    # plugins can add their own files to the package
+    extra_files = ['.slam/handler.py']
+    for name, plugin in plugins.items():
+        if name in config and hasattr(plugin, 'build'):
+            extra_files += plugin.build(config) or []
+
     # create or update virtualenv
     if rebuild_deps:
         if os.path.exists('.slam/venv'):
@@ -237,7 +258,7 @@ def _build(config, rebuild_deps=False):
 
     # build lambda package
     build_package('.', config['requirements'], virtualenv='.slam/venv',
-                  extra_files=['.slam/handler.py'], ignore=ignore,
+                  extra_files=extra_files, ignore=ignore,
                   zipfile_name=package)
 
     # cleanup lambda uploader's temp directory
@@ -627,6 +648,28 @@ def status(config_file):
     _print_status(config)
 
 
+def _get_period_start(period):
+    """Return the start time for a period given as a number followed by a
+    unit, such as "3h"."""
+    try:
+        start = float(period[:-1])
+    except ValueError:
+        raise ValueError('Invalid period ' + period)
+    if period[-1] == 's':
+        start = time.time() - start
+    elif period[-1] == 'm':
+        start = time.time() - start * 60
+    elif period[-1] == 'h':
+        start = time.time() - start * 60 * 60
+    elif period[-1] == 'd':
+        start = time.time() - start * 60 * 60 * 24
+    elif period[-1] == 'w':
+        start = time.time() - start * 60 * 60 * 24 * 7
+    else:
+        raise ValueError('Invalid period ' + period)
+    return start
+
+
 @main.command()
 @climax.argument('--tail', '-t', action='store_true',
                  help='Tail the log stream')
@@ -653,23 +696,7 @@ def logs(stage, period, tail, config_file):
     version = _get_from_stack(stack, 'Parameter', stage.title() + 'Version')
     api_id = _get_from_stack(stack, 'Output', 'ApiId')
 
-    try:
-        start = float(period[:-1])
-    except ValueError:
-        raise ValueError('Invalid period ' + period)
-    if period[-1] == 's':
-        start = time.time() - start
-    elif period[-1] == 'm':
-        start = time.time() - start * 60
-    elif period[-1] == 'h':
-        start = time.time() - start * 60 * 60
-    elif period[-1] == 'd':
-        start = time.time() - start * 60 * 60 * 24
-    elif period[-1] == 'w':
-        start = time.time() - start * 60 * 60 * 24 * 7
-    else:
-        raise ValueError('Invalid period ' + period)
-    start = int(start * 1000)
+    start = int(_get_period_start(period) * 1000)
 
     logs = boto3.client('logs')
     lambda_log_group = '/aws/lambda/' + function
@@ -711,6 +738,658 @@ def logs(stage, period, tail, config_file):
         time.sleep(5)
 
 
+@main.command()
+@climax.argument('--delete', action='store_true',
+                 help='Delete the profiles from S3 after merging them.')
+@climax.argument('--output', '-o', default='profile.folded',
+                 help=('File where the merged profile is written. Default is '
+                       'profile.folded.'))
+@climax.argument('--period', '-p', default='1d',
+                 help=('How far back to look for profiles, in weeks (1w), '
+                       'days (2d), hours (3h), minutes (4m) or seconds (5s). '
+                       'Default is 1d.'))
+@climax.argument('--stage',
+                 help=('Stage to merge profiles for. Defaults to the stage '
+                       'designated as the development stage'))
+def profile(stage, period, output, delete, config_file):
+    """Merge the profiles uploaded by the lambda function."""
+    config = _load_config(config_file)
+    if stage is None:
+        stage = config['devstage']
+    start = _get_period_start(period)
+
+    s3 = boto3.client('s3')
+    bucket = config['aws']['s3_bucket']
+    prefix = 'profiles/{}/{}/'.format(config['name'], stage)
+    keys = []
+    kwargs = {'StartAfter': prefix + time.strftime('%Y%m%dT%H%M%S',
+                                                   time.gmtime(start))}
+    while True:
+        objects = s3.list_objects_v2(Bucket=bucket, Prefix=prefix, **kwargs)
+        keys += [obj['Key'] for obj in objects.get('Contents', [])]
+        if not objects.get('IsTruncated'):
+            break
+        kwargs['ContinuationToken'] = objects['NextContinuationToken']
+    if not keys:
+        print('No profiles found for {}:{}.'.format(config['name'], stage))
+        return
+
+    # profiles are in collapsed stack format, with a sample count at the end
+    # of each line
+    stacks = {}
+    for key in keys:
+        body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+        for line in body.decode('utf-8').splitlines():
+            stack, count = line.rsplit(' ', 1)
+            stacks[stack] = stacks.get(stack, 0) + int(count)
+    with open(output, 'wt') as f:
+        for stack in sorted(stacks.keys()):
+            f.write('{} {}\n'.format(stack, stacks[stack]))
+    print('{} profile(s) with {} samples merged into {}.'.format(
+        len(keys), sum(stacks.values()), output))
+
+    if delete:
+        for key in keys:
+            s3.delete_object(Bucket=bucket, Key=key)
+
+
+class _LambdaContext(object):
+    """Local stand-in for the context object given to Lambda functions."""
+    def __init__(self, config, stage, timeout=None):
+        self.function_name = config['name']
+        self.function_version = '$LATEST'
+        self.invoked_function_arn = \
+            'arn:aws:lambda:local:000000000000:function:{}:{}'.format(
+                config['name'], stage)
+        self.memory_limit_in_mb = str(
+            config['aws'].get('lambda_memory', 128))
+        self.aws_request_id = str(uuid.uuid4())
+        self.log_group_name = '/aws/lambda/' + config['name']
+        self.log_stream_name = 'local'
+        self.identity = None
+        self.client_context = None
+        if timeout is None:
+            timeout = config['aws'].get('lambda_timeout', 10)
+        self._deadline = time.time() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(int((self._deadline - time.time()) * 1000), 0)
+
+
+def _get_api_gateway_event(method, url, headers, body, stage):
+    """Return an API Gateway proxy integration event for a request."""
+    url = urlparse(url)
+    query = parse_qs(url.query, keep_blank_values=True)
+    try:
+        body = body.decode('utf-8') if body else None
+        b64 = False
+    except UnicodeDecodeError:
+        body = base64.b64encode(body).decode('utf-8')
+        b64 = True
+    return {
+        'resource': '/{proxy+}',
+        'path': url.path,
+        'httpMethod': method,
+        'headers': dict(headers),
+        'multiValueHeaders': {h: [v] for h, v in headers},
+        'queryStringParameters': {k: v[-1] for k, v in query.items()}
+        if query else None,
+        'multiValueQueryStringParameters': query or None,
+        'pathParameters': {'proxy': url.path[1:]} if url.path != '/'
+        else None,
+        'stageVariables': {'STAGE': stage},
+        'requestContext': {
+            'stage': stage,
+            'httpMethod': method,
+            'path': '/' + stage + url.path,
+            'requestId': str(uuid.uuid4()),
+            'identity': {'sourceIp': '127.0.0.1'}
+        },
+        'body': body,
+        'isBase64Encoded': b64
+    }
+
+
+def _get_http_response(rv):
+    """Return the status code, headers and body for a handler response."""
+    if not isinstance(rv, dict) or 'statusCode' not in rv:
+        # this is not an HTTP response, so return it as JSON
+        return 200, [('Content-Type', 'application/json')], \
+            json.dumps(rv).encode('utf-8')
+    headers = list((rv.get('headers') or {}).items())
+    for h, values in (rv.get('multiValueHeaders') or {}).items():
+        headers += [(h, v) for v in values]
+    headers += [('Set-Cookie', c) for c in rv.get('cookies') or []]
+    body = rv.get('body') or ''
+    if rv.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    else:
+        body = body.encode('utf-8')
+    return rv['statusCode'], headers, body
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _get_request_handler_class(config, stage, containers):
+    timeout = config['aws'].get('lambda_timeout', 10)
+
+    class LambdaRequestHandler(BaseHTTPRequestHandler):
+        def handle_request(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            event = _get_api_gateway_event(self.command, self.path,
+                                           list(self.headers.items()), body,
+                                           stage)
+            context = _LambdaContext(config, stage, timeout)
+            start = time.time()
+            try:
+                rv = containers.invoke(event, context, timeout)
+            except Exception as e:
+                traceback.print_exc()
+                rv = {'error': '{}: {}'.format(e.__class__.__name__, str(e))}
+            duration = (time.time() - start) * 1000
+            if 'error' in rv:
+                status = 502
+                headers = [('Content-Type', 'text/plain')]
+                body = (rv['error'] + '\n').encode('utf-8')
+            else:
+                status, headers, body = _get_http_response(rv['result'])
+            self.send_response(status)
+            for h, v in headers:
+                if h.lower() not in ['content-length', 'connection']:
+                    self.send_header(h, v)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+            print('{} {} {} {:.2f}ms'.format(self.command, self.path, status,
+                                             duration))
+
+        def log_message(self, format, *args):
+            # requests are logged by handle_request, along with their timing
+            pass
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = \
+            do_OPTIONS = handle_request
+
+    return LambdaRequestHandler
+
+
+@main.command()
+@climax.argument('--workers', type=int, default=4,
+                 help='Maximum number of emulated Lambda containers, each '
+                      'running one invocation at a time. Default is 4.')
+@climax.argument('--port', '-p', type=int, default=5000,
+                 help='The port where the server listens. Default is 5000.')
+@climax.argument('--host', default='127.0.0.1',
+                 help='The interface where the server listens. Default is '
+                      '127.0.0.1.')
+@climax.argument('--stage',
+                 help=('Stage to simulate. Defaults to the stage designated '
+                       'as the development stage'))
+def serve(stage, host, port, workers, config_file):
+    """Run the project locally with a development web server."""
+    config = _load_config(config_file)
+    if stage is None:
+        stage = config['devstage']
+    if stage not in config['stage_environments']:
+        raise ValueError('Invalid stage ' + stage)
+
+    if not os.path.exists('.slam'):
+        os.mkdir('.slam')
+    _generate_lambda_handler(config)
+
+    for name, plugin in plugins.items():
+        if name in config and hasattr(plugin, 'build'):
+            plugin.build(config)
+
+    # each invocation runs in a container process of its own, because the
+    # handler module keeps per-container state (the ASGI event loop, the
+    # response cache, the cold start flag and the stage environment) that
+    # Lambda never shares between concurrent invocations. Plugins can add
+    # their own modules to the .slam directory, so it needs to be in the path
+    # of the containers, along with the project
+    containers = _EmulatorPool(config, os.getcwd(), workers,
+                               path=[os.path.abspath('.slam')])
+    server = _ThreadingHTTPServer(
+        (host, port), _get_request_handler_class(config, stage, containers))
+    print('Serving {}:{} on http://{}:{}/ (press Ctrl-C to stop)'.format(
+        config['name'], stage, host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:  # pragma: no cover
+        pass
+    finally:
+        server.server_close()
+        containers.close()
+
+
+def _emulator_worker():  # pragma: no cover
+    """Lambda container emulator. This function runs in a separate Python
+    interpreter, inside the directory where the lambda package is extracted.
+    It imports the handler and then runs the invocations it receives on stdin,
+    writing the results to stdout."""
+    import json
+    import os
+    import sys
+    import time
+
+    # reserve stdout for the emulator protocol, and send anything the
+    # function prints to stderr
+    protocol = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    sys.path.insert(0, os.getcwd())
+
+    class Context(object):
+        def __init__(self, attributes, timeout):
+            self.__dict__.update(attributes)
+            self._deadline = time.time() + timeout
+
+        def get_remaining_time_in_millis(self):
+            return max(int((self._deadline - time.time()) * 1000), 0)
+
+    def send(message):
+        protocol.write(json.dumps(message, default=str) + '\n')
+        protocol.flush()
+
+    start = time.time()
+    try:
+        from handler import lambda_handler
+    except Exception as e:
+        send({'error': '{}: {}'.format(e.__class__.__name__, e)})
+        return
+    send({'init': (time.time() - start) * 1000})
+
+    for line in iter(sys.stdin.readline, ''):
+        request = json.loads(line)
+        context = Context(request['context'], request['timeout'])
+        start = time.time()
+        try:
+            response = {'result': lambda_handler(request['event'], context)}
+        except Exception as e:
+            response = {'error': '{}: {}'.format(e.__class__.__name__, e)}
+        response['duration'] = (time.time() - start) * 1000
+        send(response)
+
+
+class _EmulatorWorker(object):
+    """A Lambda container, emulated by a worker process."""
+    def __init__(self, sandbox, config, path=None):
+        env = os.environ.copy()
+        if path:
+            env['PYTHONPATH'] = os.pathsep.join(
+                path + [p for p in [env.get('PYTHONPATH')] if p])
+        env.update({
+            'LAMBDA_TASK_ROOT': sandbox,
+            'AWS_LAMBDA_FUNCTION_NAME': config['name'],
+            'AWS_LAMBDA_FUNCTION_MEMORY_SIZE': str(
+                config['aws'].get('lambda_memory', 128)),
+            'AWS_LAMBDA_FUNCTION_VERSION': '$LATEST',
+        })
+        code = ''.join(inspect.getsourcelines(_emulator_worker)[0])
+        self.proc = subprocess.Popen(
+            [sys.executable, '-c', code + '\n_emulator_worker()\n'],
+            cwd=sandbox, env=env, stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+        message = self._receive()
+        if 'error' in message:
+            self.close()
+            raise RuntimeError('Lambda handler could not be imported. '
+                               + message['error'])
+        self.init_duration = message['init']
+        self.invocations = 0
+
+    def _receive(self):
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError('Emulated container exited unexpectedly.')
+        return json.loads(line.decode('utf-8'))
+
+    def invoke(self, event, context, timeout):
+        attributes = {k: v for k, v in vars(context).items()
+                      if not k.startswith('_')}
+        self.proc.stdin.write((json.dumps({
+            'event': event, 'context': attributes, 'timeout': timeout
+        }) + '\n').encode('utf-8'))
+        self.proc.stdin.flush()
+        self.invocations += 1
+        return self._receive()
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+        self.proc.stdout.close()
+
+
+class _EmulatorPool(object):
+    """A set of emulated Lambda containers that run one invocation at a time.
+
+    Invocations are sent to an idle container when one is available, else a
+    new container is started. No more than ``size`` containers are started,
+    additional invocations wait for one of them to be idle."""
+    def __init__(self, config, sandbox, size, path=None):
+        self.config = config
+        self.sandbox = sandbox
+        self.path = path
+        self.slots = threading.Semaphore(size)
+        self.lock = threading.Lock()
+        self.idle = []
+        self.workers = []
+
+    def invoke(self, event, context, timeout):
+        with self.slots:
+            with self.lock:
+                worker = self.idle.pop() if self.idle else None
+            if worker is None:
+                worker = _EmulatorWorker(self.sandbox, self.config,
+                                         self.path)
+                with self.lock:
+                    self.workers.append(worker)
+            try:
+                rv = worker.invoke(event, context, timeout)
+            except Exception:
+                # the container exited, so a new one is started next time
+                with self.lock:
+                    self.workers.remove(worker)
+                raise
+            with self.lock:
+                self.idle.append(worker)
+            return rv
+
+    def close(self):
+        with self.lock:
+            workers, self.workers, self.idle = self.workers, [], []
+        for worker in workers:
+            worker.close()
+
+
+def _emulate(config, sandbox, events, stage, concurrency):
+    """Run a list of events on emulated Lambda containers.
+
+    Invocations are sent to an idle container when one is available, else a
+    new container is started, as Lambda does. No more than ``concurrency``
+    containers are started."""
+    timeout = config['aws'].get('lambda_timeout', 10)
+    idle = []
+    workers = []
+    lock = threading.Lock()
+
+    def invoke(event):
+        with lock:
+            worker = idle.pop() if idle else None
+        cold = worker is None
+        if cold:
+            worker = _EmulatorWorker(sandbox, config)
+            with lock:
+                workers.append(worker)
+        try:
+            rv = worker.invoke(event, _LambdaContext(config, stage, timeout),
+                               timeout)
+        finally:
+            with lock:
+                idle.append(worker)
+        rv.update({'worker': workers.index(worker) + 1, 'cold': cold,
+                   'init': worker.init_duration if cold else None})
+        return rv
+
+    pool = ThreadPool(concurrency)
+    try:
+        return pool.map(invoke, events)
+    finally:
+        pool.terminate()
+        for worker in workers:
+            worker.close()
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * percent / 100.0), len(values) - 1)]
+
+
+def _print_emulator_report(results):
+    for i, rv in enumerate(results):
+        line = 'REPORT #{} Container: {} ({})'.format(
+            i + 1, rv['worker'], 'cold' if rv['cold'] else 'warm')
+        if rv['cold']:
+            line += ' Init Duration: {:.2f} ms'.format(rv['init'])
+        line += ' Duration: {:.2f} ms'.format(rv['duration'])
+        if 'error' in rv:
+            line += ' Error: ' + rv['error']
+        print(line)
+    cold = [rv for rv in results if rv['cold']]
+    warm = [rv for rv in results if not rv['cold']]
+    print('Summary:')
+    print('  Invocations: {} ({} cold, {} warm, {} errors)'.format(
+        len(results), len(cold), len(warm),
+        len([rv for rv in results if 'error' in rv])))
+    if cold:
+        print('  Init duration: avg {:.2f} ms, max {:.2f} ms'.format(
+            sum(rv['init'] for rv in cold) / len(cold),
+            max(rv['init'] for rv in cold)))
+        durations = [rv['duration'] for rv in cold]
+        print('  Cold invocations: avg {:.2f} ms, max {:.2f} ms'.format(
+            sum(durations) / len(durations), max(durations)))
+    if warm:
+        durations = [rv['duration'] for rv in warm]
+        print('  Warm invocations: avg {:.2f} ms, p50 {:.2f} ms, '
+              'p99 {:.2f} ms'.format(
+                  sum(durations) / len(durations),
+                  _percentile(durations, 50), _percentile(durations, 99)))
+
+
+def _load_events(payload):
+    """Load a list of events from a JSON file. The default event invokes a
+    plain function without arguments."""
+    if not payload:
+        return [{'kwargs': {}}]
+    with open(payload) as f:
+        events = json.load(f)
+    if not isinstance(events, list):
+        events = [events]
+    return events
+
+
+@main.command()
+@climax.argument('--concurrency', type=int, default=1,
+                 help='Maximum number of containers. Default is 1.')
+@climax.argument('--count', type=int, default=1,
+                 help='Number of times each event is invoked. Default is 1.')
+@climax.argument('--payload',
+                 help='JSON file with the event, or a list of events, to '
+                      'invoke the function with.')
+@climax.argument('--lambda-package',
+                 help='Lambda zip package to emulate. If not given, a new '
+                      'package is built.')
+@climax.argument('--stage',
+                 help=('Stage to emulate. Defaults to the stage designated '
+                       'as the development stage'))
+def emulate(stage, lambda_package, payload, count, concurrency,
+            config_file):
+    """Run the lambda package on emulated Lambda containers."""
+    config = _load_config(config_file)
+    if stage is None:
+        stage = config['devstage']
+    if stage not in config['stage_environments']:
+        raise ValueError('Invalid stage ' + stage)
+
+    events = _load_events(payload) * count
+
+    built_package = False
+    if lambda_package is None:
+        print("Building lambda package...")
+        lambda_package = _build(config)
+        built_package = True
+    sandbox = tempfile.mkdtemp(prefix='slam-emulate-')
+    try:
+        with zipfile.ZipFile(lambda_package) as z:
+            z.extractall(sandbox)
+        print('Emulating {}:{} with {} invocation(s)...'.format(
+            config['name'], stage, len(events)))
+        results = _emulate(config, sandbox, events, stage, concurrency)
+    finally:
+        shutil.rmtree(sandbox)
+        if built_package:
+            os.remove(lambda_package)
+    _print_emulator_report(results)
+
+
+# Lambda pricing for x86 functions in us-east-1
+_LAMBDA_GB_SECOND_PRICE = 0.0000166667
+_LAMBDA_REQUEST_PRICE = 0.0000002
+
+
+def _parse_lambda_report(log):
+    """Return the durations reported by Lambda in the tail of a log."""
+    report = {}
+    for key, name in [('duration', 'Duration'),
+                      ('billed', 'Billed Duration'),
+                      ('init', 'Init Duration')]:
+        m = re.search(r'(?:^|\t)' + name + r': ([0-9.]+) ms', log, re.M)
+        if m:
+            report[key] = float(m.group(1))
+    return report
+
+
+def _tune_memory_size(lmb, function, version, size, events, invocations,
+                      concurrency):
+    """Invoke a function version concurrently and summarize the durations
+    reported by Lambda."""
+    def invoke(event):
+        rv = lmb.invoke(FunctionName=function, Qualifier=version,
+                        Payload=json.dumps(event), LogType='Tail')
+        log = base64.b64decode(rv.get('LogResult', '')).decode('utf-8')
+        report = _parse_lambda_report(log)
+        report['error'] = 'FunctionError' in rv
+        return report
+
+    pool = ThreadPool(concurrency)
+    try:
+        reports = pool.map(invoke, [events[i % len(events)]
+                                    for i in range(invocations)])
+    finally:
+        pool.terminate()
+    reports = [r for r in reports if 'duration' in r]
+    warm = [r for r in reports if 'init' not in r] or reports
+    result = {'memory': size,
+              'cold': len([r for r in reports if 'init' in r]),
+              'errors': len([r for r in reports if r['error']]),
+              'duration': None, 'billed': None, 'cost': None}
+    if warm:
+        result['duration'] = sum([r['duration'] for r in warm]) / len(warm)
+        result['billed'] = sum([r.get('billed', r['duration'])
+                                for r in warm]) / len(warm)
+        result['cost'] = result['billed'] / 1000.0 * size / 1024.0 * \
+            _LAMBDA_GB_SECOND_PRICE + _LAMBDA_REQUEST_PRICE
+    return result
+
+
+@main.command()
+@climax.argument('--strategy', choices=['cost', 'speed'], default='cost',
+                 help=('Recommend the memory size with the lowest cost or '
+                       'the lowest duration. Default is cost.'))
+@climax.argument('--concurrency', type=int, default=5,
+                 help='Number of concurrent invocations. Default is 5.')
+@climax.argument('--invocations', type=int, default=10,
+                 help='Number of invocations per memory size. Default is 10.')
+@climax.argument('--memory', default='128,256,512,1024,1536,2048,3008',
+                 help=('Comma-separated list of memory sizes to test, in MB. '
+                       'Default is 128,256,512,1024,1536,2048,3008.'))
+@climax.argument('--payload',
+                 help='JSON file with the event, or a list of events, to '
+                      'invoke the function with.')
+@climax.argument('--stage',
+                 help=('Stage to tune. Defaults to the stage designated as '
+                       'the development stage'))
+def tune(stage, payload, memory, invocations, concurrency, strategy,
+         config_file):
+    """Benchmark the lambda function across memory sizes."""
+    config = _load_config(config_file)
+    if stage is None:
+        stage = config['devstage']
+    if stage not in config['stage_environments']:
+        raise ValueError('Invalid stage ' + stage)
+    try:
+        sizes = [int(size) for size in memory.split(',')]
+    except ValueError:
+        raise ValueError('Invalid memory sizes ' + memory)
+    events = _load_events(payload)
+
+    cfn = boto3.client('cloudformation')
+    lmb = boto3.client('lambda')
+    try:
+        stack = cfn.describe_stacks(StackName=config['name'])['Stacks'][0]
+    except botocore.exceptions.ClientError:
+        raise RuntimeError('This project has not been deployed yet.')
+    function = _get_from_stack(stack, 'Output', 'FunctionArn').split(':')[-1]
+    version = _get_from_stack(stack, 'Parameter', stage.title() + 'Version')
+
+    # the temporary versions are published from the latest deployed code
+    latest = lmb.get_function_configuration(FunctionName=function)
+    if version != '$LATEST':
+        current = lmb.get_function_configuration(FunctionName=function,
+                                                 Qualifier=version)
+        if current['CodeSha256'] != latest['CodeSha256']:
+            print('Warning: the {} stage is not running the latest deployed '
+                  'code, which is the code that will be tuned.'.format(stage))
+    variables = (latest.get('Environment') or {}).get('Variables') or {}
+    tune_variables = dict(variables)
+    tune_variables['SLAM_STAGE'] = stage
+
+    waiter = lmb.get_waiter('function_updated')
+    versions = []
+    results = []
+    try:
+        for size in sizes:
+            print('Testing {} MB...'.format(size))
+            lmb.update_function_configuration(
+                FunctionName=function, MemorySize=size,
+                Environment={'Variables': tune_variables})
+            waiter.wait(FunctionName=function)
+            versions.append(lmb.publish_version(
+                FunctionName=function,
+                Description='slam tune {} MB'.format(size))['Version'])
+            results.append(_tune_memory_size(
+                lmb, function, versions[-1], size, events, invocations,
+                concurrency))
+    finally:
+        print('Cleaning up...')
+        lmb.update_function_configuration(
+            FunctionName=function, MemorySize=latest['MemorySize'],
+            Environment={'Variables': variables})
+        waiter.wait(FunctionName=function)
+        for tune_version in versions:
+            lmb.delete_function(FunctionName=function, Qualifier=tune_version)
+
+    print('{:>8}  {:>12}  {:>10}  {:>10}  {:>5}  {:>6}'.format(
+        'Memory', 'Duration', 'Billed', 'Cost/1M', 'Cold', 'Errors'))
+    for result in results:
+        if result['duration'] is None:
+            print('{:>5} MB  {:>12}  {:>10}  {:>10}  {:>5}  {:>6}'.format(
+                result['memory'], '-', '-', '-', result['cold'],
+                result['errors']))
+            continue
+        print('{:>5} MB  {:>9.2f} ms  {:>7.0f} ms  {:>10}  {:>5}  '
+              '{:>6}'.format(result['memory'], result['duration'],
+                             result['billed'],
+                             '${:.2f}'.format(result['cost'] * 1000000),
+                             result['cold'], result['errors']))
+    candidates = [r for r in results
+                  if r['duration'] is not None and not r['errors']]
+    if not candidates:
+        print('No memory size could be tested without errors.')
+        return
+    key = 'cost' if strategy == 'cost' else 'duration'
+    best = min(candidates, key=lambda r: (r[key], r['memory']))
+    print('Recommended memory size for lowest {}: {} MB (currently {} '
+          'MB).'.format(key, best['memory'],
+                        config['aws'].get('lambda_memory', 128)))
+
+
 @main.command()
 def template(config_file):
     """Print the default Cloudformation deployment template."""
@@ -731,6 +1410,10 @@ def register_plugins():
                 init._arguments += plugin.init._arguments
                 init._argnames += plugin.init._argnames
 
+            # add any commands provided by the plugin
+            if hasattr(plugin, 'register_commands'):
+                plugin.register_commands(main)
+
             plugins[ep.name] = plugin
 
 
@@ -31,7 +31,130 @@ dynamodb_tables:
        project: "all"
        read_throughput: 1
        write_throughput: 1
+
+  # a table with on-demand capacity:
+  mytable3:
+    attributes:
+      id: "S"
+    key: "id"
+    billing_mode: "pay_per_request"
+
+  # a table with provisioned capacity and auto scaling:
+  mytable4:
+    attributes:
+      id: "S"
+    key: "id"
+    autoscaling:
+      min_read: 1
+      max_read: 100
+      min_write: 1
+      max_write: 50
+      target_utilization: 70
+
+  # a read-heavy table with a DAX cluster in front (requires the function
+  # to run in a VPC):
+  mytable5:
+    attributes:
+      id: "S"
+    key: "id"
+    dax:
+      node_type: "dax.t3.small"
+      nodes: 1
+      record_ttl: 300000
+      query_ttl: 300000
+
+  # a table that is used with batch operations and transactions:
+  mytable6:
+    attributes:
+      id: "S"
+    key: "id"
+    actions: "batch"
+
+  # a table with expiring items, and a stream that is processed by a function
+  # in the project:
+  mytable7:
+    attributes:
+      id: "S"
+    key: "id"
+    ttl_attribute: "expires_at"
+    stream:
+      view_type: "new_and_old_images"
+      handler: "mymodule:process_changes"
+      batch_size: 100
+      batching_window: 5
+      starting_position: "latest"
+
+  # a table with Contributor Insights enabled, to find its most accessed keys
+  # with "slam dynamodb report --hot-keys":
+  mytable8:
+    attributes:
+      id: "S"
+    key: "id"
+    contributor_insights: true
+
+  # a global table, with replicas in the region of the stack and in the
+  # regions listed:
+  mytable9:
+    attributes:
+      id: "S"
+    key: "id"
+    billing_mode: "pay_per_request"
+    replicas: ["eu-west-1", "ap-southeast-2"]
+
+  # a table with settings that are overridden in the prod stage:
+  mytable10:
+    attributes:
+      id: "S"
+      name: "S"
+    key: "id"
+    read_throughput: 1
+    write_throughput: 1
+    global_secondary_indexes:
+      myindex:
+        key: "name"
+        read_throughput: 1
+        write_throughput: 1
+    stages:
+      prod:
+        read_throughput: 50
+        write_throughput: 20
+        global_secondary_indexes:
+          myindex:
+            read_throughput: 20
+
+  # a single table with users and their orders, with key templates that
+  # generate the slam_entities module:
+  mytable11:
+    attributes:
+      pk: "S"
+      sk: "S"
+    key: ["pk", "sk"]
+    billing_mode: "pay_per_request"
+    entities:
+      user:
+        keys:
+          pk: "USER#{id}"
+          sk: "PROFILE"
+      order:
+        keys:
+          pk: "USER#{user_id}"
+          sk: "ORDER#{date}#{order_id}"
 """
+from __future__ import print_function
+
+import collections
+from datetime import datetime
+import keyword
+import math
+from multiprocessing.pool import ThreadPool
+import os
+import random
+import re
+import string
+import time
+
+import boto3
+import botocore
 import climax
 
 
@@ -55,28 +178,52 @@ def init(config, dynamodb_tables):
     return table_config
 
 
+# IAM action presets for the tables
+ACTION_PRESETS = {
+    'default': ['DeleteItem', 'GetItem', 'PutItem', 'Query', 'Scan',
+                'UpdateItem', 'DescribeTable'],
+    'batch': ['DeleteItem', 'GetItem', 'PutItem', 'Query', 'Scan',
+              'UpdateItem', 'DescribeTable', 'BatchGetItem', 'BatchWriteItem',
+              'ConditionCheckItem'],
+    'read_only': ['GetItem', 'BatchGetItem', 'Query', 'Scan',
+                  'DescribeTable']
+}
+
+
+# stream view types for the tables
+STREAM_VIEW_TYPES = {
+    'keys_only': 'KEYS_ONLY',
+    'new_image': 'NEW_IMAGE',
+    'old_image': 'OLD_IMAGE',
+    'new_and_old_images': 'NEW_AND_OLD_IMAGES'
+}
+
+
+def _get_table_actions(table, name):
+    """Return the IAM actions the function is allowed on a table. These can
+    be given as the name of a preset, or as a list of DynamoDB actions."""
+    actions = table.get('actions') or 'default'
+    if not isinstance(actions, list):
+        if actions not in ACTION_PRESETS:
+            raise ValueError('Invalid actions for table ' + name)
+        actions = ACTION_PRESETS[actions]
+    return [a if a.startswith('dynamodb:') else 'dynamodb:' + a
+            for a in actions]
+
+
 def _get_dynamodb_policies(config):
     if not config.get('dynamodb_tables'):
         return []
-    resources = []
+
+    # tables that have the same actions share a statement
+    statements = collections.OrderedDict()
     for stage in config['stage_environments'].keys():
-        for name, table in config['dynamodb_tables'].items():
-            resources.append(
-                {
-                    'Fn::Join': [
-                        '',
-                        [
-                            'arn:aws:dynamodb:',
-                            {'Ref': 'AWS::Region'},
-                            ':',
-                            {'Ref': 'AWS::AccountId'},
-                            ':table/',
-                            {'Ref': '{}{}DynamoDBTable'.format(
-                                stage.title(), name.title())}
-                        ]
-                    ]
-                }
-            )
+        for name in config['dynamodb_tables'].keys():
+            actions = tuple(_get_table_actions(
+                _get_table_config(config, stage, name), name))
+            statements.setdefault(actions, []).extend([
+                _get_table_arn(stage, name),
+                _get_table_arn(stage, name, '/index/*')])
     policy = {
         'PolicyName': 'DynamoDBPolicy',
         'PolicyDocument': {
@@ -84,17 +231,9 @@ def _get_dynamodb_policies(config):
             'Statement': [
                 {
                     'Effect': 'Allow',
-                    'Action': [
-                        'dynamodb:DeleteItem',
-                        'dynamodb:GetItem',
-                        'dynamodb:PutItem',
-                        'dynamodb:Query',
-                        'dynamodb:Scan',
-                        'dynamodb:UpdateItem',
-                        'dynamodb:DescribeTable'
-                    ],
+                    'Action': list(actions),
                     'Resource': resources
-                }
+                } for actions, resources in statements.items()
             ]
         }
     }
@@ -138,8 +277,263 @@ def _get_dynamodb_projection(project):
     return p
 
 
-def _get_table_resource(config, stage, name):
+def _merge_table_config(base, override):
+    """Merge the settings of a table with overrides, recursing into nested
+    collections such as indexes and auto scaling settings."""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge_table_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _get_table_config(config, stage, name):
+    """Return the settings of a table for a stage, which are the settings of
+    the table with the overrides given for the stage merged in."""
     table = config['dynamodb_tables'][name]
+    overrides = table.get('stages') or {}
+    for override_stage in overrides.keys():
+        if override_stage not in config['stage_environments']:
+            raise ValueError('Table {} has settings for unknown stage '
+                             '{}'.format(name, override_stage))
+    table = _merge_table_config(table, overrides.get(stage) or {})
+    table.pop('stages', None)
+    return table
+
+
+def _get_billing_mode(table, name):
+    billing_mode = table.get('billing_mode', 'provisioned')
+    if billing_mode not in ['provisioned', 'pay_per_request']:
+        raise ValueError('Invalid billing mode for table ' + name)
+    if billing_mode == 'pay_per_request' and table.get('autoscaling'):
+        raise ValueError('Auto scaling cannot be used with the '
+                         'pay_per_request billing mode in table ' + name)
+    return billing_mode
+
+
+def _get_dynamodb_throughput(table, autoscaling):
+    """Return the provisioned throughput of a table or global index. When
+    auto scaling is enabled, the minimum capacities are used as defaults."""
+    autoscaling = autoscaling or {}
+    return {
+        'ReadCapacityUnits': table.get('read_throughput',
+                                       autoscaling.get('min_read', 1)),
+        'WriteCapacityUnits': table.get('write_throughput',
+                                        autoscaling.get('min_write', 1))
+    }
+
+
+def _get_autoscaling_resources(prefix, resource_id, dimension, autoscaling,
+                               depends_on):
+    """Return scalable targets and target tracking policies for the read and
+    write capacity of a table or global index."""
+    res = collections.OrderedDict()
+    for capacity in ['read', 'write']:
+        if 'max_' + capacity not in autoscaling:
+            raise ValueError('Auto scaling for {} needs a max_{} '
+                             'setting'.format(resource_id, capacity))
+        target = prefix + capacity.title() + 'ScalableTarget'
+        res[target] = {
+            'Type': 'AWS::ApplicationAutoScaling::ScalableTarget',
+            'DependsOn': depends_on,
+            'Properties': {
+                'ServiceNamespace': 'dynamodb',
+                'ScalableDimension': 'dynamodb:{}:{}CapacityUnits'.format(
+                    dimension, capacity.title()),
+                'ResourceId': resource_id,
+                'MinCapacity': autoscaling.get('min_' + capacity, 1),
+                'MaxCapacity': autoscaling['max_' + capacity]
+            }
+        }
+        res[prefix + capacity.title() + 'ScalingPolicy'] = {
+            'Type': 'AWS::ApplicationAutoScaling::ScalingPolicy',
+            'Properties': {
+                'PolicyName': '{}-{}-scaling'.format(resource_id, capacity),
+                'PolicyType': 'TargetTrackingScaling',
+                'ScalingTargetId': {'Ref': target},
+                'TargetTrackingScalingPolicyConfiguration': {
+                    'TargetValue': float(
+                        autoscaling.get('target_utilization', 70)),
+                    'PredefinedMetricSpecification': {
+                        'PredefinedMetricType':
+                            'DynamoDB{}CapacityUtilization'.format(
+                                capacity.title())
+                    }
+                }
+            }
+        }
+    return res
+
+
+def _get_table_autoscaling_resources(config, stage, name):
+    """Return the auto scaling resources for a table and its global
+    secondary indexes."""
+    table = _get_table_config(config, stage, name)
+    table_resource = '{}{}DynamoDBTable'.format(stage.title(), name.title())
+    table_name = stage + '.' + name
+    res = collections.OrderedDict()
+    if _get_billing_mode(table, name) == 'pay_per_request' or \
+            table.get('replicas'):
+        # global tables manage their own auto scaling
+        return res
+    if table.get('autoscaling'):
+        res.update(_get_autoscaling_resources(
+            table_resource, 'table/' + table_name, 'table',
+            table['autoscaling'], table_resource))
+    for index_name, index in (table.get('global_secondary_indexes') or
+                              {}).items():
+        autoscaling = index.get('autoscaling', table.get('autoscaling'))
+        if autoscaling:
+            res.update(_get_autoscaling_resources(
+                table_resource + index_name.title() + 'Index',
+                'table/{}/index/{}'.format(table_name, index_name), 'index',
+                autoscaling, table_resource))
+    return res
+
+
+def _get_stream(table, name):
+    """Return the stream settings of a table, or None if the table does not
+    have a stream. The stream can be given as a view type, as ``true`` to use
+    the default view type, or as a collection of settings."""
+    stream = table.get('stream')
+    if not stream:
+        return None
+    if not isinstance(stream, dict):
+        stream = {'view_type': stream} if stream is not True else {}
+    stream = dict(stream)
+    stream.setdefault('view_type', 'new_and_old_images')
+    if stream['view_type'] not in STREAM_VIEW_TYPES:
+        raise ValueError('Invalid stream view type for table ' + name)
+    stream.setdefault('starting_position', 'latest')
+    if stream['starting_position'] not in ['latest', 'trim_horizon']:
+        raise ValueError('Invalid stream starting position for table ' + name)
+    return stream
+
+
+def _get_stream_tables(config):
+    """Return the stage and name of the tables that have streams processed by
+    the function."""
+    return [(stage, name) for stage in config['stage_environments'].keys()
+            for name in (config.get('dynamodb_tables') or {}).keys()
+            if (_get_stream(_get_table_config(config, stage, name),
+                            name) or {}).get('handler')]
+
+
+def _get_stream_resources(config):
+    """Return the event source mappings that send the records of the table
+    streams to the function, for each stage."""
+    res = collections.OrderedDict()
+    for stage, name in _get_stream_tables(config):
+        stream = _get_stream(_get_table_config(config, stage, name), name)
+        res['{}{}StreamEventSourceMapping'.format(
+            stage.title(), name.title())] = {
+                'Type': 'AWS::Lambda::EventSourceMapping',
+                'DependsOn': 'FunctionExecutionRole',
+                'Properties': {
+                    'EventSourceArn': {'Fn::GetAtt': [
+                        '{}{}DynamoDBTable'.format(stage.title(),
+                                                   name.title()),
+                        'StreamArn']},
+                    'FunctionName': {
+                        'Ref': stage.title() + 'FunctionAlias'},
+                    'BatchSize': stream.get('batch_size', 100),
+                    'MaximumBatchingWindowInSeconds': stream.get(
+                        'batching_window', 0),
+                    'StartingPosition':
+                        stream['starting_position'].upper()
+                }
+            }
+    return res
+
+
+def _get_global_table_capacity(capacity, throughput, autoscaling, name):
+    """Return the read or write capacity settings of a global table or index.
+    Global tables need auto scaling for the write capacity, so a fixed write
+    capacity is given as auto scaling with equal minimum and maximum."""
+    if autoscaling:
+        if 'max_' + capacity not in autoscaling:
+            raise ValueError('Auto scaling for table {} needs a max_{} '
+                             'setting'.format(name, capacity))
+        minimum = autoscaling.get('min_' + capacity, 1)
+        maximum = autoscaling['max_' + capacity]
+        target = float(autoscaling.get('target_utilization', 70))
+    elif capacity == 'read':
+        return {'ReadCapacityUnits': throughput['ReadCapacityUnits']}
+    else:
+        minimum = maximum = throughput['WriteCapacityUnits']
+        target = 70.0
+    return {
+        capacity.title() + 'CapacityAutoScalingSettings': {
+            'MinCapacity': minimum,
+            'MaxCapacity': maximum,
+            'TargetTrackingScalingPolicyConfiguration': {
+                'TargetValue': target
+            }
+        }
+    }
+
+
+def _get_global_table_resource(table, name, properties):
+    """Return a global table resource with replicas in the stack's region and
+    in the regions listed for the table, given the properties of the
+    equivalent single-region table."""
+    if not isinstance(table['replicas'], list):
+        raise ValueError('The replicas of table {} must be given as a list '
+                         'of regions'.format(name))
+    props = dict(properties)
+    autoscaling = table.get('autoscaling')
+    throughput = props.pop('ProvisionedThroughput', None)
+    contributor_insights = props.pop('ContributorInsightsSpecification', None)
+    if 'StreamSpecification' not in props:
+        props['StreamSpecification'] = {
+            'StreamViewType': 'NEW_AND_OLD_IMAGES'}
+    elif props['StreamSpecification']['StreamViewType'] != \
+            'NEW_AND_OLD_IMAGES':
+        raise ValueError('Table {} has replicas, so its stream must use the '
+                         'new_and_old_images view type'.format(name))
+    replica = {}
+    if throughput is not None:
+        props['BillingMode'] = 'PROVISIONED'
+        props['WriteProvisionedThroughputSettings'] = \
+            _get_global_table_capacity('write', throughput, autoscaling, name)
+        replica['ReadProvisionedThroughputSettings'] = \
+            _get_global_table_capacity('read', throughput, autoscaling, name)
+    if contributor_insights:
+        replica['ContributorInsightsSpecification'] = contributor_insights
+    replica_indexes = []
+    for idx in props.get('GlobalSecondaryIndexes', []):
+        index = table['global_secondary_indexes'][idx['IndexName']]
+        index_autoscaling = index.get('autoscaling', autoscaling)
+        index_throughput = idx.pop('ProvisionedThroughput', None)
+        replica_index = {'IndexName': idx['IndexName']}
+        if index_throughput is not None:
+            idx['WriteProvisionedThroughputSettings'] = \
+                _get_global_table_capacity('write', index_throughput,
+                                           index_autoscaling, name)
+            replica_index['ReadProvisionedThroughputSettings'] = \
+                _get_global_table_capacity('read', index_throughput,
+                                           index_autoscaling, name)
+        if 'ContributorInsightsSpecification' in idx:
+            replica_index['ContributorInsightsSpecification'] = idx.pop(
+                'ContributorInsightsSpecification')
+        if len(replica_index) > 1:
+            replica_indexes.append(replica_index)
+    if replica_indexes:
+        replica['GlobalSecondaryIndexes'] = replica_indexes
+    props['Replicas'] = [dict(replica, Region=region) for region in
+                         [{'Ref': 'AWS::Region'}] + table['replicas']]
+    return {
+        'Type': 'AWS::DynamoDB::GlobalTable',
+        'Properties': props
+    }
+
+
+def _get_table_resource(config, stage, name, global_table=True):
+    """Return the resource for a table. Tables that have replicas are
+    returned as global tables, unless global_table is set to False."""
+    table = _get_table_config(config, stage, name)
     attributes = []
     for attr, attr_type in table['attributes'].items():
         attributes.append(
@@ -148,25 +542,37 @@ def _get_table_resource(config, stage, name):
                 'AttributeType': attr_type
             }
         )
-    read_units = table.get('read_throughput', 1)
-    write_units = table.get('write_throughput', 1)
+    on_demand = _get_billing_mode(table, name) == 'pay_per_request'
     res = {
         'Type': 'AWS::DynamoDB::Table',
         'Properties': {
             'TableName': stage + '.' + name,
             'AttributeDefinitions': attributes,
-            'KeySchema': _get_dynamodb_key_schema(table['key']),
-            'ProvisionedThroughput': {
-                'ReadCapacityUnits': read_units,
-                'WriteCapacityUnits': write_units
-            }
+            'KeySchema': _get_dynamodb_key_schema(table['key'])
         }
     }
+    if on_demand:
+        res['Properties']['BillingMode'] = 'PAY_PER_REQUEST'
+    else:
+        res['Properties']['ProvisionedThroughput'] = \
+            _get_dynamodb_throughput(table, table.get('autoscaling'))
+    stream = _get_stream(table, name)
+    if stream:
+        res['Properties']['StreamSpecification'] = {
+            'StreamViewType': STREAM_VIEW_TYPES[stream['view_type']]}
+    if table.get('contributor_insights'):
+        res['Properties']['ContributorInsightsSpecification'] = {
+            'Enabled': True}
+    if table.get('ttl_attribute'):
+        res['Properties']['TimeToLiveSpecification'] = {
+            'AttributeName': table['ttl_attribute'],
+            'Enabled': True
+        }
     if table.get('local_secondary_indexes'):
         idxs = []
-        for name, index in table['local_secondary_indexes'].items():
+        for index_name, index in table['local_secondary_indexes'].items():
             idx = {
-                'IndexName': name,
+                'IndexName': index_name,
                 'KeySchema': _get_dynamodb_key_schema(index['key']),
                 'Projection': _get_dynamodb_projection(index.get('project'))
             }
@@ -174,30 +580,961 @@ def _get_table_resource(config, stage, name):
         res['Properties']['LocalSecondaryIndexes'] = idxs
     if table.get('global_secondary_indexes'):
         idxs = []
-        for name, index in table['global_secondary_indexes'].items():
-            read_units = index.get('read_throughput', 1)
-            write_units = index.get('write_throughput', 1)
+        for index_name, index in table['global_secondary_indexes'].items():
             idx = {
-                'IndexName': name,
+                'IndexName': index_name,
                 'KeySchema': _get_dynamodb_key_schema(index['key']),
                 'Projection': _get_dynamodb_projection(
-                    index.get('project')),
-                'ProvisionedThroughput': {
-                    'ReadCapacityUnits': read_units,
-                    'WriteCapacityUnits': write_units
-                }
+                    index.get('project'))
             }
+            if not on_demand:
+                idx['ProvisionedThroughput'] = _get_dynamodb_throughput(
+                    index, index.get('autoscaling', table.get('autoscaling')))
+            if table.get('contributor_insights'):
+                idx['ContributorInsightsSpecification'] = {'Enabled': True}
             idxs.append(idx)
         res['Properties']['GlobalSecondaryIndexes'] = idxs
+    if global_table and table.get('replicas'):
+        res = _get_global_table_resource(table, name, res['Properties'])
     return res
 
 
+def _get_table_arn(stage, name, suffix=''):
+    return {
+        'Fn::Join': [
+            '',
+            [
+                'arn:aws:dynamodb:',
+                {'Ref': 'AWS::Region'},
+                ':',
+                {'Ref': 'AWS::AccountId'},
+                ':table/',
+                {'Ref': '{}{}DynamoDBTable'.format(stage.title(),
+                                                   name.title())},
+                suffix
+            ]
+        ]
+    }
+
+
+def _get_stream_policies(config):
+    tables = _get_stream_tables(config)
+    if not tables:
+        return []
+    return [{
+        'PolicyName': 'DynamoDBStreamPolicy',
+        'PolicyDocument': {
+            'Version': '2012-10-17',
+            'Statement': [
+                {
+                    'Effect': 'Allow',
+                    'Action': [
+                        'dynamodb:DescribeStream',
+                        'dynamodb:GetRecords',
+                        'dynamodb:GetShardIterator',
+                        'dynamodb:ListStreams'
+                    ],
+                    'Resource': [
+                        _get_table_arn(stage, name, '/stream/*')
+                        for stage, name in tables]
+                }
+            ]
+        }
+    }]
+
+
+def _get_dax_tables(config):
+    """Return the stage and name of the tables that have a DAX cluster."""
+    return [(stage, name) for stage in config['stage_environments'].keys()
+            for name in (config.get('dynamodb_tables') or {}).keys()
+            if _get_table_config(config, stage, name).get('dax')]
+
+
+def _get_dax_endpoint_variable(name):
+    """Return the name of the environment variable with the DAX endpoint for
+    a table."""
+    return 'DAX_ENDPOINT_' + re.sub('[^A-Z0-9]', '_', name.upper())
+
+
+def _get_dax_resources(config):
+    """Return DAX clusters for the tables that request them, along with the
+    subnet group, parameter groups and IAM role that they need."""
+    res = collections.OrderedDict()
+    tables = _get_dax_tables(config)
+    if not tables:
+        return res
+    if not config['aws'].get('lambda_subnet_ids'):
+        raise ValueError('DAX clusters require the lambda function to run '
+                         'in a VPC. Please configure lambda_subnet_ids and '
+                         'lambda_security_groups.')
+    res['DaxServiceRole'] = {
+        'Type': 'AWS::IAM::Role',
+        'Properties': {
+            'AssumeRolePolicyDocument': {
+                'Version': '2012-10-17',
+                'Statement': [
+                    {
+                        'Effect': 'Allow',
+                        'Principal': {
+                            'Service': ['dax.amazonaws.com']
+                        },
+                        'Action': 'sts:AssumeRole'
+                    }
+                ]
+            },
+            'Policies': [
+                {
+                    'PolicyName': 'DaxDynamoDBPolicy',
+                    'PolicyDocument': {
+                        'Version': '2012-10-17',
+                        'Statement': [
+                            {
+                                'Effect': 'Allow',
+                                'Action': ['dynamodb:*'],
+                                'Resource': [
+                                    _get_table_arn(stage, name, suffix)
+                                    for stage, name in tables
+                                    for suffix in ['', '/index/*']]
+                            }
+                        ]
+                    }
+                }
+            ]
+        }
+    }
+    res['DaxSubnetGroup'] = {
+        'Type': 'AWS::DAX::SubnetGroup',
+        'Properties': {
+            'Description': 'Subnets for the {} DAX clusters.'.format(
+                config['name']),
+            'SubnetIds': config['aws']['lambda_subnet_ids']
+        }
+    }
+    for stage, name in tables:
+        dax = _get_table_config(config, stage, name)['dax']
+        if not isinstance(dax, dict):
+            dax = {}
+        prefix = stage.title() + name.title()
+        res[prefix + 'DaxParameterGroup'] = {
+            'Type': 'AWS::DAX::ParameterGroup',
+            'Properties': {
+                'Description': 'DAX parameters for the {}.{} table.'.format(
+                    stage, name),
+                'ParameterNameValues': {
+                    'record-ttl-millis': str(dax.get('record_ttl', 300000)),
+                    'query-ttl-millis': str(dax.get('query_ttl', 300000))
+                }
+            }
+        }
+        res[prefix + 'DaxCluster'] = {
+            'Type': 'AWS::DAX::Cluster',
+            'DependsOn': prefix + 'DynamoDBTable',
+            'Properties': {
+                'Description': 'DAX cluster for the {}.{} table.'.format(
+                    stage, name),
+                'NodeType': dax.get('node_type', 'dax.t3.small'),
+                'ReplicationFactor': dax.get('nodes', 1),
+                'IAMRoleARN': {'Fn::GetAtt': ['DaxServiceRole', 'Arn']},
+                'SubnetGroupName': {'Ref': 'DaxSubnetGroup'},
+                'ParameterGroupName': {'Ref': prefix + 'DaxParameterGroup'},
+                'SecurityGroupIds':
+                    config['aws'].get('lambda_security_groups') or [],
+                'SSESpecification': {'SSEEnabled': True}
+            }
+        }
+    return res
+
+
+def _get_dax_policies(config):
+    tables = _get_dax_tables(config)
+    if not tables:
+        return []
+    clusters = [{'Fn::GetAtt': [
+        '{}{}DaxCluster'.format(stage.title(), name.title()), 'Arn']}
+        for stage, name in tables]
+    return [{
+        'PolicyName': 'DaxPolicy',
+        'PolicyDocument': {
+            'Version': '2012-10-17',
+            'Statement': [
+                {
+                    'Effect': 'Allow',
+                    'Action': [
+                        'dax:BatchGetItem',
+                        'dax:BatchWriteItem',
+                        'dax:ConditionCheckItem',
+                        'dax:DeleteItem',
+                        'dax:GetItem',
+                        'dax:PutItem',
+                        'dax:Query',
+                        'dax:Scan',
+                        'dax:UpdateItem'
+                    ],
+                    'Resource': clusters
+                }
+            ]
+        }
+    }]
+
+
+def _get_dax_environment(config):
+    """Return the function environment variables with the DAX endpoints.
+
+    The handler exposes the variables that start with "SLAM_<STAGE>__" to
+    the function without the prefix, so each stage sees its own endpoints
+    under the same variable names.
+    """
+    variables = collections.OrderedDict()
+    for stage, name in _get_dax_tables(config):
+        variables['SLAM_{}__{}'.format(
+            stage.upper(), _get_dax_endpoint_variable(name))] = {
+                'Fn::GetAtt': ['{}{}DaxCluster'.format(stage.title(),
+                                                       name.title()),
+                               'ClusterDiscoveryEndpointURL']}
+    return variables
+
+
 def cfn_template(config, template):
     res = template['Resources']
     for stage in config['stage_environments'].keys():
         for name, table in config.get('dynamodb_tables', {}).items():
             res['{}{}DynamoDBTable'.format(stage.title(), name.title())] = \
                 _get_table_resource(config, stage, name)
+            res.update(_get_table_autoscaling_resources(config, stage, name))
+    res.update(_get_stream_resources(config))
+    res.update(_get_dax_resources(config))
     res['FunctionExecutionRole']['Properties']['Policies'].extend(
         _get_dynamodb_policies(config))
+    res['FunctionExecutionRole']['Properties']['Policies'].extend(
+        _get_stream_policies(config))
+    res['FunctionExecutionRole']['Properties']['Policies'].extend(
+        _get_dax_policies(config))
+    variables = _get_dax_environment(config)
+    if variables:
+        res['Function']['Properties'].setdefault(
+            'Environment', {'Variables': {}})['Variables'].update(variables)
     return template
+
+
+# names used by the parameters of the generated entity methods, which cannot
+# be used as fields in key templates
+RESERVED_FIELDS = ['cls', 'attributes', 'consistent_read', 'limit',
+                   'ascending']
+
+
+def _get_text_literal(text):
+    """Return a unicode string literal that is valid in Python 2 and 3."""
+    literal = repr(u'' + text)
+    if not literal.startswith('u'):
+        literal = 'u' + literal
+    return literal
+
+
+def _compile_key_template(template, attr_type, entity):
+    """Parse the template of a key attribute, such as "USER#{id}", into a
+    list of literal text and field name pairs."""
+    error = 'Invalid key template "{}" in entity {}'.format(template, entity)
+    try:
+        parsed = list(string.Formatter().parse(template))
+    except ValueError:
+        raise ValueError(error)
+    if not parsed:
+        raise ValueError(error)
+    parts = []
+    for literal, field, spec, conversion in parsed:
+        if field is not None and (
+                spec or conversion or keyword.iskeyword(field) or
+                field in RESERVED_FIELDS or
+                not re.match('^[A-Za-z_][A-Za-z0-9_]*$', field)):
+            raise ValueError(error)
+        parts.append((literal, field))
+    if attr_type == 'N' and (len(parts) != 1 or parts[0][0] or
+                             parts[0][1] is None):
+        raise ValueError('The key template "{}" in entity {} must be a '
+                         'single field, as its attribute is a number'.format(
+                             template, entity))
+    return parts
+
+
+def _get_key_expression(parts, attr_type, field_format='{}'):
+    """Return the Python expression that builds the value of a key attribute
+    from its fields."""
+    if attr_type == 'N':
+        return field_format.format(parts[0][1])
+    terms = []
+    for literal, field in parts:
+        if literal:
+            terms.append(_get_text_literal(literal))
+        if field is not None:
+            terms.append('_text({})'.format(field_format.format(field)))
+    return ' + '.join(terms) or "u''"
+
+
+def _get_fields(*parts_lists):
+    """Return the names of the fields used by key templates, in order of
+    appearance."""
+    fields = []
+    for parts in parts_lists:
+        for literal, field in parts:
+            if field is not None and field not in fields:
+                fields.append(field)
+    return fields
+
+
+def _get_entities(config):
+    """Return the entities declared in the tables, with their key templates
+    compiled into the expressions and access patterns used by the generated
+    module."""
+    entities = []
+    for table_name in sorted((config.get('dynamodb_tables') or {}).keys()):
+        table = config['dynamodb_tables'][table_name]
+        key_schemas = [(None, table['key'])]
+        for kind in ['local_secondary_indexes', 'global_secondary_indexes']:
+            for index_name in sorted((table.get(kind) or {}).keys()):
+                key_schemas.append((index_name,
+                                    table[kind][index_name]['key']))
+        key_schemas = [(index_name, [k['AttributeName'] for k in
+                                     _get_dynamodb_key_schema(key)])
+                       for index_name, key in key_schemas]
+        key_attrs = set(attr for index_name, attrs in key_schemas
+                        for attr in attrs)
+        for name in sorted((table.get('entities') or {}).keys()):
+            templates = table['entities'][name].get('keys') or {}
+            parts = {}
+            for attr, template in templates.items():
+                if attr not in key_attrs:
+                    raise ValueError('Entity {} has a template for {}, which '
+                                     'is not a key attribute of table '
+                                     '{}'.format(name, attr, table_name))
+                parts[attr] = _compile_key_template(
+                    template, table['attributes'][attr], name)
+            primary_key = key_schemas[0][1]
+            for attr in primary_key:
+                if attr not in parts:
+                    raise ValueError('Entity {} needs a template for the {} '
+                                     'key attribute'.format(name, attr))
+            class_name = ''.join(word.title() for word in
+                                 re.split('[^A-Za-z0-9]+', name))
+            if not re.match('^[A-Za-z][A-Za-z0-9]*$', class_name):
+                raise ValueError('Invalid entity name {}'.format(name))
+            entity = {
+                'name': name,
+                'table': table_name,
+                'class_name': class_name,
+                'key_fields': _get_fields(*[parts[attr]
+                                            for attr in primary_key]),
+                'primary_key': [
+                    (attr, _get_key_expression(parts[attr],
+                                               table['attributes'][attr]))
+                    for attr in primary_key],
+                'keys': [],
+                'queries': []
+            }
+            for attr in sorted(parts.keys()):
+                entity['keys'].append({
+                    'attr': attr,
+                    'fields': _get_fields(parts[attr]),
+                    'primary': attr in primary_key,
+                    'expression': _get_key_expression(
+                        parts[attr], table['attributes'][attr],
+                        "attributes['{}']")})
+            for index_name, attrs in key_schemas:
+                if attrs[0] not in parts or (index_name is None and
+                                             len(attrs) == 1):
+                    # the entity cannot be queried on this key, or the
+                    # query would return a single item
+                    continue
+                query = {
+                    'method': 'query' if index_name is None else
+                    'query_' + re.sub('[^a-z0-9]+', '_', index_name.lower()),
+                    'index': index_name,
+                    'hash_attr': attrs[0],
+                    'hash_fields': _get_fields(parts[attrs[0]]),
+                    'hash_expression': _get_key_expression(
+                        parts[attrs[0]], table['attributes'][attrs[0]]),
+                    'range_attr': None,
+                    'range_fields': []
+                }
+                if len(attrs) > 1 and attrs[1] in parts and \
+                        table['attributes'][attrs[1]] != 'N':
+                    query['range_attr'] = attrs[1]
+                    query['range_parts'] = '({},)'.format(', '.join(
+                        '({}, {!r})'.format(_get_text_literal(literal or ''),
+                                            str(field) if field else None)
+                        for literal, field in parts[attrs[1]]))
+                    query['range_fields'] = [
+                        field for field in _get_fields(parts[attrs[1]])
+                        if field not in query['hash_fields']]
+                entity['queries'].append(query)
+            entities.append(entity)
+    return entities
+
+
+def build(config):
+    """Add the DynamoDB runtime helpers to the lambda package, as the
+    slam_dynamodb module. When the tables declare entities, a slam_entities
+    module with their key builders and access helpers is also added."""
+    if not config.get('dynamodb_tables'):
+        return []
+    with open(os.path.join(os.path.dirname(__file__),
+                           'dynamodb_runtime.py')) as f:
+        source = f.read()
+    tables = sorted(config['dynamodb_tables'].keys())
+    source = source.replace('\nTABLES = None\n',
+                            '\nTABLES = {!r}\n'.format(tables))
+    output = '.slam/slam_dynamodb.py'
+    with open(output, 'wt') as f:
+        f.write(source)
+    files = [output]
+
+    entities = _get_entities(config)
+    if entities:
+        from ..helpers import render_template
+        with open(os.path.join(os.path.dirname(__file__), '..',
+                               'templates/entities.py.template')) as f:
+            template = f.read()
+        output = '.slam/slam_entities.py'
+        with open(output, 'wt') as f:
+            f.write(render_template(template, entities=entities,
+                                    literal=repr) + '\n')
+        files.append(output)
+    return files
+
+
+def _get_create_table_args(config, stage, name):
+    """Return the arguments to the CreateTable API call for a table, based on
+    its CloudFormation resource."""
+    args = dict(_get_table_resource(config, stage, name,
+                                    global_table=False)['Properties'])
+    args.pop('TimeToLiveSpecification', None)
+    args.pop('ContributorInsightsSpecification', None)
+    for index in args.get('GlobalSecondaryIndexes', []):
+        index.pop('ContributorInsightsSpecification', None)
+    if 'StreamSpecification' in args:
+        args['StreamSpecification'] = dict(args['StreamSpecification'],
+                                           StreamEnabled=True)
+    return args
+
+
+def _start_local_server(client, endpoint):  # pragma: no cover
+    """Start DynamoDB Local in a Docker container, and wait until it accepts
+    requests."""
+    from ..cli import _run_command
+    port = endpoint.rstrip('/').rsplit(':', 1)[-1]
+    if not port.isdigit():
+        port = '8000'
+    _run_command('docker run -d --rm -p {}:8000 amazon/dynamodb-local'.format(
+        port))
+    for i in range(30):
+        try:
+            client.list_tables()
+            return
+        except botocore.exceptions.EndpointConnectionError:
+            time.sleep(1)
+    raise RuntimeError('DynamoDB Local did not start.')
+
+
+def _create_local_tables(config, client, stage, recreate=False):
+    """Create the tables of a stage in a DynamoDB server. Tables that already
+    exist are left alone, unless recreate is set."""
+    existing = client.list_tables().get('TableNames', [])
+    for name in sorted((config.get('dynamodb_tables') or {}).keys()):
+        args = _get_create_table_args(config, stage, name)
+        table_name = args['TableName']
+        if table_name in existing:
+            if not recreate:
+                print('Table {} already exists.'.format(table_name))
+                continue
+            client.delete_table(TableName=table_name)
+            client.get_waiter('table_not_exists').wait(TableName=table_name)
+        client.create_table(**args)
+        ttl_attribute = _get_table_config(config, stage, name).get(
+            'ttl_attribute')
+        if ttl_attribute:
+            client.get_waiter('table_exists').wait(TableName=table_name)
+            client.update_time_to_live(
+                TableName=table_name,
+                TimeToLiveSpecification={'AttributeName': ttl_attribute,
+                                         'Enabled': True})
+        print('Table {} created.'.format(table_name))
+
+
+def _random_value(attr_type):
+    if attr_type == 'N':
+        return {'N': str(random.randint(0, 10 ** 9))}
+    elif attr_type == 'B':
+        return {'B': os.urandom(12)}
+    elif attr_type == 'BOOL':
+        return {'BOOL': random.choice([True, False])}
+    return {'S': ''.join(random.choice(string.ascii_lowercase + string.digits)
+                         for i in range(12))}
+
+
+def _get_bench_items(table, count):
+    """Generate random items with values for all the attributes declared for
+    a table. The hash keys of composite keys and of global secondary indexes
+    take their values from a smaller pool, so that queries on them return
+    several items."""
+    key_attrs = [k['AttributeName']
+                 for k in _get_dynamodb_key_schema(table['key'])]
+    grouped = set(key_attrs[:1]) if len(key_attrs) > 1 else set()
+    for index in (table.get('global_secondary_indexes') or {}).values():
+        attr = _get_dynamodb_key_schema(index['key'])[0]['AttributeName']
+        if attr != key_attrs[0]:
+            grouped.add(attr)
+    pools = {attr: [_random_value(table['attributes'][attr])
+                    for i in range(max(1, count // 10))]
+             for attr in grouped}
+    items = []
+    for i in range(count):
+        item = {}
+        for attr, attr_type in table['attributes'].items():
+            if attr in pools:
+                item[attr] = random.choice(pools[attr])
+            else:
+                item[attr] = _random_value(attr_type)
+        items.append(item)
+    return items
+
+
+def _run_bench_operation(operation, calls, concurrency):
+    """Run a list of API calls concurrently. Return the number of calls, the
+    errors, the total time and the latency of each call."""
+    def run(call):
+        start = time.time()
+        try:
+            call()
+        except botocore.exceptions.ClientError:
+            return None
+        return (time.time() - start) * 1000
+
+    pool = ThreadPool(concurrency)
+    try:
+        start = time.time()
+        latencies = pool.map(run, calls)
+        elapsed = time.time() - start
+    finally:
+        pool.terminate()
+    return {'operation': operation, 'count': len(calls),
+            'errors': len([t for t in latencies if t is None]),
+            'elapsed': elapsed,
+            'latencies': [t for t in latencies if t is not None]}
+
+
+def _bench_table(config, client, stage, name, count, concurrency):
+    """Write random items to a table, and then read them back with each of
+    the access patterns supported by the table and its indexes."""
+    table = _get_table_config(config, stage, name)
+    table_name = stage + '.' + name
+    key_schema = _get_dynamodb_key_schema(table['key'])
+    key_attrs = [k['AttributeName'] for k in key_schema]
+    items = _get_bench_items(table, count)
+
+    def call(method, **kwargs):
+        return lambda: getattr(client, method)(TableName=table_name, **kwargs)
+
+    def query(index_name, attr, item):
+        kwargs = {'KeyConditionExpression': '#k = :v',
+                  'ExpressionAttributeNames': {'#k': attr},
+                  'ExpressionAttributeValues': {':v': item[attr]}}
+        if index_name:
+            kwargs['IndexName'] = index_name
+        return call('query', **kwargs)
+
+    results = [_run_bench_operation(
+        'PutItem', [call('put_item', Item=item) for item in items],
+        concurrency)]
+    results.append(_run_bench_operation(
+        'GetItem', [call('get_item',
+                         Key={k: v for k, v in random.choice(items).items()
+                              if k in key_attrs})
+                    for i in range(count)], concurrency))
+    if len(key_schema) > 1:
+        results.append(_run_bench_operation(
+            'Query', [query(None, key_attrs[0], random.choice(items))
+                      for i in range(count)], concurrency))
+    indexes = list((table.get('local_secondary_indexes') or {}).items()) + \
+        list((table.get('global_secondary_indexes') or {}).items())
+    for index_name, index in sorted(indexes, key=lambda index: index[0]):
+        attr = _get_dynamodb_key_schema(index['key'])[0]['AttributeName']
+        results.append(_run_bench_operation(
+            'Query ' + index_name, [query(index_name, attr,
+                                          random.choice(items))
+                                    for i in range(count)], concurrency))
+    return results
+
+
+def _print_bench_report(table_name, results):
+    from ..cli import _percentile
+    print('Table ' + table_name)
+    print('  {:<24}{:>8}{:>8}{:>10}{:>11}{:>11}{:>11}'.format(
+        'Operation', 'Count', 'Errors', 'Ops/s', 'Avg', 'p50', 'p99'))
+    for rv in results:
+        latencies = rv['latencies']
+        print('  {:<24}{:>8}{:>8}{:>10.1f}{:>8.2f} ms{:>8.2f} ms'
+              '{:>8.2f} ms'.format(
+                  rv['operation'], rv['count'], rv['errors'],
+                  rv['count'] / rv['elapsed'] if rv['elapsed'] else 0.0,
+                  sum(latencies) / len(latencies) if latencies else 0.0,
+                  _percentile(latencies, 50), _percentile(latencies, 99)))
+
+
+@climax.argument('--recreate', action='store_true',
+                 help='Delete and create again any tables that exist.')
+@climax.argument('--docker', action='store_true',
+                 help='Start DynamoDB Local in a Docker container.')
+@climax.argument('--stage',
+                 help=('Stage of the tables to create. Defaults to the '
+                       'development stage.'))
+@climax.argument('--endpoint', default='http://localhost:8000',
+                 help=('The URL of the local DynamoDB server. Defaults to '
+                       'http://localhost:8000.'))
+def local(endpoint, stage, docker, recreate, config_file):
+    """Create the tables in a local DynamoDB server."""
+    from ..cli import _load_config
+    config = _load_config(config_file)
+    stage = stage or config['devstage']
+    client = boto3.client('dynamodb', endpoint_url=endpoint)
+    if docker:  # pragma: no cover
+        _start_local_server(client, endpoint)
+    _create_local_tables(config, client, stage, recreate=recreate)
+
+
+@climax.argument('--concurrency', type=int, default=8,
+                 help='The number of requests that run at the same time.')
+@climax.argument('--items', type=int, default=1000,
+                 help='The number of items to write to each table.')
+@climax.argument('--table',
+                 help='The table to benchmark. Defaults to all the tables.')
+@climax.argument('--stage',
+                 help=('Stage of the tables to benchmark. Defaults to the '
+                       'development stage.'))
+@climax.argument('--endpoint', default='http://localhost:8000',
+                 help=('The URL of the DynamoDB server. Defaults to '
+                       'http://localhost:8000.'))
+def bench(endpoint, stage, table, items, concurrency, config_file):
+    """Run a load test on the tables."""
+    from ..cli import _load_config
+    config = _load_config(config_file)
+    stage = stage or config['devstage']
+    tables = sorted((config.get('dynamodb_tables') or {}).keys())
+    if table:
+        if table not in tables:
+            raise ValueError('Table {} is not defined.'.format(table))
+        tables = [table]
+    client = boto3.client('dynamodb', endpoint_url=endpoint)
+    for name in tables:
+        results = _bench_table(config, client, stage, name, items,
+                               concurrency)
+        _print_bench_report(stage + '.' + name, results)
+
+
+# DynamoDB prices in the us-east-1 region, per capacity unit-hour for
+# provisioned capacity, and per request unit for on-demand capacity
+PROVISIONED_READ_PRICE = 0.00013
+PROVISIONED_WRITE_PRICE = 0.00065
+ON_DEMAND_READ_PRICE = 0.25 / 1000000
+ON_DEMAND_WRITE_PRICE = 1.25 / 1000000
+
+# utilization of the provisioned capacity that the suggestions aim for
+TARGET_UTILIZATION = 0.7
+
+# share of the requests received by a single partition key that is reported
+# as a hot key
+HOT_KEY_SHARE = 0.1
+
+CAPACITY_METRICS = [
+    ('read', 'ConsumedReadCapacityUnits'),
+    ('write', 'ConsumedWriteCapacityUnits'),
+    ('read_throttles', 'ReadThrottleEvents'),
+    ('write_throttles', 'WriteThrottleEvents')
+]
+
+
+def _get_capacity_targets(config, stage):
+    """Return the tables and global secondary indexes of a stage, with the
+    configuration settings that define their capacity."""
+    targets = []
+    for name in sorted((config.get('dynamodb_tables') or {}).keys()):
+        table = _get_table_config(config, stage, name)
+        on_demand = _get_billing_mode(table, name) == 'pay_per_request'
+        targets.append({
+            'name': name, 'table_name': stage + '.' + name, 'index': None,
+            'on_demand': on_demand,
+            'autoscaling': table.get('autoscaling'),
+            'throughput': None if on_demand else _get_dynamodb_throughput(
+                table, table.get('autoscaling'))})
+        for index_name in sorted((table.get('global_secondary_indexes') or
+                                  {}).keys()):
+            index = table['global_secondary_indexes'][index_name]
+            autoscaling = index.get('autoscaling', table.get('autoscaling'))
+            targets.append({
+                'name': name, 'table_name': stage + '.' + name,
+                'index': index_name, 'on_demand': on_demand,
+                'autoscaling': autoscaling,
+                'throughput': None if on_demand else
+                _get_dynamodb_throughput(index, autoscaling)})
+    return targets
+
+
+def _get_metrics_resolution(start, end):
+    """Return the resolution of the metrics for a time range, in seconds,
+    according to how long CloudWatch retains each resolution."""
+    if end - start <= 3 * 24 * 60 * 60:
+        return 60
+    elif end - start <= 15 * 24 * 60 * 60:
+        return 300
+    return 3600
+
+
+def _get_capacity_metrics(cloudwatch, targets, start, end):
+    """Retrieve the consumed capacity and throttle metrics of the tables and
+    indexes, in as few requests as possible. The consumed capacity is
+    returned as a list of per-second averages for each period of the
+    resolution, and the throttles as totals."""
+    resolution = _get_metrics_resolution(start, end)
+    queries = []
+    for i, target in enumerate(targets):
+        dimensions = [{'Name': 'TableName', 'Value': target['table_name']}]
+        if target['index']:
+            dimensions.append({'Name': 'GlobalSecondaryIndexName',
+                               'Value': target['index']})
+        for key, metric in CAPACITY_METRICS:
+            queries.append({
+                'Id': 'm{}_{}'.format(i, key),
+                'MetricStat': {
+                    'Metric': {'Namespace': 'AWS/DynamoDB',
+                               'MetricName': metric,
+                               'Dimensions': dimensions},
+                    'Period': resolution,
+                    'Stat': 'Sum'
+                }
+            })
+    values = {query['Id']: [] for query in queries}
+    for i in range(0, len(queries), 500):
+        kwargs = {}
+        while True:
+            rv = cloudwatch.get_metric_data(
+                MetricDataQueries=queries[i:i + 500],
+                StartTime=datetime.utcfromtimestamp(start),
+                EndTime=datetime.utcfromtimestamp(end), **kwargs)
+            for result in rv['MetricDataResults']:
+                values[result['Id']] += result['Values']
+            if not rv.get('NextToken'):
+                break
+            kwargs['NextToken'] = rv['NextToken']
+    metrics = []
+    for i, target in enumerate(targets):
+        read = values['m{}_read'.format(i)]
+        write = values['m{}_write'.format(i)]
+        metrics.append({
+            'read_avg': sum(read) / (end - start),
+            'read_peak': max(read or [0]) / resolution,
+            'write_avg': sum(write) / (end - start),
+            'write_peak': max(write or [0]) / resolution,
+            'read_throttles': int(sum(values['m{}_read_throttles'.format(i)])),
+            'write_throttles': int(sum(
+                values['m{}_write_throttles'.format(i)]))
+        })
+    return metrics
+
+
+def _get_capacity_suggestions(target, metrics):
+    """Suggest capacity settings for a table or index, given its consumed
+    capacity and throttles."""
+    suggestions = []
+    prefix = ''
+    if target['index']:
+        prefix = 'global_secondary_indexes.{}.'.format(target['index'])
+    needed = {capacity: max(1, int(math.ceil(
+        metrics[capacity + '_peak'] / TARGET_UTILIZATION)))
+        for capacity in ['read', 'write']}
+
+    # compare the monthly cost of the traffic with each billing mode
+    hours = 24 * 30
+    provisioned_cost = hours * (needed['read'] * PROVISIONED_READ_PRICE +
+                                needed['write'] * PROVISIONED_WRITE_PRICE)
+    on_demand_cost = hours * 60 * 60 * (
+        metrics['read_avg'] * ON_DEMAND_READ_PRICE +
+        metrics['write_avg'] * ON_DEMAND_WRITE_PRICE)
+
+    if target['on_demand']:
+        if provisioned_cost < on_demand_cost and not target['index']:
+            suggestions.append(
+                'Traffic is steady enough for provisioned capacity: use '
+                'billing_mode "provisioned" with read_throughput {} and '
+                'write_throughput {} (${:.2f}/month instead of '
+                '${:.2f}/month).'.format(needed['read'], needed['write'],
+                                         provisioned_cost, on_demand_cost))
+        return suggestions
+
+    for capacity in ['read', 'write']:
+        provisioned = target['throughput'][capacity.title() +
+                                           'CapacityUnits']
+        throttles = metrics[capacity + '_throttles']
+        if target['autoscaling']:
+            maximum = target['autoscaling'].get('max_' + capacity)
+            if maximum and needed[capacity] > maximum:
+                suggestions.append(
+                    'Increase {}autoscaling.max_{} to {}, the peak was '
+                    '{:.2f} units/s.'.format(prefix, capacity,
+                                             needed[capacity],
+                                             metrics[capacity + '_peak']))
+            elif throttles:
+                suggestions.append(
+                    '{} {} requests were throttled while auto scaling '
+                    'adjusted the capacity, increase {}autoscaling.min_{} '
+                    'to absorb sudden spikes.'.format(throttles, capacity,
+                                                      prefix, capacity))
+        elif needed[capacity] > provisioned:
+            suggestions.append(
+                'Increase {}{}_throughput from {} to {}, the peak was '
+                '{:.2f} units/s{}.'.format(
+                    prefix, capacity, provisioned, needed[capacity],
+                    metrics[capacity + '_peak'],
+                    ' with {} throttled requests'.format(throttles)
+                    if throttles else ''))
+        elif throttles:
+            suggestions.append(
+                '{} {} requests were throttled while the average capacity '
+                'was within {}{}_throughput, the traffic may come in short '
+                'bursts or be concentrated on a few keys.'.format(
+                    throttles, capacity, prefix, capacity))
+        elif needed[capacity] * 2 <= provisioned:
+            suggestions.append(
+                'Decrease {}{}_throughput from {} to {}, the peak was '
+                '{:.2f} units/s.'.format(prefix, capacity, provisioned,
+                                         needed[capacity],
+                                         metrics[capacity + '_peak']))
+    if not target['index'] and not target['autoscaling'] and \
+            on_demand_cost < provisioned_cost:
+        suggestions.append(
+            'Traffic is too low or spiky for provisioned capacity: use '
+            'billing_mode "pay_per_request" (${:.2f}/month instead of '
+            '${:.2f}/month).'.format(on_demand_cost, provisioned_cost))
+    return suggestions
+
+
+def _get_hot_keys(cloudwatch, table_name, start, end, count=5):
+    """Return the most accessed and most throttled partition keys of a
+    table, from its Contributor Insights rules."""
+    rules = []
+    kwargs = {}
+    while True:
+        rv = cloudwatch.describe_insight_rules(**kwargs)
+        rules += [rule['Name'] for rule in rv.get('InsightRules', [])]
+        if not rv.get('NextToken'):
+            break
+        kwargs['NextToken'] = rv['NextToken']
+
+    # rules are named DynamoDBContributorInsights-<type>-<table>-<timestamp>
+    hot_keys = {}
+    for rule in rules:
+        parts = rule.split('-', 2)
+        if len(parts) != 3 or parts[0] != 'DynamoDBContributorInsights' or \
+                parts[1] not in ['PKC', 'PKT'] or \
+                parts[2].rsplit('-', 1)[0] != table_name:
+            continue
+        rv = cloudwatch.get_insight_rule_report(
+            RuleName=rule, StartTime=datetime.utcfromtimestamp(start),
+            EndTime=datetime.utcfromtimestamp(end),
+            Period=_get_metrics_resolution(start, end),
+            MaxContributorCount=count)
+        total = rv.get('AggregateValue') or 0
+        hot_keys['accessed' if parts[1] == 'PKC' else 'throttled'] = [
+            (', '.join(contributor['Keys']),
+             contributor['ApproximateAggregateValue'],
+             contributor['ApproximateAggregateValue'] / total if total
+             else 0.0)
+            for contributor in rv.get('Contributors', [])]
+    return hot_keys
+
+
+def _get_hot_key_suggestions(hot_keys):
+    suggestions = []
+    for key, value, share in hot_keys.get('accessed', []):
+        if share >= HOT_KEY_SHARE:
+            suggestions.append(
+                'Partition key {} receives {:.0%} of the requests, consider '
+                'a key schema with more distinct partition keys, or '
+                'spreading this key over several partitions with a '
+                'suffix.'.format(key, share))
+    if hot_keys.get('throttled'):
+        suggestions.append('Requests were throttled on partition keys {}.'
+                           .format(', '.join(key for key, value, share in
+                                             hot_keys['throttled'])))
+    return suggestions
+
+
+def _print_capacity_report(target, metrics, suggestions, hot_keys=None):
+    if target['index']:
+        title = '  Index ' + target['index']
+        indent = '    '
+    else:
+        title = 'Table ' + target['table_name']
+        indent = '  '
+    if target['on_demand']:
+        title += ' (pay per request)'
+    else:
+        title += ' (provisioned: {} read, {} write{})'.format(
+            target['throughput']['ReadCapacityUnits'],
+            target['throughput']['WriteCapacityUnits'],
+            ', auto scaling' if target['autoscaling'] else '')
+    print(title)
+    for capacity in ['read', 'write']:
+        print('{}{}: avg {:.2f} units/s, peak {:.2f} units/s, '
+              '{} throttled'.format(
+                  indent, capacity.title(), metrics[capacity + '_avg'],
+                  metrics[capacity + '_peak'],
+                  metrics[capacity + '_throttles']))
+    for kind in ['accessed', 'throttled']:
+        if (hot_keys or {}).get(kind):
+            print('{}Most {} keys:'.format(indent, kind))
+            for key, value, share in hot_keys[kind]:
+                print('{}  {} ({:.0f}, {:.0%})'.format(
+                    indent, key, value, share))
+    for suggestion in suggestions:
+        print('{}- {}'.format(indent, suggestion))
+
+
+@climax.argument('--hot-keys', action='store_true',
+                 help=('Show the most accessed and throttled keys of the '
+                       'tables that have Contributor Insights enabled.'))
+@climax.argument('--period', '-p', default='1w',
+                 help=('How far back to analyze, in weeks (1w), days (2d), '
+                       'hours (3h), minutes (4m) or seconds (5s). Default '
+                       'is 1w.'))
+@climax.argument('--stage',
+                 help=('Stage of the tables to analyze. Defaults to the '
+                       'development stage.'))
+def report(stage, period, hot_keys, config_file):
+    """Analyze the capacity used by the tables."""
+    from ..cli import _load_config, _get_period_start
+    config = _load_config(config_file)
+    stage = stage or config['devstage']
+    end = time.time()
+    start = _get_period_start(period)
+    cloudwatch = boto3.client('cloudwatch')
+    targets = _get_capacity_targets(config, stage)
+    metrics = _get_capacity_metrics(cloudwatch, targets, start, end)
+    for target, target_metrics in zip(targets, metrics):
+        suggestions = _get_capacity_suggestions(target, target_metrics)
+        keys = None
+        if hot_keys and not target['index']:
+            keys = _get_hot_keys(cloudwatch, target['table_name'], start,
+                                 end)
+            suggestions += _get_hot_key_suggestions(keys)
+        _print_capacity_report(target, target_metrics, suggestions, keys)
+
+
+def dynamodb(config_file):
+    """Manage the DynamoDB tables."""
+    return {'config_file': config_file}
+
+
+def register_commands(main):
+    """Add the "slam dynamodb" commands."""
+    group = main.group()(dynamodb)
+    group.command()(local)
+    group.command()(bench)
+    group.command()(report)
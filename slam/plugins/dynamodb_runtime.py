@@ -0,0 +1,166 @@
+"""DynamoDB helpers for functions deployed with slam.
+
+When the dynamodb plugin is enabled, this module is included in the lambda
+package as ``slam_dynamodb``. It resolves the names of the tables declared in
+slam.yaml for the current stage, and provides bulk operations that split the
+items into batches, send the batches concurrently, and retry any unprocessed
+items with jittered exponential backoff.
+
+    import slam_dynamodb
+
+    slam_dynamodb.put_items('mytable', [{'id': '1'}, {'id': '2'}])
+    items = slam_dynamodb.get_items('mytable', [{'id': '1'}, {'id': '2'}])
+    slam_dynamodb.delete_items('mytable', [{'id': '1'}])
+
+Items and keys are given as Python dictionaries. Numbers must be given as
+integers or decimals, as floating point values are not accepted by DynamoDB.
+"""
+import os
+import random
+import threading
+import time
+
+# maximum number of items in a BatchWriteItem and BatchGetItem request
+BATCH_WRITE_SIZE = 25
+BATCH_GET_SIZE = 100
+
+# number of batches that are sent concurrently
+MAX_WORKERS = 8
+
+# number of times unprocessed items are retried, and the backoff limits, in
+# seconds
+MAX_RETRIES = 8
+BASE_BACKOFF = 0.05
+MAX_BACKOFF = 5
+
+# names of the tables declared in slam.yaml, set when the package is built
+TABLES = None
+
+_lock = threading.Lock()
+_client = None
+_pool = None
+_table_names = {}
+
+
+def table_name(name):
+    """Return the DynamoDB name of a table declared in slam.yaml, for the
+    stage the function is running on."""
+    key = (os.environ.get('STAGE', 'dev'), name)
+    if key not in _table_names:
+        if TABLES is not None and name not in TABLES:
+            raise ValueError('Table {} is not declared in slam.yaml.'.format(
+                name))
+        _table_names[key] = key[0] + '.' + name
+    return _table_names[key]
+
+
+def get_client():
+    """Return a DynamoDB client that is shared by all the invocations that
+    run on this container."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import boto3
+                from botocore.config import Config
+                _client = boto3.client('dynamodb', config=Config(
+                    max_pool_connections=MAX_WORKERS * 2))
+    return _client
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                # concurrent.futures is not available on python 2.7
+                from multiprocessing.pool import ThreadPool
+                _pool = ThreadPool(MAX_WORKERS)
+    return _pool
+
+
+def _serialize(item):
+    from boto3.dynamodb.types import TypeSerializer
+    serializer = TypeSerializer()
+    return {k: serializer.serialize(v) for k, v in item.items()}
+
+
+def _deserialize(item):
+    from boto3.dynamodb.types import TypeDeserializer
+    deserializer = TypeDeserializer()
+    return {k: deserializer.deserialize(v) for k, v in item.items()}
+
+
+def _backoff(attempt):
+    """Sleep a random time, with an upper limit that doubles with each
+    attempt."""
+    time.sleep(random.uniform(0, min(MAX_BACKOFF,
+                                     BASE_BACKOFF * 2 ** attempt)))
+
+
+def _run_batches(func, table, requests, batch_size):
+    """Split a list of requests into batches and run them concurrently.
+    Return the list of results of each batch."""
+    batches = [requests[i:i + batch_size]
+               for i in range(0, len(requests), batch_size)]
+    if len(batches) <= 1:
+        return [func(table, batch) for batch in batches]
+    return _get_pool().map(lambda batch: func(table, batch), batches)
+
+
+def _write_batch(table, requests):
+    attempt = 0
+    while requests:
+        rv = get_client().batch_write_item(RequestItems={table: requests})
+        requests = (rv.get('UnprocessedItems') or {}).get(table) or []
+        if requests:
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                raise RuntimeError('{} items could not be written to table '
+                                   '{}.'.format(len(requests), table))
+            _backoff(attempt)
+
+
+def _get_batch(table, request):
+    items = []
+    attempt = 0
+    while request:
+        rv = get_client().batch_get_item(RequestItems={table: request})
+        items += (rv.get('Responses') or {}).get(table) or []
+        request = (rv.get('UnprocessedKeys') or {}).get(table)
+        if request:
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                raise RuntimeError('{} items could not be read from table '
+                                   '{}.'.format(len(request['Keys']), table))
+            _backoff(attempt)
+    return items
+
+
+def put_items(name, items):
+    """Write a list of items to a table."""
+    _run_batches(_write_batch, table_name(name),
+                 [{'PutRequest': {'Item': _serialize(item)}}
+                  for item in items], BATCH_WRITE_SIZE)
+
+
+def delete_items(name, keys):
+    """Delete a list of items from a table, given their keys."""
+    _run_batches(_write_batch, table_name(name),
+                 [{'DeleteRequest': {'Key': _serialize(key)}}
+                  for key in keys], BATCH_WRITE_SIZE)
+
+
+def get_items(name, keys, consistent_read=False):
+    """Read a list of items from a table, given their keys. The items are
+    returned in no particular order, and items that do not exist are not
+    included."""
+    keys = [_serialize(key) for key in keys]
+    table = table_name(name)
+
+    def get_batch(table, batch):
+        return _get_batch(table, {'Keys': batch,
+                                  'ConsistentRead': consistent_read})
+
+    results = _run_batches(get_batch, table, keys, BATCH_GET_SIZE)
+    return [_deserialize(item) for items in results for item in items]
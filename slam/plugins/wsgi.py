@@ -1,14 +1,51 @@
 """WSGI Plugin
 
 This plugin implements an adapter that enables a WSGI complaint web application
-to be deployed to AWS Lambda and API Gateway.
+to be deployed to AWS Lambda and API Gateway. ASGI applications are also
+supported when the asgi option is set to true.
 
 wsgi:
   deploy_api_gateway: true
   log_stages:
     - dev
+  # uncomment to enable the API Gateway cache and throttling for a stage
+  # cache:
+  #   prod:
+  #     cluster_size: "0.5"
+  #     ttl: 300
+  # throttling:
+  #   prod:
+  #     burst_limit: 500
+  #     rate_limit: 1000
+  # uncomment to deploy a CloudFront distribution in front of the API
+  # cdn:
+  #   stages:
+  #     - prod
+  #   default_ttl: 0
+  #   query_strings: all
+  # uncomment to connect stages to an application load balancer
+  # alb:
+  #   listener_arn: "arn:aws:elasticloadbalancing:..."
+  #   stages:
+  #     prod:
+  #       priority: 10
+  #       host: "api.example.com"
+  #       path: "/*"
+  # uncomment to give each stage a lambda function URL, set auth to "aws_iam"
+  # to only allow callers with IAM permissions
+  # function_url:
+  #   auth: "none"
+  # uncomment to generate etags and handle conditional requests
+  # etag: true
+  # uncomment to cache responses to GET requests inside the lambda container
+  # response_cache:
+  #   ttl: 5
+  #   max_entries: 128
+  #   vary_headers:
+  #     - Accept
 """
 import collections
+import copy
 
 import climax
 
@@ -16,13 +53,56 @@ import climax
 @climax.command()
 @climax.argument('--no-api-gateway', action='store_true',
                  help=('Do not deploy API Gateway.'))
+@climax.argument('--asgi', action='store_true',
+                 help=('Treat the given function as an ASGI app.'))
 @climax.argument('--wsgi', action='store_true',
                  help=('Treat the given function as a WSGI app.'))
-def init(config, wsgi, no_api_gateway):
-    if not wsgi:
+def init(config, wsgi, no_api_gateway, asgi=False):
+    if not wsgi and not asgi:
         return
-    return {'deploy_api_gateway': not no_api_gateway,
-            'log_stages': [config['devstage']]}
+    plugin_config = {'deploy_api_gateway': not no_api_gateway,
+                     'log_stages': [config['devstage']]}
+    if asgi:
+        plugin_config['asgi'] = True
+    return plugin_config
+
+
+def _get_wsgi_method_settings(config, stage, log):
+    cache = (config['wsgi'].get('cache') or {}).get(stage)
+    throttling = (config['wsgi'].get('throttling') or {}).get(stage)
+    settings = {
+        'ResourcePath': '/*',
+        'HttpMethod': '*',
+        'LoggingLevel': 'INFO' if log else 'ERROR',
+    }
+    if throttling:
+        if throttling.get('burst_limit') is not None:
+            settings['ThrottlingBurstLimit'] = throttling['burst_limit']
+        if throttling.get('rate_limit') is not None:
+            settings['ThrottlingRateLimit'] = throttling['rate_limit']
+    method_settings = [settings]
+    if cache:
+        # only the GET methods are cached, so that requests with other
+        # methods always reach the function
+        ttls = collections.OrderedDict([('/', cache.get('ttl', 300)),
+                                        ('/{proxy+}', cache.get('ttl', 300))])
+        for method in cache.get('methods') or []:
+            if method.get('path') not in ttls:
+                raise ValueError('Invalid cache path "{}", valid paths are '
+                                 '"/" and "/{{proxy+}}".'.format(
+                                     method.get('path')))
+            if method.get('method', 'GET') != 'GET':
+                raise ValueError('Only GET requests can be cached.')
+            ttls[method['path']] = method.get('ttl', 0)
+        for path, ttl in ttls.items():
+            s = settings.copy()
+            # slashes in resource paths are escaped after the leading one
+            s['ResourcePath'] = '/' if path == '/' else '/~1' + path[1:]
+            s['HttpMethod'] = 'GET'
+            s['CachingEnabled'] = ttl > 0
+            s['CacheTtlInSeconds'] = ttl
+            method_settings.append(s)
+    return method_settings
 
 
 def _get_wsgi_resources(config):
@@ -94,6 +174,33 @@ def _get_wsgi_resources(config):
             }
         }
     }
+    if config['wsgi'].get('cache'):
+        # GET requests are sent to their own methods, so that they are the
+        # only ones that can be cached
+        res['ApiRootGetMethod'] = copy.deepcopy(res['ApiRootMethod'])
+        res['ApiRootGetMethod']['Properties']['HttpMethod'] = 'GET'
+        res['ApiGetMethod'] = copy.deepcopy(res['ApiMethod'])
+        res['ApiGetMethod']['Properties']['HttpMethod'] = 'GET'
+
+        # the cache key must include the request path and any query string
+        # or header arguments that affect the response
+        params = ['method.request.path.proxy']
+        params += ['method.request.querystring.' + q for q in
+                   config['wsgi'].get('cache_key_query_strings') or []]
+        params += ['method.request.header.' + h for h in
+                   config['wsgi'].get('cache_key_headers') or []]
+        for method in ['ApiRootGetMethod', 'ApiGetMethod']:
+            # the root resource does not have a path argument
+            method_params = params if method == 'ApiGetMethod' \
+                else params[1:]
+            props = res[method]['Properties']
+            props['RequestParameters'] = {p: False for p in method_params}
+            props['Integration']['RequestParameters'] = {
+                p.replace('method.', 'integration.', 1): p
+                for p in method_params}
+            props['Integration']['CacheKeyParameters'] = method_params
+        res['ApiGetMethod']['Properties']['RequestParameters'][
+            'method.request.path.proxy'] = True
     res['ApiCloudWatchRole'] = {
         'Type': 'AWS::IAM::Role',
         'Properties': {
@@ -127,22 +234,29 @@ def _get_wsgi_resources(config):
         log = stage in config['wsgi'].get('log_stages') or []
         res[stage.title() + 'ApiDeployment'] = {
             'Type': 'AWS::ApiGateway::Deployment',
-            'DependsOn': ['ApiRootMethod', 'ApiMethod'],
+            'DependsOn': [m for m in ['ApiRootMethod', 'ApiMethod',
+                                      'ApiRootGetMethod', 'ApiGetMethod']
+                          if m in res],
             'Properties': {
                 'RestApiId': {'Ref': 'Api'},
                 'StageName': stage,
                 'StageDescription': {
-                    'MethodSettings': [
-                        {
-                            'ResourcePath': '/*',
-                            'HttpMethod': '*',
-                            'LoggingLevel': 'INFO' if log else 'ERROR',
-                        }
-                    ],
+                    'MethodSettings': _get_wsgi_method_settings(config,
+                                                                stage, log),
                     'Variables': {'STAGE': stage}
                 }
             }
         }
+        if config['aws'].get('tracing') == 'active':
+            res[stage.title() + 'ApiDeployment']['Properties'][
+                'StageDescription']['TracingEnabled'] = True
+        cache = (config['wsgi'].get('cache') or {}).get(stage)
+        if cache:
+            res[stage.title() + 'ApiDeployment']['Properties'][
+                'StageDescription'].update({
+                    'CacheClusterEnabled': True,
+                    'CacheClusterSize': str(cache.get('cluster_size', '0.5'))
+                })
         res[stage.title() + 'ApiLambdaPermission'] = {
             'Type': 'AWS::Lambda::Permission',
             'DependsOn': stage.title() + 'FunctionAlias',
@@ -189,10 +303,268 @@ def _get_wsgi_outputs(config):
     return outputs
 
 
+def _get_cdn_stages(config):
+    cdn = config['wsgi'].get('cdn')
+    if not cdn:
+        return []
+    stages = cdn.get('stages') or list(config['stage_environments'].keys())
+    return [s for s in stages if s in config['stage_environments']]
+
+
+def _get_cdn_cache_key_config(option, value):
+    if value == 'all':
+        return {option + 'Behavior': 'all'}
+    elif not value or value == 'none':
+        return {option + 'Behavior': 'none'}
+    elif not isinstance(value, list):
+        raise ValueError('Invalid CDN cache key setting "{}", give "all", '
+                         '"none" or a list of names.'.format(value))
+    return {option + 'Behavior': 'whitelist', option + 's': value}
+
+
+def _get_cdn_resources(config):
+    cdn = config['wsgi']['cdn']
+    headers = _get_cdn_cache_key_config('Header', cdn.get('headers'))
+    if headers['HeaderBehavior'] == 'all':
+        raise ValueError('All headers cannot be included in the CDN cache '
+                         'key, give a list of header names instead.')
+    res = collections.OrderedDict()
+    for stage in _get_cdn_stages(config):
+        res[stage.title() + 'CdnCachePolicy'] = {
+            'Type': 'AWS::CloudFront::CachePolicy',
+            'Properties': {
+                'CachePolicyConfig': {
+                    'Name': {'Fn::Join': ['-', [{'Ref': 'AWS::StackName'},
+                                                stage]]},
+                    'DefaultTTL': cdn.get('default_ttl', 0),
+                    'MinTTL': cdn.get('min_ttl', 0),
+                    'MaxTTL': cdn.get('max_ttl', 31536000),
+                    'ParametersInCacheKeyAndForwardedToOrigin': {
+                        'EnableAcceptEncodingGzip': True,
+                        'EnableAcceptEncodingBrotli': True,
+                        'HeadersConfig': headers,
+                        'CookiesConfig': _get_cdn_cache_key_config(
+                            'Cookie', cdn.get('cookies')),
+                        'QueryStringsConfig': _get_cdn_cache_key_config(
+                            'QueryString', cdn.get('query_strings', 'all'))
+                    }
+                }
+            }
+        }
+        res[stage.title() + 'CdnDistribution'] = {
+            'Type': 'AWS::CloudFront::Distribution',
+            'Properties': {
+                'DistributionConfig': {
+                    'Enabled': True,
+                    'Comment': '{} ({})'.format(config['name'], stage),
+                    'HttpVersion': 'http2',
+                    'PriceClass': cdn.get('price_class', 'PriceClass_All'),
+                    'Origins': [
+                        {
+                            'Id': 'Api',
+                            'DomainName': {
+                                'Fn::Join': [
+                                    '',
+                                    [
+                                        {'Ref': 'Api'},
+                                        '.execute-api.',
+                                        {'Ref': 'AWS::Region'},
+                                        '.amazonaws.com'
+                                    ]
+                                ]
+                            },
+                            'OriginPath': '/' + stage,
+                            'CustomOriginConfig': {
+                                'OriginProtocolPolicy': 'https-only',
+                                'OriginSSLProtocols': ['TLSv1.2']
+                            }
+                        }
+                    ],
+                    'DefaultCacheBehavior': {
+                        'TargetOriginId': 'Api',
+                        'ViewerProtocolPolicy': 'redirect-to-https',
+                        'AllowedMethods': ['GET', 'HEAD', 'OPTIONS', 'PUT',
+                                           'PATCH', 'POST', 'DELETE'],
+                        'CachedMethods': ['GET', 'HEAD'],
+                        'Compress': True,
+                        'CachePolicyId': {
+                            'Ref': stage.title() + 'CdnCachePolicy'},
+                        # managed policy that forwards everything to the
+                        # origin except the Host header
+                        'OriginRequestPolicyId':
+                            'b689b0a8-53d0-40ab-baf2-68738e2966ac'
+                    }
+                }
+            }
+        }
+    return res
+
+
+def _get_cdn_outputs(config):
+    outputs = {}
+    for stage in _get_cdn_stages(config):
+        outputs[stage.title() + 'CdnEndpoint'] = {
+            'Value': {
+                'Fn::Join': [
+                    '',
+                    [
+                        'https://',
+                        {'Fn::GetAtt': [stage.title() + 'CdnDistribution',
+                                        'DomainName']}
+                    ]
+                ]
+            }
+        }
+    return outputs
+
+
+def _get_function_url_auth_type(config):
+    function_url = config['wsgi'].get('function_url')
+    auth = 'none'
+    if isinstance(function_url, dict):
+        auth = function_url.get('auth') or 'none'
+    if auth not in ['none', 'aws_iam']:
+        raise ValueError('Invalid function URL auth type "{}", valid types '
+                         'are "none" and "aws_iam".'.format(auth))
+    return auth.upper()
+
+
+def _get_function_url_resources(config):
+    auth_type = _get_function_url_auth_type(config)
+    res = collections.OrderedDict()
+    for stage in config['stage_environments'].keys():
+        res[stage.title() + 'FunctionUrl'] = {
+            'Type': 'AWS::Lambda::Url',
+            'DependsOn': stage.title() + 'FunctionAlias',
+            'Properties': {
+                'TargetFunctionArn': {'Ref': stage.title() + 'FunctionAlias'},
+                'AuthType': auth_type,
+                'InvokeMode': 'BUFFERED'
+            }
+        }
+        if auth_type == 'AWS_IAM':
+            # callers are authorized by their own IAM policies
+            continue
+
+        # public URLs need permission to invoke the URL and the function
+        res[stage.title() + 'FunctionUrlPermission'] = {
+            'Type': 'AWS::Lambda::Permission',
+            'DependsOn': stage.title() + 'FunctionAlias',
+            'Properties': {
+                'Action': 'lambda:InvokeFunctionUrl',
+                'FunctionName': {'Ref': stage.title() + 'FunctionAlias'},
+                'Principal': '*',
+                'FunctionUrlAuthType': 'NONE'
+            }
+        }
+        res[stage.title() + 'FunctionUrlInvokePermission'] = {
+            'Type': 'AWS::Lambda::Permission',
+            'DependsOn': stage.title() + 'FunctionAlias',
+            'Properties': {
+                'Action': 'lambda:InvokeFunction',
+                'FunctionName': {'Ref': stage.title() + 'FunctionAlias'},
+                'Principal': '*',
+                'InvokedViaFunctionUrl': True
+            }
+        }
+    return res
+
+
+def _get_function_url_outputs(config):
+    outputs = {}
+    for stage in config['stage_environments'].keys():
+        outputs[stage.title() + 'FunctionUrl'] = {
+            'Value': {'Fn::GetAtt': [stage.title() + 'FunctionUrl',
+                                     'FunctionUrl']}
+        }
+    return outputs
+
+
+def _get_alb_resources(config):
+    alb = config['wsgi']['alb']
+    if not alb.get('listener_arn'):
+        raise ValueError('The ALB listener ARN must be given in the '
+                         'wsgi.alb.listener_arn option.')
+    res = collections.OrderedDict()
+    for stage, rule in (alb.get('stages') or {}).items():
+        if stage not in config['stage_environments']:
+            raise ValueError('Invalid stage {} in ALB '
+                             'configuration.'.format(stage))
+        rule = rule or {}
+        if rule.get('priority') is None:
+            raise ValueError('ALB listener rule for stage {} does not have '
+                             'a priority.'.format(stage))
+        res[stage.title() + 'AlbLambdaPermission'] = {
+            'Type': 'AWS::Lambda::Permission',
+            'DependsOn': stage.title() + 'FunctionAlias',
+            'Properties': {
+                'Action': 'lambda:InvokeFunction',
+                'FunctionName': {'Ref': stage.title() + 'FunctionAlias'},
+                'Principal': 'elasticloadbalancing.amazonaws.com'
+            }
+        }
+        res[stage.title() + 'AlbTargetGroup'] = {
+            'Type': 'AWS::ElasticLoadBalancingV2::TargetGroup',
+            'DependsOn': stage.title() + 'AlbLambdaPermission',
+            'Properties': {
+                'TargetType': 'lambda',
+                'Targets': [{'Id': {'Ref': stage.title() + 'FunctionAlias'}}],
+                'TargetGroupAttributes': [
+                    {
+                        'Key': 'lambda.multi_value_headers.enabled',
+                        'Value': 'true' if alb.get('multi_value_headers',
+                                                   True) else 'false'
+                    }
+                ]
+            }
+        }
+        paths = rule.get('path', '/*')
+        conditions = [
+            {
+                'Field': 'path-pattern',
+                'PathPatternConfig': {
+                    'Values': paths if isinstance(paths, list) else [paths]
+                }
+            }
+        ]
+        if rule.get('host'):
+            hosts = rule['host']
+            conditions.append({
+                'Field': 'host-header',
+                'HostHeaderConfig': {
+                    'Values': hosts if isinstance(hosts, list) else [hosts]
+                }
+            })
+        res[stage.title() + 'AlbListenerRule'] = {
+            'Type': 'AWS::ElasticLoadBalancingV2::ListenerRule',
+            'Properties': {
+                'ListenerArn': alb['listener_arn'],
+                'Priority': rule['priority'],
+                'Conditions': conditions,
+                'Actions': [
+                    {
+                        'Type': 'forward',
+                        'TargetGroupArn': {
+                            'Ref': stage.title() + 'AlbTargetGroup'}
+                    }
+                ]
+            }
+        }
+    return res
+
+
 def cfn_template(config, template):
     if config['wsgi']['deploy_api_gateway']:
         template['Resources'].update(_get_wsgi_resources(config))
         template['Outputs'].update(_get_wsgi_outputs(config))
+        if config['wsgi'].get('cdn'):
+            template['Resources'].update(_get_cdn_resources(config))
+            template['Outputs'].update(_get_cdn_outputs(config))
+    if config['wsgi'].get('function_url'):
+        template['Resources'].update(_get_function_url_resources(config))
+        template['Outputs'].update(_get_function_url_outputs(config))
+    if config['wsgi'].get('alb'):
+        template['Resources'].update(_get_alb_resources(config))
     return template
 
 
@@ -208,10 +580,21 @@ def _get_from_stack(stack, source, key):  # pragma: no cover
 
 
 def status(config, stack):
-    if _get_from_stack(stack, 'Output',
-                       config['devstage'].title() + 'Endpoint'):
-        return {s: _get_from_stack(stack, 'Output', s.title() + 'Endpoint')
-                for s in config['stage_environments'].keys()}
+    statuses = {}
+    for s in config['stage_environments'].keys():
+        parts = []
+        endpoint = _get_from_stack(stack, 'Output', s.title() + 'Endpoint')
+        if endpoint:
+            parts.append(endpoint)
+        cdn = _get_from_stack(stack, 'Output', s.title() + 'CdnEndpoint')
+        if cdn:
+            parts.append('(CDN: {})'.format(cdn))
+        url = _get_from_stack(stack, 'Output', s.title() + 'FunctionUrl')
+        if url:
+            parts.append('(URL: {})'.format(url))
+        if parts:
+            statuses[s] = ' '.join(parts)
+    return statuses or None
 
 
 def run_lambda_function(event, context, app, config):  # pragma: no cover
@@ -223,65 +606,287 @@ def run_lambda_function(event, context, app, config):  # pragma: no cover
     except ImportError:  # pragma: no cover
         from urllib.parse import quote
 
-    query_string = None
-    if event.get('queryStringParameters') is not None:
-        query_string = '&'.join(
-            [quote(k) + '=' + quote(v)
-             for k, v in event['queryStringParameters'].items()])
     headers = event.get('headers') or {}
+    elb = 'elb' in (event.get('requestContext') or {})
+    if event.get('version') == '2.0':
+        # payload format 2.0, used by lambda function URLs
+        method = event['requestContext']['http']['method']
+        path = event.get('rawPath', '/')
+        query_string = event.get('rawQueryString') or None
+        if event.get('cookies'):
+            headers = dict(headers)
+            headers['cookie'] = '; '.join(event['cookies'])
+    else:
+        method = event.get('httpMethod', 'GET')
+        path = event.get('path', '/')
+        if event.get('multiValueHeaders'):
+            headers = {h: ('; ' if h.lower() == 'cookie' else ', ').join(v)
+                       for h, v in event['multiValueHeaders'].items()}
+        params = event.get('multiValueQueryStringParameters')
+        if params is None and \
+                event.get('queryStringParameters') is not None:
+            params = {k: [v] for k, v in
+                      event['queryStringParameters'].items()}
+        query_string = None
+        if params is not None:
+            # load balancers send query strings without decoding them
+            encode = quote if not elb else (lambda x: x)
+            query_string = '&'.join(
+                [encode(k) + '=' + encode(v)
+                 for k, values in params.items() for v in values])
+    if_none_match = None
+    for h, v in headers.items():
+        if h.lower() == 'if-none-match':
+            if_none_match = v
+
+    def conditional_response(response):
+        # replace the response with a 304 if the client has a current copy
+        if not config['wsgi'].get('etag') or if_none_match is None or \
+                method not in ['GET', 'HEAD'] or \
+                response['statusCode'] != 200:
+            return response
+        etag = None
+        for h, v in response['headers'].items():
+            if h.lower() == 'etag':
+                etag = v.strip()
+        if etag is None:
+            return response
+        tags = [t.strip() for t in if_none_match.split(',')]
+        if '*' not in tags and etag.replace('W/', '', 1) not in \
+                [t.replace('W/', '', 1) for t in tags]:
+            return response
+        response = {
+            'statusCode': 304,
+            'headers': {h: v for h, v in response['headers'].items()
+                        if h.lower() in ['cache-control', 'content-location',
+                                         'date', 'etag', 'expires', 'vary']},
+            'body': '',
+            'isBase64Encoded': False
+        }
+        if elb:
+            response['statusDescription'] = '304 Not Modified'
+        return response
+
+    def final_response(response):
+        response = conditional_response(response)
+        if elb and 'multiValueHeaders' in event:
+            # load balancers with multi-value headers enabled expect all
+            # headers to be returned as lists
+            multi_value_headers = response.pop('multiValueHeaders', None) \
+                or {h: [v] for h, v in response['headers'].items()}
+            del response['headers']
+            response['multiValueHeaders'] = multi_value_headers
+        return response
+
+    # look up the request in the response cache, if one is configured
+    cache_config = config['wsgi'].get('response_cache')
+    cache_key = None
+    if cache_config and method in ['GET', 'HEAD']:
+        import collections
+        import time
+        cache = getattr(run_lambda_function, 'response_cache', None)
+        if cache is None:
+            cache = run_lambda_function.response_cache = \
+                collections.OrderedDict()
+            run_lambda_function.response_cache_stats = {'hits': 0,
+                                                        'misses': 0}
+        stats = run_lambda_function.response_cache_stats
+        lower_headers = {k.lower(): v for k, v in headers.items()}
+        vary_headers = [h.lower()
+                        for h in cache_config.get('vary_headers') or []]
+        cache_key = (method, path, query_string,
+                     tuple(lower_headers.get(h) for h in vary_headers))
+        # requests with credentials can only be given responses that were
+        # marked as shareable by the application
+        authenticated = 'authorization' in lower_headers or \
+            'cookie' in lower_headers
+        cached = cache.pop(cache_key, None)
+        if cached is not None and (
+                cached[0] < time.time() or
+                'no-cache' in lower_headers.get('cache-control', '')):
+            cached = None
+        if cached is not None and authenticated and not cached[2]:
+            cache[cache_key] = cached
+            cached = None
+        if cached is not None:
+            stats['hits'] += 1
+        else:
+            stats['misses'] += 1
+        lookups = stats['hits'] + stats['misses']
+        if lookups % cache_config.get('stats_interval', 100) == 0:
+            print('Response cache: {} hits, {} misses, {:.1f}% hit rate, '
+                  '{} entries'.format(stats['hits'], stats['misses'],
+                                      100.0 * stats['hits'] / lookups,
+                                      len(cache) + (cached is not None)))
+        if cached is not None:
+            # hits skip the WSGI application entirely
+            cache[cache_key] = cached
+            response = dict(cached[1])
+            response['headers'] = dict(response['headers'])
+            return final_response(response)
+
     body = event.get('body').encode('utf-8') \
         if event.get('body') is not None else b''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body)
 
-    # create a WSGI environment for this request
-    environ = {
-        'REQUEST_METHOD': event.get('httpMethod', 'GET'),
-        'SCRIPT_NAME': '',
-        'PATH_INFO': event.get('path', '/'),
-        'QUERY_STRING': query_string,
-        'SERVER_NAME': '',
-        'SERVER_PORT': 80,
-        'HTTP_HOST': '',
-        'SERVER_PROTOCOL': 'https',
-        'CONTENT_TYPE': headers.get('Content-Type', ''),
-        'CONTENT_LENGTH': headers.get('Content-Length', str(len(body))),
-        'wsgi.version': '',
-        'wsgi.url_scheme': '',
-        'wsgi.input': BytesIO(body),
-        'wsgi.errors': sys.stderr,
-        'wsgi.multithread': False,
-        'wsgi.multiprocess': False,
-        'wsgi.run_once': True,
-        'lambda.event': event,
-        'lambda.context': context,
-    }
+    status_headers = [None, None]
+    if config['wsgi'].get('asgi'):
+        import asyncio
+        from http.client import responses
 
-    # add any headers that came with the request
-    for h, v in headers.items():
-        environ['HTTP_' + h.upper().replace('-', '_')] = v
+        def completed(result=None):
+            future = loop.create_future()
+            future.set_result(result)
+            return future
 
-    status_headers = [None, None]
-    body = []
+        loop = getattr(run_lambda_function, 'asgi_loop', None)
+        if loop is None:
+            # the event loop is kept alive for the life of the container. It
+            # is started on the first invocation and not when the container
+            # initializes, because the application is imported after the
+            # stage environment, which comes from the invoked alias, is set
+            loop = run_lambda_function.asgi_loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
 
-    def write(item):
-        body.append(item)
+            # run the lifespan startup sequence of the application
+            lifespan_queue = asyncio.Queue()
+            lifespan_queue.put_nowait({'type': 'lifespan.startup'})
+            startup = loop.create_future()
 
-    def start_response(status, headers):
-        status_headers[:] = [status, headers]
-        return write
+            def lifespan_send(message):
+                if not startup.done() and message['type'] in [
+                        'lifespan.startup.complete',
+                        'lifespan.startup.failed']:
+                    startup.set_result(message)
+                return completed()
 
-    # invoke the WSGI app
-    app_iter = app(environ, start_response)
-    try:
-        for item in app_iter:
+            lifespan = run_lambda_function.asgi_lifespan = loop.create_task(
+                app({'type': 'lifespan',
+                     'asgi': {'version': '3.0', 'spec_version': '2.0'}},
+                    lifespan_queue.get, lifespan_send))
+            loop.run_until_complete(asyncio.wait(
+                [startup, lifespan], return_when=asyncio.FIRST_COMPLETED))
+            if lifespan.done() and not lifespan.cancelled():
+                # the application does not support the lifespan protocol
+                lifespan.exception()
+            if startup.done() and \
+                    startup.result()['type'] == 'lifespan.startup.failed':
+                run_lambda_function.asgi_loop = None
+                raise RuntimeError('ASGI application startup failed: ' +
+                                   startup.result().get('message', ''))
+
+        # create an ASGI scope for this request
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0', 'spec_version': '2.1'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'https',
+            'path': path,
+            'raw_path': path.encode('utf-8'),
+            'query_string': (query_string or '').encode('latin-1'),
+            'root_path': '',
+            'headers': [(h.lower().encode('latin-1'), v.encode('latin-1'))
+                        for h, v in headers.items()],
+            'server': None,
+            'client': None,
+            'lambda.event': event,
+            'lambda.context': context,
+        }
+        request = [{'type': 'http.request', 'body': body,
+                    'more_body': False}]
+        disconnect = loop.create_future()
+        body = []
+
+        def receive():
+            if request:
+                return completed(request.pop())
+            return disconnect
+
+        def send(message):
+            if message['type'] == 'http.response.start':
+                status_headers[:] = [
+                    '{} {}'.format(message['status'],
+                                   responses.get(message['status'], '')),
+                    [(h.decode('latin-1'), v.decode('latin-1'))
+                     for h, v in message.get('headers', [])]]
+            elif message['type'] == 'http.response.body':
+                body.append(message.get('body', b''))
+            return completed()
+
+        # invoke the ASGI app
+        try:
+            loop.run_until_complete(app(scope, receive, send))
+        finally:
+            disconnect.set_result({'type': 'http.disconnect'})
+    else:
+        # function URLs and load balancers send lowercase header names, so
+        # the content headers need to be found in a case-insensitive way
+        content_type = ''
+        content_length = str(len(body))
+        for h, v in headers.items():
+            if h.lower() == 'content-type':
+                content_type = v
+            elif h.lower() == 'content-length':
+                content_length = v
+
+        # create a WSGI environment for this request
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': query_string,
+            'SERVER_NAME': '',
+            'SERVER_PORT': 80,
+            'HTTP_HOST': '',
+            'SERVER_PROTOCOL': 'https',
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': content_length,
+            'wsgi.version': '',
+            'wsgi.url_scheme': '',
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': False,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': True,
+            'lambda.event': event,
+            'lambda.context': context,
+        }
+
+        # add any headers that came with the request
+        for h, v in headers.items():
+            environ['HTTP_' + h.upper().replace('-', '_')] = v
+
+        body = []
+
+        def write(item):
             body.append(item)
-    finally:
-        if hasattr(app_iter, 'close'):
-            app_iter.close()
+
+        def start_response(status, headers):
+            status_headers[:] = [status, headers]
+            return write
+
+        # invoke the WSGI app
+        app_iter = app(environ, start_response)
+        try:
+            for item in app_iter:
+                body.append(item)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
 
     # format the response as required by the api gateway proxy integration
     status = status_headers[0].split()
     headers = status_headers[1]
     body = b''.join(body)
+    if config['wsgi'].get('etag') and method == 'GET' and \
+            int(status[0]) == 200 and \
+            not [h for h in headers if h[0].lower() == 'etag']:
+        # generate a weak etag for the response
+        import hashlib
+        headers = list(headers) + [
+            ('ETag', 'W/"{}"'.format(hashlib.md5(body).hexdigest()))]
     try:
         body = body.decode('utf-8')
         b64 = False
@@ -289,9 +894,68 @@ def run_lambda_function(event, context, app, config):  # pragma: no cover
         body = base64.b64encode(body).decode('utf-8')
         b64 = True
 
-    return {
+    response = {
         'statusCode': int(status[0]),
         'headers': {h[0]: h[1] for h in headers},
         'body': body,
         'isBase64Encoded': b64
     }
+    if elb:
+        response['statusDescription'] = status_headers[0]
+        if 'multiValueHeaders' in event:
+            response['multiValueHeaders'] = {}
+            for h, v in headers:
+                response['multiValueHeaders'].setdefault(h, []).append(v)
+    elif event.get('version') == '2.0':
+        # function URLs return cookies separately, so that multiple cookies
+        # can be set in a single response
+        cookies = [h[1] for h in headers if h[0].lower() == 'set-cookie']
+        if cookies:
+            response['headers'] = {h[0]: h[1] for h in headers
+                                   if h[0].lower() != 'set-cookie'}
+            response['cookies'] = cookies
+
+    # store cacheable responses in the response cache
+    if cache_key is not None and response['statusCode'] == 200:
+        ttl = cache_config.get('ttl', 5)
+        cache_control = ''
+        for h, v in headers:
+            if h.lower() == 'cache-control':
+                cache_control = v.lower()
+            elif h.lower() == 'set-cookie':
+                ttl = 0
+            elif h.lower() == 'vary':
+                # responses that vary on headers that are not in the cache
+                # key cannot be cached
+                for vary in v.split(','):
+                    if vary.strip().lower() not in vary_headers:
+                        ttl = 0
+        max_age = {}
+        shared = False
+        for directive in cache_control.split(','):
+            directive = directive.strip().split('=', 1)
+            if directive[0] in ['no-cache', 'no-store', 'private']:
+                ttl = 0
+            elif directive[0] == 'public':
+                shared = True
+            elif directive[0] in ['max-age', 's-maxage']:
+                shared = shared or directive[0] == 's-maxage'
+                try:
+                    max_age[directive[0]] = int(directive[1].strip('"'))
+                except (IndexError, ValueError):
+                    ttl = 0
+        if max_age:
+            # s-maxage applies to shared caches, so it has priority
+            ttl = min(ttl, max_age.get('s-maxage', max_age.get('max-age')))
+        if authenticated and not shared:
+            # responses to requests with credentials are only stored when
+            # the application allows shared caches to store them
+            ttl = 0
+        if ttl > 0:
+            cache[cache_key] = (time.time() + ttl, response, shared)
+            while len(cache) > cache_config.get('max_entries', 128):
+                cache.popitem(last=False)
+            response = dict(response)
+            response['headers'] = dict(response['headers'])
+
+    return final_response(response)
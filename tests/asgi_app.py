@@ -0,0 +1,31 @@
+"""ASGI application used by the handler tests. This module is only imported
+under Python 3, as it uses async/await syntax."""
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                app.started += 1
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    app.scope = scope
+    message = await receive()
+    app.request_body = message['body']
+    await send({'type': 'http.response.start', 'status': app.status,
+                'headers': app.headers})
+    for chunk in app.body:
+        await send({'type': 'http.response.body', 'body': chunk,
+                    'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+app.started = 0
+app.scope = None
+app.request_body = None
+app.status = 200
+app.headers = []
+app.body = []
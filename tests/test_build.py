@@ -60,6 +60,34 @@ class BuildTests(unittest.TestCase):
             ignore=[r'\.slam\/venv\/.*$', r'\.pyc$'], zipfile_name=pkg)
         rmtree.assert_called_once_with('.lambda_uploader_temp')
 
+    @mock.patch('slam.cli.os.path.exists', side_effect=[False, False, True])
+    @mock.patch('slam.cli.os.mkdir')
+    @mock.patch('slam.cli._generate_lambda_handler')
+    @mock.patch('slam.cli._run_command')
+    @mock.patch('slam.cli.build_package')
+    @mock.patch('slam.cli.shutil.rmtree')
+    def test_build_plugin_files(self, rmtree, build_package, _run_command,
+                                _generate_lambda_handler, mkdir, exists):
+        plugin = mock.MagicMock()
+        plugin.build.return_value = ['.slam/foo.py']
+        other_plugin = mock.MagicMock()
+        config = {'requirements': 'requirements.txt', 'foo': {}}
+        saved_venv = os.environ.get('VIRTUAL_ENV')
+        if 'VIRTUAL_ENV' in os.environ:
+            del os.environ['VIRTUAL_ENV']
+        with mock.patch.dict('slam.cli.plugins',
+                             {'foo': plugin, 'bar': other_plugin},
+                             clear=True):
+            pkg = cli._build(config)
+        if saved_venv:
+            os.environ['VIRTUAL_ENV'] = saved_venv
+        plugin.build.assert_called_once_with(config)
+        other_plugin.build.assert_not_called()
+        build_package.assert_called_once_with(
+            '.', 'requirements.txt', virtualenv='.slam/venv',
+            extra_files=['.slam/handler.py', '.slam/foo.py'],
+            ignore=[r'\.slam\/venv\/.*$', r'\.pyc$'], zipfile_name=pkg)
+
     @mock.patch('slam.cli.os.path.exists', side_effect=[False, False, True])
     @mock.patch('slam.cli.os.mkdir')
     @mock.patch('slam.cli._generate_lambda_handler')
@@ -1,4 +1,5 @@
 from copy import deepcopy
+import json
 import mock
 import unittest
 
@@ -68,6 +69,129 @@ class CloudformationTests(unittest.TestCase):
             resources['FunctionExecutionRole']['Properties']['Policies'],
             [{'foo': 'bar'}])
 
+    def test_resources_tracing(self):
+        cfg = deepcopy(config)
+        resources = cfn._get_cfn_resources(cfg)
+        self.assertNotIn('TracingConfig', resources['Function']['Properties'])
+
+        cfg['aws']['tracing'] = 'active'
+        resources = cfn._get_cfn_resources(cfg)
+        self.assertEqual(resources['Function']['Properties']['TracingConfig'],
+                         {'Mode': 'Active'})
+        self.assertIn(
+            'arn:aws:iam::aws:policy/AWSXRayDaemonWriteAccess',
+            resources['FunctionExecutionRole']['Properties']
+            ['ManagedPolicyArns'])
+
+        cfg['aws']['tracing'] = 'passthrough'
+        resources = cfn._get_cfn_resources(cfg)
+        self.assertEqual(resources['Function']['Properties']['TracingConfig'],
+                         {'Mode': 'PassThrough'})
+
+        cfg['aws']['tracing'] = 'foo'
+        self.assertRaises(ValueError, cfn._get_cfn_resources, cfg)
+
+    def test_resources_concurrency(self):
+        cfg = deepcopy(config)
+        resources = cfn._get_cfn_resources(cfg)
+        self.assertNotIn('ReservedConcurrentExecutions',
+                         resources['Function']['Properties'])
+        self.assertNotIn('ProvisionedConcurrencyConfig',
+                         resources['ProdFunctionAlias']['Properties'])
+
+        cfg['aws']['reserved_concurrency'] = 100
+        cfg['aws']['provisioned_concurrency'] = {
+            'staging': 1,
+            'prod': {'concurrency': 5, 'schedule': [
+                {'schedule': 'cron(0 8 * * ? *)', 'min': 10, 'max': 20,
+                 'timezone': 'Europe/Dublin'},
+                {'schedule': 'cron(0 20 * * ? *)', 'min': 5}]}}
+        resources = cfn._get_cfn_resources(cfg)
+        self.assertEqual(
+            resources['Function']['Properties'][
+                'ReservedConcurrentExecutions'], 100)
+        self.assertNotIn('ProvisionedConcurrencyConfig',
+                         resources['DevFunctionAlias']['Properties'])
+        self.assertEqual(
+            resources['StagingFunctionAlias']['Properties'][
+                'ProvisionedConcurrencyConfig'],
+            {'Fn::If': ['StagingVersionPublished',
+                        {'ProvisionedConcurrentExecutions': 1},
+                        {'Ref': 'AWS::NoValue'}]})
+        self.assertNotIn('StagingProvisionedConcurrencyScalableTarget',
+                         resources)
+        self.assertEqual(
+            resources['ProdFunctionAlias']['Properties'][
+                'ProvisionedConcurrencyConfig'],
+            {'Fn::If': ['ProdVersionPublished',
+                        {'ProvisionedConcurrentExecutions': 5},
+                        {'Ref': 'AWS::NoValue'}]})
+        target = resources['ProdProvisionedConcurrencyScalableTarget']
+        self.assertEqual(target['DependsOn'], 'ProdFunctionAlias')
+        self.assertEqual(target['Condition'], 'ProdVersionPublished')
+        self.assertEqual(target['Properties'], {
+            'ServiceNamespace': 'lambda',
+            'ScalableDimension': 'lambda:function:ProvisionedConcurrency',
+            'ResourceId': {'Fn::Join': ['', ['function:',
+                                             {'Ref': 'Function'}, ':prod']]},
+            'MinCapacity': 5,
+            'MaxCapacity': 20,
+            'ScheduledActions': [
+                {'ScheduledActionName': 'prod-provisioned-concurrency-1',
+                 'Schedule': 'cron(0 8 * * ? *)',
+                 'ScalableTargetAction': {'MinCapacity': 10,
+                                          'MaxCapacity': 20},
+                 'Timezone': 'Europe/Dublin'},
+                {'ScheduledActionName': 'prod-provisioned-concurrency-2',
+                 'Schedule': 'cron(0 20 * * ? *)',
+                 'ScalableTargetAction': {'MinCapacity': 5,
+                                          'MaxCapacity': 5}}]})
+
+    def test_conditions_concurrency(self):
+        cfg = deepcopy(config)
+        self.assertEqual(cfn._get_cfn_conditions(cfg), {})
+        self.assertNotIn('Conditions', json.loads(cfn.get_cfn_template(cfg)))
+
+        cfg['aws']['provisioned_concurrency'] = {'prod': 2}
+        self.assertEqual(cfn._get_cfn_conditions(cfg), {
+            'ProdVersionPublished': {'Fn::Not': [{'Fn::Equals': [
+                {'Ref': 'ProdVersion'}, '$LATEST']}]}})
+        tpl = json.loads(cfn.get_cfn_template(cfg))
+        self.assertEqual(list(tpl['Conditions'].keys()),
+                         ['ProdVersionPublished'])
+
+    def test_resources_invalid_concurrency(self):
+        cfg = deepcopy(config)
+        cfg['aws']['provisioned_concurrency'] = {'prod': 'foo'}
+        self.assertRaises(ValueError, cfn._get_cfn_resources, cfg)
+        cfg['aws']['provisioned_concurrency'] = {'dev': 1}
+        self.assertRaises(ValueError, cfn._get_cfn_resources, cfg)
+        cfg['aws']['provisioned_concurrency'] = {
+            'prod': {'concurrency': 1, 'schedule': [{'min': 2}]}}
+        self.assertRaises(ValueError, cfn._get_cfn_resources, cfg)
+
+    def test_resources_profiler(self):
+        cfg = deepcopy(config)
+        resources = cfn._get_cfn_resources(cfg)
+        self.assertEqual(
+            resources['FunctionExecutionRole']['Properties']['Policies'], [])
+
+        cfg['stage_environments']['prod'] = {'SLAM_PROFILE_RATE': '0.01'}
+        resources = cfn._get_cfn_resources(cfg)
+        policies = resources['FunctionExecutionRole']['Properties'][
+            'Policies']
+        self.assertEqual(len(policies), 1)
+        self.assertEqual(policies[0]['PolicyName'], 'SlamProfiles')
+        statement = policies[0]['PolicyDocument']['Statement'][0]
+        self.assertEqual(statement['Action'], ['s3:PutObject'])
+        self.assertEqual(statement['Resource'], {'Fn::Join': ['', [
+            'arn:aws:s3:::', {'Ref': 'LambdaS3Bucket'}, '/profiles/foo/*']]})
+
+        cfg['stage_environments']['prod'] = {'SLAM_PROFILE_RATE': '0'}
+        resources = cfn._get_cfn_resources(cfg)
+        self.assertEqual(
+            resources['FunctionExecutionRole']['Properties']['Policies'], [])
+
     def test_outputs(self):
         cfg = deepcopy(config)
         cfg['aws']['cfn_outputs'] = {'foo': 'bar'}
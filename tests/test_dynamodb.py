@@ -1,10 +1,21 @@
 from copy import deepcopy
 import mock
+import os
+import shutil
+import sys
+import tempfile
 import unittest
 
+import botocore
+import climax
+
 from slam.plugins import dynamodb
 from .test_deploy import config as deploy_config
 
+BUILTIN = '__builtin__'
+if sys.version_info >= (3, 0):
+    BUILTIN = 'builtins'
+
 config = deepcopy(deploy_config)
 config.update({'dynamodb_tables': dynamodb.init.func(config, 't1,t2')})
 
@@ -36,7 +47,8 @@ class DynamoDBTests(unittest.TestCase):
              'dynamodb:Scan',
              'dynamodb:UpdateItem',
              'dynamodb:DescribeTable'])
-        self.assertEqual(len(statement['Resource']), 6)  # 2 tables x 3 stages
+        # 2 tables x 3 stages, with their indexes
+        self.assertEqual(len(statement['Resource']), 12)
         tables = [r['Fn::Join'][1][5]['Ref'] for r in statement['Resource']]
         self.assertEqual(set(tables), {'DevT1DynamoDBTable',
                                        'DevT2DynamoDBTable',
@@ -44,6 +56,41 @@ class DynamoDBTests(unittest.TestCase):
                                        'StagingT2DynamoDBTable',
                                        'ProdT1DynamoDBTable',
                                        'ProdT2DynamoDBTable'})
+        suffixes = [r['Fn::Join'][1][6] for r in statement['Resource']]
+        self.assertEqual(suffixes.count(''), 6)
+        self.assertEqual(suffixes.count('/index/*'), 6)
+
+    def test_policies_actions(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['actions'] = 'batch'
+        cfg['dynamodb_tables']['t2']['actions'] = ['GetItem',
+                                                   'dynamodb:Query']
+        policies = dynamodb._get_dynamodb_policies(cfg)
+        statements = policies[0]['PolicyDocument']['Statement']
+        self.assertEqual(len(statements), 2)
+        actions = {}
+        for statement in statements:
+            for resource in statement['Resource']:
+                actions[resource['Fn::Join'][1][5]['Ref']] = \
+                    statement['Action']
+        self.assertEqual(actions['ProdT1DynamoDBTable'], [
+            'dynamodb:DeleteItem', 'dynamodb:GetItem', 'dynamodb:PutItem',
+            'dynamodb:Query', 'dynamodb:Scan', 'dynamodb:UpdateItem',
+            'dynamodb:DescribeTable', 'dynamodb:BatchGetItem',
+            'dynamodb:BatchWriteItem', 'dynamodb:ConditionCheckItem'])
+        self.assertEqual(actions['DevT2DynamoDBTable'], ['dynamodb:GetItem',
+                                                         'dynamodb:Query'])
+        for statement in statements:
+            self.assertEqual(len(statement['Resource']), 6)
+
+        cfg['dynamodb_tables']['t2']['actions'] = 'read_only'
+        statements = dynamodb._get_dynamodb_policies(cfg)[0][
+            'PolicyDocument']['Statement']
+        self.assertIn('dynamodb:BatchGetItem', statements[1]['Action'])
+        self.assertNotIn('dynamodb:PutItem', statements[1]['Action'])
+
+        cfg['dynamodb_tables']['t2']['actions'] = 'foo'
+        self.assertRaises(ValueError, dynamodb._get_dynamodb_policies, cfg)
 
     def test_key_schema(self):
         self.assertEqual(dynamodb._get_dynamodb_key_schema('foo'),
@@ -134,11 +181,192 @@ class DynamoDBTests(unittest.TestCase):
         _get_dynamodb_key_schema.assert_any_call('foo')
         _get_dynamodb_projection.assert_called_once_with('bar')
 
+    def test_pay_per_request(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['billing_mode'] = 'pay_per_request'
+        cfg['dynamodb_tables']['t1']['global_secondary_indexes'] = {
+            'index1': {'key': 'foo', 'project': 'all'}}
+        table = dynamodb._get_table_resource(cfg, 'dev', 't1')
+        self.assertEqual(table['Properties']['BillingMode'],
+                         'PAY_PER_REQUEST')
+        self.assertNotIn('ProvisionedThroughput', table['Properties'])
+        self.assertNotIn('ProvisionedThroughput',
+                         table['Properties']['GlobalSecondaryIndexes'][0])
+        self.assertEqual(
+            dynamodb._get_table_autoscaling_resources(cfg, 'dev', 't1'), {})
+
+    def test_invalid_billing_mode(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['billing_mode'] = 'foo'
+        self.assertRaises(ValueError, dynamodb._get_table_resource, cfg,
+                          'dev', 't1')
+        cfg['dynamodb_tables']['t1']['billing_mode'] = 'pay_per_request'
+        cfg['dynamodb_tables']['t1']['autoscaling'] = {'max_read': 10,
+                                                       'max_write': 10}
+        self.assertRaises(ValueError, dynamodb._get_table_resource, cfg,
+                          'dev', 't1')
+
+    def test_ttl_and_stream(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['ttl_attribute'] = 'expires'
+        cfg['dynamodb_tables']['t1']['stream'] = True
+        cfg['dynamodb_tables']['t2']['stream'] = 'keys_only'
+        table = dynamodb._get_table_resource(cfg, 'dev', 't1')
+        self.assertEqual(table['Properties']['TimeToLiveSpecification'],
+                         {'AttributeName': 'expires', 'Enabled': True})
+        self.assertEqual(table['Properties']['StreamSpecification'],
+                         {'StreamViewType': 'NEW_AND_OLD_IMAGES'})
+        table = dynamodb._get_table_resource(cfg, 'dev', 't2')
+        self.assertNotIn('TimeToLiveSpecification', table['Properties'])
+        self.assertEqual(table['Properties']['StreamSpecification'],
+                         {'StreamViewType': 'KEYS_ONLY'})
+        table = dynamodb._get_table_resource(config, 'dev', 't1')
+        self.assertNotIn('StreamSpecification', table['Properties'])
+
+        # streams without a handler are not sent to the function
+        self.assertEqual(dynamodb._get_stream_resources(cfg), {})
+        self.assertEqual(dynamodb._get_stream_policies(cfg), [])
+
+    def test_invalid_stream(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['stream'] = 'foo'
+        self.assertRaises(ValueError, dynamodb._get_table_resource, cfg,
+                          'dev', 't1')
+        cfg['dynamodb_tables']['t1']['stream'] = {
+            'starting_position': 'foo'}
+        self.assertRaises(ValueError, dynamodb._get_table_resource, cfg,
+                          'dev', 't1')
+
+    def test_stream_handler(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['stream'] = {
+            'view_type': 'new_image', 'handler': 'foo:bar',
+            'batch_size': 10, 'batching_window': 5,
+            'starting_position': 'trim_horizon'}
+        res = dynamodb._get_stream_resources(cfg)
+        self.assertEqual(list(res.keys()),
+                         ['DevT1StreamEventSourceMapping',
+                          'ProdT1StreamEventSourceMapping',
+                          'StagingT1StreamEventSourceMapping'])
+        self.assertEqual(res['ProdT1StreamEventSourceMapping'], {
+            'Type': 'AWS::Lambda::EventSourceMapping',
+            'DependsOn': 'FunctionExecutionRole',
+            'Properties': {
+                'EventSourceArn': {'Fn::GetAtt': ['ProdT1DynamoDBTable',
+                                                  'StreamArn']},
+                'FunctionName': {'Ref': 'ProdFunctionAlias'},
+                'BatchSize': 10,
+                'MaximumBatchingWindowInSeconds': 5,
+                'StartingPosition': 'TRIM_HORIZON'
+            }
+        })
+        policies = dynamodb._get_stream_policies(cfg)
+        self.assertEqual(len(policies), 1)
+        self.assertEqual(policies[0]['PolicyName'], 'DynamoDBStreamPolicy')
+        statement = policies[0]['PolicyDocument']['Statement'][0]
+        self.assertIn('dynamodb:GetRecords', statement['Action'])
+        self.assertEqual(len(statement['Resource']), 3)
+        self.assertEqual(
+            [r['Fn::Join'][1][6] for r in statement['Resource']],
+            ['/stream/*'] * 3)
+
+    def test_stream_handler_defaults(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t2']['stream'] = {'handler': 'foo:bar'}
+        res = dynamodb._get_stream_resources(cfg)
+        self.assertEqual(
+            res['DevT2StreamEventSourceMapping']['Properties'], {
+                'EventSourceArn': {'Fn::GetAtt': ['DevT2DynamoDBTable',
+                                                  'StreamArn']},
+                'FunctionName': {'Ref': 'DevFunctionAlias'},
+                'BatchSize': 100,
+                'MaximumBatchingWindowInSeconds': 0,
+                'StartingPosition': 'LATEST'
+            })
+
+    def test_autoscaling(self):
+        cfg = deepcopy(config)
+        table_config = cfg['dynamodb_tables']['t1']
+        del table_config['read_throughput']
+        del table_config['write_throughput']
+        table_config['autoscaling'] = {'min_read': 5, 'max_read': 100,
+                                       'min_write': 2, 'max_write': 50,
+                                       'target_utilization': 60}
+        table_config['global_secondary_indexes'] = {
+            'index1': {'key': 'foo', 'project': 'all'},
+            'index2': {'key': 'bar', 'project': 'all',
+                       'read_throughput': 3, 'write_throughput': 3,
+                       'autoscaling': None}}
+        table = dynamodb._get_table_resource(cfg, 'prod', 't1')
+        self.assertEqual(table['Properties']['ProvisionedThroughput'],
+                         {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 2})
+        indexes = {idx['IndexName']: idx for idx in
+                   table['Properties']['GlobalSecondaryIndexes']}
+        self.assertEqual(indexes['index1']['ProvisionedThroughput'],
+                         {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 2})
+        self.assertEqual(indexes['index2']['ProvisionedThroughput'],
+                         {'ReadCapacityUnits': 3, 'WriteCapacityUnits': 3})
+
+        res = dynamodb._get_table_autoscaling_resources(cfg, 'prod', 't1')
+        self.assertEqual(sorted(res.keys()), [
+            'ProdT1DynamoDBTableIndex1IndexReadScalableTarget',
+            'ProdT1DynamoDBTableIndex1IndexReadScalingPolicy',
+            'ProdT1DynamoDBTableIndex1IndexWriteScalableTarget',
+            'ProdT1DynamoDBTableIndex1IndexWriteScalingPolicy',
+            'ProdT1DynamoDBTableReadScalableTarget',
+            'ProdT1DynamoDBTableReadScalingPolicy',
+            'ProdT1DynamoDBTableWriteScalableTarget',
+            'ProdT1DynamoDBTableWriteScalingPolicy'])
+        self.assertEqual(res['ProdT1DynamoDBTableReadScalableTarget'], {
+            'Type': 'AWS::ApplicationAutoScaling::ScalableTarget',
+            'DependsOn': 'ProdT1DynamoDBTable',
+            'Properties': {
+                'ServiceNamespace': 'dynamodb',
+                'ScalableDimension': 'dynamodb:table:ReadCapacityUnits',
+                'ResourceId': 'table/prod.t1',
+                'MinCapacity': 5,
+                'MaxCapacity': 100
+            }
+        })
+        self.assertEqual(res['ProdT1DynamoDBTableWriteScalingPolicy'], {
+            'Type': 'AWS::ApplicationAutoScaling::ScalingPolicy',
+            'Properties': {
+                'PolicyName': 'table/prod.t1-write-scaling',
+                'PolicyType': 'TargetTrackingScaling',
+                'ScalingTargetId': {
+                    'Ref': 'ProdT1DynamoDBTableWriteScalableTarget'},
+                'TargetTrackingScalingPolicyConfiguration': {
+                    'TargetValue': 60.0,
+                    'PredefinedMetricSpecification': {
+                        'PredefinedMetricType':
+                            'DynamoDBWriteCapacityUtilization'
+                    }
+                }
+            }
+        })
+        target = res['ProdT1DynamoDBTableIndex1IndexWriteScalableTarget']
+        self.assertEqual(target['Properties']['ScalableDimension'],
+                         'dynamodb:index:WriteCapacityUnits')
+        self.assertEqual(target['Properties']['ResourceId'],
+                         'table/prod.t1/index/index1')
+        self.assertEqual(target['DependsOn'], 'ProdT1DynamoDBTable')
+
+    def test_autoscaling_missing_max(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['autoscaling'] = {'max_read': 10}
+        self.assertRaises(ValueError,
+                          dynamodb._get_table_autoscaling_resources, cfg,
+                          'dev', 't1')
+
     @mock.patch('slam.plugins.dynamodb._get_dynamodb_policies',
                 return_value=['policies'])
+    @mock.patch('slam.plugins.dynamodb._get_table_autoscaling_resources',
+                return_value={})
     @mock.patch('slam.plugins.dynamodb._get_table_resource',
                 return_value='resource')
-    def test_cfn_template(self, _get_table_resource, _get_dynamodb_policies):
+    def test_cfn_template(self, _get_table_resource,
+                          _get_table_autoscaling_resources,
+                          _get_dynamodb_policies):
         tpl = dynamodb.cfn_template(config, {'Resources': {
             'FunctionExecutionRole': {'Properties': {'Policies': ['foo']}}}})
         self.assertEqual(tpl, {'Resources': {
@@ -151,3 +379,969 @@ class DynamoDBTests(unittest.TestCase):
             'FunctionExecutionRole': {
                 'Properties': {'Policies': ['foo', 'policies']}}
         }})
+
+    def test_dax(self):
+        cfg = deepcopy(config)
+        self.assertEqual(dynamodb._get_dax_resources(cfg), {})
+        self.assertEqual(dynamodb._get_dax_policies(cfg), [])
+        self.assertEqual(dynamodb._get_dax_environment(cfg), {})
+
+        cfg['dynamodb_tables']['t1']['dax'] = {'node_type': 'dax.r5.large',
+                                               'nodes': 3, 'record_ttl': 1000}
+        self.assertRaises(ValueError, dynamodb._get_dax_resources, cfg)
+        cfg['aws']['lambda_subnet_ids'] = ['subnet1', 'subnet2']
+        cfg['aws']['lambda_security_groups'] = ['sg1']
+        res = dynamodb._get_dax_resources(cfg)
+        self.assertEqual(list(res.keys()), [
+            'DaxServiceRole', 'DaxSubnetGroup', 'DevT1DaxParameterGroup',
+            'DevT1DaxCluster', 'ProdT1DaxParameterGroup', 'ProdT1DaxCluster',
+            'StagingT1DaxParameterGroup', 'StagingT1DaxCluster'])
+        statement = res['DaxServiceRole']['Properties']['Policies'][0][
+            'PolicyDocument']['Statement'][0]
+        self.assertEqual(len(statement['Resource']), 6)
+        self.assertEqual(res['DaxSubnetGroup']['Properties']['SubnetIds'],
+                         ['subnet1', 'subnet2'])
+        self.assertEqual(
+            res['ProdT1DaxParameterGroup']['Properties'][
+                'ParameterNameValues'],
+            {'record-ttl-millis': '1000', 'query-ttl-millis': '300000'})
+        cluster = res['ProdT1DaxCluster']
+        self.assertEqual(cluster['DependsOn'], 'ProdT1DynamoDBTable')
+        self.assertEqual(cluster['Properties']['NodeType'], 'dax.r5.large')
+        self.assertEqual(cluster['Properties']['ReplicationFactor'], 3)
+        self.assertEqual(cluster['Properties']['IAMRoleARN'],
+                         {'Fn::GetAtt': ['DaxServiceRole', 'Arn']})
+        self.assertEqual(cluster['Properties']['SubnetGroupName'],
+                         {'Ref': 'DaxSubnetGroup'})
+        self.assertEqual(cluster['Properties']['ParameterGroupName'],
+                         {'Ref': 'ProdT1DaxParameterGroup'})
+        self.assertEqual(cluster['Properties']['SecurityGroupIds'], ['sg1'])
+
+        policies = dynamodb._get_dax_policies(cfg)
+        self.assertEqual(len(policies), 1)
+        statement = policies[0]['PolicyDocument']['Statement'][0]
+        self.assertIn('dax:GetItem', statement['Action'])
+        self.assertIn({'Fn::GetAtt': ['DevT1DaxCluster', 'Arn']},
+                      statement['Resource'])
+        self.assertEqual(len(statement['Resource']), 3)
+
+        self.assertEqual(dynamodb._get_dax_environment(cfg), {
+            'SLAM_DEV__DAX_ENDPOINT_T1': {'Fn::GetAtt': [
+                'DevT1DaxCluster', 'ClusterDiscoveryEndpointURL']},
+            'SLAM_PROD__DAX_ENDPOINT_T1': {'Fn::GetAtt': [
+                'ProdT1DaxCluster', 'ClusterDiscoveryEndpointURL']},
+            'SLAM_STAGING__DAX_ENDPOINT_T1': {'Fn::GetAtt': [
+                'StagingT1DaxCluster', 'ClusterDiscoveryEndpointURL']}})
+
+    def test_dax_endpoint_variable(self):
+        self.assertEqual(dynamodb._get_dax_endpoint_variable('my-table.x'),
+                         'DAX_ENDPOINT_MY_TABLE_X')
+
+    def test_cfn_template_stream(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t2']['stream'] = {'handler': 'foo:bar'}
+        tpl = dynamodb.cfn_template(cfg, {'Resources': {
+            'FunctionExecutionRole': {'Properties': {'Policies': []}}}})
+        res = tpl['Resources']
+        self.assertIn('DevT2StreamEventSourceMapping', res)
+        self.assertNotIn('DevT1StreamEventSourceMapping', res)
+        self.assertEqual(
+            res['DevT2DynamoDBTable']['Properties']['StreamSpecification'],
+            {'StreamViewType': 'NEW_AND_OLD_IMAGES'})
+        self.assertEqual(
+            [p['PolicyName'] for p in
+             res['FunctionExecutionRole']['Properties']['Policies']],
+            ['DynamoDBPolicy', 'DynamoDBStreamPolicy'])
+
+    def test_cfn_template_dax(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['dax'] = True
+        cfg['aws']['lambda_subnet_ids'] = ['subnet1']
+        tpl = dynamodb.cfn_template(cfg, {'Resources': {
+            'FunctionExecutionRole': {'Properties': {'Policies': []}},
+            'Function': {'Properties': {}}}})
+        res = tpl['Resources']
+        self.assertIn('DevT1DaxCluster', res)
+        self.assertNotIn('DevT2DaxCluster', res)
+        self.assertEqual(
+            res['DevT1DaxParameterGroup']['Properties'][
+                'ParameterNameValues'],
+            {'record-ttl-millis': '300000', 'query-ttl-millis': '300000'})
+        self.assertEqual(
+            [p['PolicyName'] for p in
+             res['FunctionExecutionRole']['Properties']['Policies']],
+            ['DynamoDBPolicy', 'DaxPolicy'])
+        self.assertEqual(
+            sorted(res['Function']['Properties']['Environment'][
+                'Variables'].keys()),
+            ['SLAM_DEV__DAX_ENDPOINT_T1', 'SLAM_PROD__DAX_ENDPOINT_T1',
+             'SLAM_STAGING__DAX_ENDPOINT_T1'])
+
+    def test_build(self):
+        cwd = os.getcwd()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.chdir(tmpdir)
+            os.mkdir('.slam')
+            self.assertEqual(dynamodb.build(config),
+                             ['.slam/slam_dynamodb.py'])
+            with open('.slam/slam_dynamodb.py') as f:
+                source = f.read()
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+        self.assertIn("\nTABLES = ['t1', 't2']\n", source)
+        self.assertIn('def put_items(', source)
+
+    def test_build_no_tables(self):
+        self.assertEqual(dynamodb.build({'dynamodb_tables': {}}), [])
+
+    def test_create_table_args(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['ttl_attribute'] = 'expires'
+        cfg['dynamodb_tables']['t1']['stream'] = 'new_image'
+        args = dynamodb._get_create_table_args(cfg, 'dev', 't1')
+        self.assertEqual(args['TableName'], 'dev.t1')
+        self.assertEqual(args['KeySchema'],
+                         [{'AttributeName': 'id', 'KeyType': 'HASH'}])
+        self.assertEqual(args['StreamSpecification'],
+                         {'StreamViewType': 'NEW_IMAGE',
+                          'StreamEnabled': True})
+        self.assertNotIn('TimeToLiveSpecification', args)
+
+    def test_create_local_tables(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t2']['ttl_attribute'] = 'expires'
+        client = mock.MagicMock()
+        client.list_tables.return_value = {'TableNames': ['dev.t1']}
+        with mock.patch(BUILTIN + '.print') as mock_print:
+            dynamodb._create_local_tables(cfg, client, 'dev')
+        client.create_table.assert_called_once_with(
+            **dynamodb._get_create_table_args(cfg, 'dev', 't2'))
+        client.delete_table.assert_not_called()
+        client.update_time_to_live.assert_called_once_with(
+            TableName='dev.t2',
+            TimeToLiveSpecification={'AttributeName': 'expires',
+                                     'Enabled': True})
+        mock_print.assert_any_call('Table dev.t1 already exists.')
+        mock_print.assert_any_call('Table dev.t2 created.')
+
+    def test_recreate_local_tables(self):
+        client = mock.MagicMock()
+        client.list_tables.return_value = {'TableNames': ['dev.t1']}
+        with mock.patch(BUILTIN + '.print'):
+            dynamodb._create_local_tables(config, client, 'dev',
+                                          recreate=True)
+        client.delete_table.assert_called_once_with(TableName='dev.t1')
+        self.assertEqual(client.create_table.call_count, 2)
+        client.update_time_to_live.assert_not_called()
+
+    def test_bench_items(self):
+        table = {'attributes': {'id': 'S', 'name': 'S', 'age': 'N',
+                                'photo': 'B'},
+                 'key': ['id', 'name'],
+                 'global_secondary_indexes': {'i1': {'key': 'age'}}}
+        items = dynamodb._get_bench_items(table, 100)
+        self.assertEqual(len(items), 100)
+        for item in items:
+            self.assertEqual(sorted(item.keys()),
+                             ['age', 'id', 'name', 'photo'])
+            self.assertIn('S', item['id'])
+            self.assertIn('N', item['age'])
+            self.assertIn('B', item['photo'])
+        self.assertLessEqual(len(set(item['id']['S'] for item in items)), 10)
+        self.assertLessEqual(len(set(item['age']['N'] for item in items)), 10)
+        self.assertGreater(len(set(item['name']['S'] for item in items)), 10)
+
+        items = dynamodb._get_bench_items({'attributes': {'id': 'N'},
+                                           'key': 'id'}, 50)
+        self.assertGreater(len(set(item['id']['N'] for item in items)), 10)
+
+    def test_run_bench_operation(self):
+        error = botocore.exceptions.ClientError(
+            {'Error': {'Code': 'ProvisionedThroughputExceededException'}},
+            'PutItem')
+        calls = [mock.MagicMock(), mock.MagicMock(side_effect=error),
+                 mock.MagicMock()]
+        rv = dynamodb._run_bench_operation('PutItem', calls, 2)
+        self.assertEqual(rv['operation'], 'PutItem')
+        self.assertEqual(rv['count'], 3)
+        self.assertEqual(rv['errors'], 1)
+        self.assertEqual(len(rv['latencies']), 2)
+        for call in calls:
+            call.assert_called_once_with()
+
+    def test_bench_table(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1'].update({
+            'attributes': {'id': 'S', 'name': 'S', 'age': 'N'},
+            'key': ['id', 'name'],
+            'local_secondary_indexes': {'i1': {'key': ['id', 'age']}},
+            'global_secondary_indexes': {'i2': {'key': 'age'}}})
+        client = mock.MagicMock()
+        results = dynamodb._bench_table(cfg, client, 'dev', 't1', 20, 4)
+        self.assertEqual([rv['operation'] for rv in results],
+                         ['PutItem', 'GetItem', 'Query', 'Query i1',
+                          'Query i2'])
+        self.assertEqual(client.put_item.call_count, 20)
+        self.assertEqual(client.get_item.call_count, 20)
+        self.assertEqual(client.query.call_count, 60)
+        key = client.get_item.call_args[1]['Key']
+        self.assertEqual(sorted(key.keys()), ['id', 'name'])
+        kwargs = client.query.call_args[1]
+        self.assertEqual(kwargs['TableName'], 'dev.t1')
+        self.assertEqual(kwargs['IndexName'], 'i2')
+        self.assertEqual(kwargs['ExpressionAttributeNames'], {'#k': 'age'})
+
+    @mock.patch('slam.plugins.dynamodb.boto3.client')
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_local_command(self, _load_config, client):
+        client.return_value.list_tables.return_value = {'TableNames': []}
+        with mock.patch(BUILTIN + '.print'):
+            dynamodb.local(endpoint='http://localhost:9000', stage='prod',
+                           docker=False, recreate=False,
+                           config_file='slam.yaml')
+        client.assert_called_once_with('dynamodb',
+                                       endpoint_url='http://localhost:9000')
+        self.assertEqual(
+            [c[1]['TableName']
+             for c in client.return_value.create_table.call_args_list],
+            ['prod.t1', 'prod.t2'])
+
+    @mock.patch('slam.plugins.dynamodb._print_bench_report')
+    @mock.patch('slam.plugins.dynamodb._bench_table', return_value=['foo'])
+    @mock.patch('slam.plugins.dynamodb.boto3.client')
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_bench_command(self, _load_config, client, _bench_table,
+                           _print_bench_report):
+        dynamodb.bench(endpoint='http://localhost:8000', stage=None,
+                       table=None, items=10, concurrency=2,
+                       config_file='slam.yaml')
+        _bench_table.assert_any_call(config, client.return_value, 'dev',
+                                     't1', 10, 2)
+        _bench_table.assert_any_call(config, client.return_value, 'dev',
+                                     't2', 10, 2)
+        _print_bench_report.assert_called_with('dev.t2', ['foo'])
+
+        _bench_table.reset_mock()
+        dynamodb.bench(endpoint='http://localhost:8000', stage='prod',
+                       table='t1', items=10, concurrency=2,
+                       config_file='slam.yaml')
+        _bench_table.assert_called_once_with(config, client.return_value,
+                                             'prod', 't1', 10, 2)
+        self.assertRaises(ValueError, dynamodb.bench,
+                          endpoint='http://localhost:8000', stage=None,
+                          table='t3', items=10, concurrency=2,
+                          config_file='slam.yaml')
+
+    def test_print_bench_report(self):
+        with mock.patch(BUILTIN + '.print') as mock_print:
+            dynamodb._print_bench_report('dev.t1', [
+                {'operation': 'PutItem', 'count': 4, 'errors': 0,
+                 'elapsed': 2.0, 'latencies': [1.0, 2.0, 3.0, 4.0]},
+                {'operation': 'GetItem', 'count': 1, 'errors': 1,
+                 'elapsed': 0.0, 'latencies': []}])
+        lines = [c[0][0] for c in mock_print.call_args_list]
+        self.assertEqual(lines[0], 'Table dev.t1')
+        self.assertEqual(lines[2].split(), ['PutItem', '4', '0', '2.0',
+                                            '2.50', 'ms', '3.00', 'ms',
+                                            '4.00', 'ms'])
+        self.assertEqual(lines[3].split()[:4], ['GetItem', '1', '1', '0.0'])
+
+    def test_register_commands(self):
+        @climax.group()
+        def main():
+            return {'config_file': 'slam.yaml'}
+
+        dynamodb.register_commands(main)
+        with mock.patch('slam.cli._load_config', return_value=config), \
+                mock.patch('slam.plugins.dynamodb._create_local_tables') \
+                as _create_local_tables, \
+                mock.patch('slam.plugins.dynamodb.boto3.client') as client:
+            main(['dynamodb', 'local', '--stage', 'prod'])
+        _create_local_tables.assert_called_once_with(
+            config, client.return_value, 'prod', recreate=False)
+
+    def test_contributor_insights(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['contributor_insights'] = True
+        cfg['dynamodb_tables']['t1']['global_secondary_indexes'] = {
+            'i1': {'key': 'id'}}
+        table = dynamodb._get_table_resource(cfg, 'dev', 't1')
+        self.assertEqual(
+            table['Properties']['ContributorInsightsSpecification'],
+            {'Enabled': True})
+        self.assertEqual(table['Properties']['GlobalSecondaryIndexes'][0][
+            'ContributorInsightsSpecification'], {'Enabled': True})
+        args = dynamodb._get_create_table_args(cfg, 'dev', 't1')
+        self.assertNotIn('ContributorInsightsSpecification', args)
+        self.assertNotIn('ContributorInsightsSpecification',
+                         args['GlobalSecondaryIndexes'][0])
+        table = dynamodb._get_table_resource(config, 'dev', 't1')
+        self.assertNotIn('ContributorInsightsSpecification',
+                         table['Properties'])
+
+    def test_capacity_targets(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['global_secondary_indexes'] = {
+            'i1': {'key': 'id', 'read_throughput': 3}}
+        cfg['dynamodb_tables']['t2'] = {'billing_mode': 'pay_per_request'}
+        targets = dynamodb._get_capacity_targets(cfg, 'prod')
+        self.assertEqual(targets, [
+            {'name': 't1', 'table_name': 'prod.t1', 'index': None,
+             'on_demand': False, 'autoscaling': None,
+             'throughput': {'ReadCapacityUnits': 1,
+                            'WriteCapacityUnits': 1}},
+            {'name': 't1', 'table_name': 'prod.t1', 'index': 'i1',
+             'on_demand': False, 'autoscaling': None,
+             'throughput': {'ReadCapacityUnits': 3,
+                            'WriteCapacityUnits': 1}},
+            {'name': 't2', 'table_name': 'prod.t2', 'index': None,
+             'on_demand': True, 'autoscaling': None, 'throughput': None}])
+
+    def test_metrics_resolution(self):
+        self.assertEqual(dynamodb._get_metrics_resolution(0, 86400), 60)
+        self.assertEqual(dynamodb._get_metrics_resolution(0, 7 * 86400),
+                         300)
+        self.assertEqual(dynamodb._get_metrics_resolution(0, 30 * 86400),
+                         3600)
+
+    def test_capacity_metrics(self):
+        targets = [{'table_name': 'prod.t1', 'index': None},
+                   {'table_name': 'prod.t1', 'index': 'i1'}]
+        cloudwatch = mock.MagicMock()
+        cloudwatch.get_metric_data.side_effect = [
+            {'MetricDataResults': [
+                {'Id': 'm0_read', 'Values': [600, 1200]},
+                {'Id': 'm0_write', 'Values': [60]},
+                {'Id': 'm0_read_throttles', 'Values': [2, 3]},
+                {'Id': 'm0_write_throttles', 'Values': []}],
+             'NextToken': 'token'},
+            {'MetricDataResults': [
+                {'Id': 'm0_read', 'Values': [300]},
+                {'Id': 'm1_read', 'Values': [120]},
+                {'Id': 'm1_write', 'Values': []},
+                {'Id': 'm1_read_throttles', 'Values': []},
+                {'Id': 'm1_write_throttles', 'Values': [1]}]}]
+        metrics = dynamodb._get_capacity_metrics(cloudwatch, targets, 0, 3600)
+        self.assertEqual(metrics, [
+            {'read_avg': 2100 / 3600.0, 'read_peak': 20.0,
+             'write_avg': 60 / 3600.0,
+             'write_peak': 1.0, 'read_throttles': 5, 'write_throttles': 0},
+            {'read_avg': 120 / 3600.0, 'read_peak': 2.0, 'write_avg': 0.0,
+             'write_peak': 0.0, 'read_throttles': 0, 'write_throttles': 1}])
+        kwargs = cloudwatch.get_metric_data.call_args_list[0][1]
+        self.assertEqual(len(kwargs['MetricDataQueries']), 8)
+        query = kwargs['MetricDataQueries'][5]
+        self.assertEqual(query['Id'], 'm1_write')
+        self.assertEqual(query['MetricStat']['Metric'], {
+            'Namespace': 'AWS/DynamoDB',
+            'MetricName': 'ConsumedWriteCapacityUnits',
+            'Dimensions': [{'Name': 'TableName', 'Value': 'prod.t1'},
+                           {'Name': 'GlobalSecondaryIndexName',
+                            'Value': 'i1'}]})
+        self.assertEqual(query['MetricStat']['Period'], 60)
+        self.assertNotIn('NextToken', kwargs)
+        self.assertEqual(
+            cloudwatch.get_metric_data.call_args_list[1][1]['NextToken'],
+            'token')
+
+    def _metrics(self, **kwargs):
+        metrics = {'read_avg': 0.0, 'read_peak': 0.0, 'write_avg': 0.0,
+                   'write_peak': 0.0, 'read_throttles': 0,
+                   'write_throttles': 0}
+        metrics.update(kwargs)
+        return metrics
+
+    def test_capacity_suggestions_provisioned(self):
+        target = {'index': None, 'on_demand': False, 'autoscaling': None,
+                  'throughput': {'ReadCapacityUnits': 10,
+                                 'WriteCapacityUnits': 40}}
+        suggestions = dynamodb._get_capacity_suggestions(
+            target, self._metrics(read_avg=10.0, read_peak=14.0,
+                                  write_avg=5.0, write_peak=10.0,
+                                  read_throttles=3))
+        self.assertEqual(suggestions, [
+            'Increase read_throughput from 10 to 20, the peak was 14.00 '
+            'units/s with 3 throttled requests.',
+            'Decrease write_throughput from 40 to 15, the peak was 10.00 '
+            'units/s.'])
+
+        suggestions = dynamodb._get_capacity_suggestions(
+            target, self._metrics(read_avg=5.0, read_peak=6.0,
+                                  write_avg=25.0, write_peak=27.0,
+                                  write_throttles=2))
+        self.assertEqual(suggestions, [
+            '2 write requests were throttled while the average capacity was '
+            'within write_throughput, the traffic may come in short bursts '
+            'or be concentrated on a few keys.'])
+
+    def test_capacity_suggestions_spiky(self):
+        target = {'index': None, 'on_demand': False, 'autoscaling': None,
+                  'throughput': {'ReadCapacityUnits': 100,
+                                 'WriteCapacityUnits': 100}}
+        suggestions = dynamodb._get_capacity_suggestions(
+            target, self._metrics(read_avg=0.01, read_peak=70.0,
+                                  write_avg=0.01, write_peak=70.0))
+        self.assertEqual(len(suggestions), 1)
+        self.assertTrue(suggestions[0].startswith(
+            'Traffic is too low or spiky for provisioned capacity: use '
+            'billing_mode "pay_per_request"'))
+
+    def test_capacity_suggestions_autoscaling(self):
+        target = {'index': 'i1', 'on_demand': False,
+                  'autoscaling': {'max_read': 10, 'max_write': 100},
+                  'throughput': {'ReadCapacityUnits': 1,
+                                 'WriteCapacityUnits': 1}}
+        suggestions = dynamodb._get_capacity_suggestions(
+            target, self._metrics(read_avg=5.0, read_peak=14.0,
+                                  write_avg=5.0, write_peak=7.0,
+                                  write_throttles=4))
+        self.assertEqual(suggestions, [
+            'Increase global_secondary_indexes.i1.autoscaling.max_read to '
+            '20, the peak was 14.00 units/s.',
+            '4 write requests were throttled while auto scaling adjusted '
+            'the capacity, increase '
+            'global_secondary_indexes.i1.autoscaling.min_write to absorb '
+            'sudden spikes.'])
+
+    def test_capacity_suggestions_on_demand(self):
+        target = {'index': None, 'on_demand': True, 'autoscaling': None,
+                  'throughput': None}
+        suggestions = dynamodb._get_capacity_suggestions(
+            target, self._metrics(read_avg=50.0, read_peak=60.0,
+                                  write_avg=10.0, write_peak=12.0))
+        self.assertEqual(suggestions, [
+            'Traffic is steady enough for provisioned capacity: use '
+            'billing_mode "provisioned" with read_throughput 86 and '
+            'write_throughput 18 ($16.47/month instead of $64.80/month).'])
+        self.assertEqual(dynamodb._get_capacity_suggestions(
+            target, self._metrics(read_avg=0.01, read_peak=60.0)), [])
+
+    def test_hot_keys(self):
+        cloudwatch = mock.MagicMock()
+        cloudwatch.describe_insight_rules.side_effect = [
+            {'InsightRules': [
+                {'Name': 'DynamoDBContributorInsights-PKC-prod.t1-123'},
+                {'Name': 'DynamoDBContributorInsights-SKC-prod.t1-123'}],
+             'NextToken': 'token'},
+            {'InsightRules': [
+                {'Name': 'DynamoDBContributorInsights-PKT-prod.t1-123'},
+                {'Name': 'DynamoDBContributorInsights-PKC-prod.t2-123'},
+                {'Name': 'my-rule'}]}]
+        cloudwatch.get_insight_rule_report.side_effect = [
+            {'AggregateValue': 100.0, 'Contributors': [
+                {'Keys': ['a'], 'ApproximateAggregateValue': 50.0},
+                {'Keys': ['b'], 'ApproximateAggregateValue': 5.0}]},
+            {'AggregateValue': 0.0, 'Contributors': []}]
+        hot_keys = dynamodb._get_hot_keys(cloudwatch, 'prod.t1', 0, 3600)
+        self.assertEqual(hot_keys, {'accessed': [('a', 50.0, 0.5),
+                                                 ('b', 5.0, 0.05)],
+                                    'throttled': []})
+        cloudwatch.describe_insight_rules.assert_called_with(
+            NextToken='token')
+        kwargs = cloudwatch.get_insight_rule_report.call_args_list[0][1]
+        self.assertEqual(kwargs['RuleName'],
+                         'DynamoDBContributorInsights-PKC-prod.t1-123')
+        self.assertEqual(kwargs['Period'], 60)
+        self.assertEqual(kwargs['MaxContributorCount'], 5)
+
+    def test_hot_key_suggestions(self):
+        self.assertEqual(dynamodb._get_hot_key_suggestions({}), [])
+        suggestions = dynamodb._get_hot_key_suggestions({
+            'accessed': [('a', 50.0, 0.5), ('b', 5.0, 0.05)],
+            'throttled': [('a', 10.0, 0.9), ('c', 1.0, 0.1)]})
+        self.assertEqual(suggestions, [
+            'Partition key a receives 50% of the requests, consider a key '
+            'schema with more distinct partition keys, or spreading this '
+            'key over several partitions with a suffix.',
+            'Requests were throttled on partition keys a, c.'])
+
+    def test_print_capacity_report(self):
+        target = {'index': None, 'table_name': 'prod.t1', 'on_demand': False,
+                  'autoscaling': None,
+                  'throughput': {'ReadCapacityUnits': 5,
+                                 'WriteCapacityUnits': 2}}
+        with mock.patch(BUILTIN + '.print') as mock_print:
+            dynamodb._print_capacity_report(
+                target, self._metrics(read_avg=1.0, read_peak=2.5,
+                                      read_throttles=3),
+                ['foo'], {'accessed': [('a', 50.0, 0.5)]})
+        self.assertEqual([c[0][0] for c in mock_print.call_args_list], [
+            'Table prod.t1 (provisioned: 5 read, 2 write)',
+            '  Read: avg 1.00 units/s, peak 2.50 units/s, 3 throttled',
+            '  Write: avg 0.00 units/s, peak 0.00 units/s, 0 throttled',
+            '  Most accessed keys:',
+            '    a (50, 50%)',
+            '  - foo'])
+
+        target.update({'index': 'i1', 'on_demand': True})
+        with mock.patch(BUILTIN + '.print') as mock_print:
+            dynamodb._print_capacity_report(target, self._metrics(), [])
+        self.assertEqual(mock_print.call_args_list[0][0][0],
+                         '  Index i1 (pay per request)')
+
+    @mock.patch('slam.plugins.dynamodb._print_capacity_report')
+    @mock.patch('slam.plugins.dynamodb._get_hot_keys',
+                return_value={'accessed': [('a', 50.0, 0.5)]})
+    @mock.patch('slam.plugins.dynamodb._get_capacity_metrics')
+    @mock.patch('slam.plugins.dynamodb.boto3.client')
+    @mock.patch('slam.cli._load_config')
+    def test_report_command(self, _load_config, client,
+                            _get_capacity_metrics, _get_hot_keys,
+                            _print_capacity_report):
+        cfg = deepcopy(config)
+        del cfg['dynamodb_tables']['t2']
+        cfg['dynamodb_tables']['t1']['global_secondary_indexes'] = {
+            'i1': {'key': 'id'}}
+        _load_config.return_value = cfg
+        _get_capacity_metrics.return_value = [self._metrics(),
+                                              self._metrics()]
+        dynamodb.report(stage='prod', period='1d', hot_keys=True,
+                        config_file='slam.yaml')
+        client.assert_called_once_with('cloudwatch')
+        targets = _get_capacity_metrics.call_args[0][1]
+        self.assertEqual([t['index'] for t in targets], [None, 'i1'])
+        start, end = _get_capacity_metrics.call_args[0][2:]
+        self.assertAlmostEqual(end - start, 86400, delta=10)
+        _get_hot_keys.assert_called_once_with(client.return_value,
+                                              'prod.t1', start, end)
+        self.assertEqual(_print_capacity_report.call_count, 2)
+        args = _print_capacity_report.call_args_list[0][0]
+        self.assertEqual(args[2][-1][:22], 'Partition key a receiv')
+        self.assertEqual(args[3], {'accessed': [('a', 50.0, 0.5)]})
+        self.assertIsNone(_print_capacity_report.call_args_list[1][0][3])
+
+    def test_global_table(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1'].update({
+            'replicas': ['eu-west-1', 'ap-southeast-2'],
+            'read_throughput': 5, 'write_throughput': 3,
+            'ttl_attribute': 'expires',
+            'global_secondary_indexes': {
+                'i1': {'key': 'id', 'read_throughput': 2,
+                       'write_throughput': 4}}})
+        table = dynamodb._get_table_resource(cfg, 'prod', 't1')
+        self.assertEqual(table['Type'], 'AWS::DynamoDB::GlobalTable')
+        props = table['Properties']
+        self.assertEqual(props['TableName'], 'prod.t1')
+        self.assertNotIn('ProvisionedThroughput', props)
+        self.assertEqual(props['BillingMode'], 'PROVISIONED')
+        self.assertEqual(props['StreamSpecification'],
+                         {'StreamViewType': 'NEW_AND_OLD_IMAGES'})
+        self.assertEqual(props['TimeToLiveSpecification'],
+                         {'AttributeName': 'expires', 'Enabled': True})
+        self.assertEqual(props['WriteProvisionedThroughputSettings'], {
+            'WriteCapacityAutoScalingSettings': {
+                'MinCapacity': 3, 'MaxCapacity': 3,
+                'TargetTrackingScalingPolicyConfiguration': {
+                    'TargetValue': 70.0}}})
+        self.assertEqual(props['GlobalSecondaryIndexes'], [{
+            'IndexName': 'i1',
+            'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            'Projection': {'ProjectionType': 'KEYS_ONLY'},
+            'WriteProvisionedThroughputSettings': {
+                'WriteCapacityAutoScalingSettings': {
+                    'MinCapacity': 4, 'MaxCapacity': 4,
+                    'TargetTrackingScalingPolicyConfiguration': {
+                        'TargetValue': 70.0}}}}])
+        replica = {
+            'ReadProvisionedThroughputSettings': {'ReadCapacityUnits': 5},
+            'GlobalSecondaryIndexes': [{
+                'IndexName': 'i1',
+                'ReadProvisionedThroughputSettings': {
+                    'ReadCapacityUnits': 2}}]}
+        self.assertEqual(props['Replicas'], [
+            dict(replica, Region={'Ref': 'AWS::Region'}),
+            dict(replica, Region='eu-west-1'),
+            dict(replica, Region='ap-southeast-2')])
+        self.assertEqual(
+            dynamodb._get_table_autoscaling_resources(cfg, 'prod', 't1'), {})
+
+        # local tables are created as regular tables
+        args = dynamodb._get_create_table_args(cfg, 'prod', 't1')
+        self.assertNotIn('Replicas', args)
+        self.assertEqual(args['ProvisionedThroughput'],
+                         {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 3})
+
+    def test_global_table_autoscaling(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1'].update({
+            'replicas': ['eu-west-1'], 'contributor_insights': True,
+            'autoscaling': {'min_read': 2, 'max_read': 20, 'max_write': 10,
+                            'target_utilization': 50},
+            'global_secondary_indexes': {'i1': {'key': 'id'},
+                                         'i2': {'key': 'id',
+                                                'autoscaling': None,
+                                                'read_throughput': 3}}})
+        props = dynamodb._get_table_resource(cfg, 'dev', 't1')['Properties']
+        self.assertEqual(props['WriteProvisionedThroughputSettings'], {
+            'WriteCapacityAutoScalingSettings': {
+                'MinCapacity': 1, 'MaxCapacity': 10,
+                'TargetTrackingScalingPolicyConfiguration': {
+                    'TargetValue': 50.0}}})
+        replica = props['Replicas'][1]
+        self.assertEqual(replica['Region'], 'eu-west-1')
+        self.assertEqual(replica['ReadProvisionedThroughputSettings'], {
+            'ReadCapacityAutoScalingSettings': {
+                'MinCapacity': 2, 'MaxCapacity': 20,
+                'TargetTrackingScalingPolicyConfiguration': {
+                    'TargetValue': 50.0}}})
+        self.assertEqual(replica['ContributorInsightsSpecification'],
+                         {'Enabled': True})
+        indexes = {idx['IndexName']: idx
+                   for idx in replica['GlobalSecondaryIndexes']}
+        self.assertEqual(
+            indexes['i1']['ReadProvisionedThroughputSettings'],
+            replica['ReadProvisionedThroughputSettings'])
+        self.assertEqual(indexes['i2']['ReadProvisionedThroughputSettings'],
+                         {'ReadCapacityUnits': 3})
+        self.assertEqual(indexes['i2']['ContributorInsightsSpecification'],
+                         {'Enabled': True})
+        for idx in props['GlobalSecondaryIndexes']:
+            self.assertNotIn('ContributorInsightsSpecification', idx)
+
+    def test_global_table_on_demand(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1'].update({
+            'replicas': ['eu-west-1'], 'billing_mode': 'pay_per_request',
+            'stream': {'handler': 'foo:bar'}})
+        props = dynamodb._get_table_resource(cfg, 'dev', 't1')['Properties']
+        self.assertEqual(props['BillingMode'], 'PAY_PER_REQUEST')
+        self.assertNotIn('WriteProvisionedThroughputSettings', props)
+        self.assertEqual(props['Replicas'], [
+            {'Region': {'Ref': 'AWS::Region'}}, {'Region': 'eu-west-1'}])
+
+    def test_invalid_global_table(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['replicas'] = 'eu-west-1'
+        self.assertRaises(ValueError, dynamodb._get_table_resource, cfg,
+                          'dev', 't1')
+        cfg['dynamodb_tables']['t1']['replicas'] = ['eu-west-1']
+        cfg['dynamodb_tables']['t1']['stream'] = 'keys_only'
+        self.assertRaises(ValueError, dynamodb._get_table_resource, cfg,
+                          'dev', 't1')
+        cfg['dynamodb_tables']['t1']['stream'] = True
+        cfg['dynamodb_tables']['t1']['autoscaling'] = {'max_read': 10}
+        self.assertRaises(ValueError, dynamodb._get_table_resource, cfg,
+                          'dev', 't1')
+
+    def test_table_config(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1'].update({
+            'global_secondary_indexes': {
+                'i1': {'key': 'id', 'project': 'all', 'read_throughput': 1},
+                'i2': {'key': 'id'}},
+            'autoscaling': {'max_read': 10, 'max_write': 10},
+            'stages': {
+                'prod': {
+                    'read_throughput': 50,
+                    'billing_mode': 'provisioned',
+                    'global_secondary_indexes': {
+                        'i1': {'read_throughput': 20},
+                        'i3': {'key': 'id'}},
+                    'autoscaling': {'max_read': 100}},
+                'dev': {'autoscaling': None}}})
+        table = dynamodb._get_table_config(cfg, 'prod', 't1')
+        self.assertEqual(table, {
+            'attributes': {'id': 'S'},
+            'key': 'id',
+            'read_throughput': 50,
+            'write_throughput': 1,
+            'billing_mode': 'provisioned',
+            'global_secondary_indexes': {
+                'i1': {'key': 'id', 'project': 'all', 'read_throughput': 20},
+                'i2': {'key': 'id'},
+                'i3': {'key': 'id'}},
+            'autoscaling': {'max_read': 100, 'max_write': 10}})
+        table = dynamodb._get_table_config(cfg, 'dev', 't1')
+        self.assertIsNone(table['autoscaling'])
+        self.assertNotIn('stages', table)
+        table = dynamodb._get_table_config(cfg, 'staging', 't1')
+        self.assertEqual(table['autoscaling'], {'max_read': 10,
+                                                'max_write': 10})
+        self.assertEqual(table['read_throughput'], 1)
+
+        # the original configuration is not modified
+        self.assertEqual(
+            cfg['dynamodb_tables']['t1']['global_secondary_indexes']['i1'],
+            {'key': 'id', 'project': 'all', 'read_throughput': 1})
+
+        cfg['dynamodb_tables']['t1']['stages']['foo'] = {}
+        self.assertRaises(ValueError, dynamodb._get_table_config, cfg, 'dev',
+                          't1')
+
+    def test_stage_overrides(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['stages'] = {
+            'prod': {'read_throughput': 50, 'write_throughput': 20,
+                     'autoscaling': {'max_read': 500, 'max_write': 100}},
+            'dev': {'billing_mode': 'pay_per_request'}}
+        table = dynamodb._get_table_resource(cfg, 'prod', 't1')
+        self.assertEqual(table['Properties']['ProvisionedThroughput'],
+                         {'ReadCapacityUnits': 50, 'WriteCapacityUnits': 20})
+        table = dynamodb._get_table_resource(cfg, 'dev', 't1')
+        self.assertEqual(table['Properties']['BillingMode'],
+                         'PAY_PER_REQUEST')
+        table = dynamodb._get_table_resource(cfg, 'staging', 't1')
+        self.assertEqual(table['Properties']['ProvisionedThroughput'],
+                         {'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1})
+        self.assertEqual(
+            len(dynamodb._get_table_autoscaling_resources(cfg, 'prod', 't1')),
+            4)
+        self.assertEqual(
+            dynamodb._get_table_autoscaling_resources(cfg, 'staging', 't1'),
+            {})
+        targets = dynamodb._get_capacity_targets(cfg, 'dev')
+        self.assertTrue(targets[0]['on_demand'])
+        targets = dynamodb._get_capacity_targets(cfg, 'prod')
+        self.assertEqual(targets[0]['throughput'],
+                         {'ReadCapacityUnits': 50, 'WriteCapacityUnits': 20})
+
+    def test_stage_overrides_stream(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['stream'] = {'handler': 'foo:bar'}
+        cfg['dynamodb_tables']['t1']['stages'] = {
+            'prod': {'stream': {'batch_size': 500}},
+            'dev': {'stream': None}}
+        res = dynamodb._get_stream_resources(cfg)
+        self.assertEqual(list(res.keys()),
+                         ['ProdT1StreamEventSourceMapping',
+                          'StagingT1StreamEventSourceMapping'])
+        self.assertEqual(
+            res['ProdT1StreamEventSourceMapping']['Properties']['BatchSize'],
+            500)
+        self.assertEqual(
+            res['StagingT1StreamEventSourceMapping']['Properties'][
+                'BatchSize'], 100)
+
+    def _get_entities_config(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables'] = {'app': {
+            'attributes': {'pk': 'S', 'sk': 'S', 'gsi1pk': 'S',
+                           'gsi1sk': 'S', 'score': 'N'},
+            'key': ['pk', 'sk'],
+            'global_secondary_indexes': {
+                'gsi1': {'key': ['gsi1pk', 'gsi1sk']},
+                'by-score': {'key': ['gsi1pk', 'score']}},
+            'entities': {
+                'user': {'keys': {'pk': 'USER#{id}', 'sk': 'PROFILE',
+                                  'gsi1pk': 'EMAIL#{email}',
+                                  'gsi1sk': 'USER#{id}'}},
+                'order_item': {'keys': {'pk': 'USER#{user_id}',
+                                        'sk': 'ORDER#{date}#{order_id}',
+                                        'gsi1pk': 'ORDERS',
+                                        'score': '{total}'}}}}}
+        return cfg
+
+    def test_compile_key_template(self):
+        self.assertEqual(
+            dynamodb._compile_key_template('USER#{id}#{n}', 'S', 'user'),
+            [('USER#', 'id'), ('#', 'n')])
+        self.assertEqual(dynamodb._compile_key_template('PROFILE', 'S', 'u'),
+                         [('PROFILE', None)])
+        self.assertEqual(dynamodb._compile_key_template('{n}', 'N', 'u'),
+                         [('', 'n')])
+        for template in ['', 'USER#{', 'USER#{}', 'USER#{id:>4}',
+                         'USER#{id!r}', 'USER#{a.b}', 'USER#{class}',
+                         'USER#{limit}']:
+            self.assertRaises(ValueError, dynamodb._compile_key_template,
+                              template, 'S', 'user')
+        for template in ['N#{n}', 'N', '{a}{b}']:
+            self.assertRaises(ValueError, dynamodb._compile_key_template,
+                              template, 'N', 'user')
+
+    def test_get_key_expression(self):
+        self.assertEqual(
+            dynamodb._get_key_expression([('USER#', 'id'), ('#', 'n')], 'S'),
+            "u'USER#' + _text(id) + u'#' + _text(n)")
+        self.assertEqual(
+            dynamodb._get_key_expression([('', 'id')], 'S',
+                                         "attributes['{}']"),
+            "_text(attributes['id'])")
+        self.assertEqual(dynamodb._get_key_expression([('', 'n')], 'N'), 'n')
+
+    def test_get_entities(self):
+        entities = dynamodb._get_entities(self._get_entities_config())
+        self.assertEqual([e['class_name'] for e in entities],
+                         ['OrderItem', 'User'])
+        order, user = entities
+        self.assertEqual(order['key_fields'], ['user_id', 'date', 'order_id'])
+        self.assertEqual(user['key_fields'], ['id'])
+        self.assertEqual(user['primary_key'],
+                         [('pk', "u'USER#' + _text(id)"),
+                          ('sk', "u'PROFILE'")])
+        self.assertEqual([(k['attr'], k['fields'], k['primary'])
+                          for k in user['keys']],
+                         [('gsi1pk', ['email'], False),
+                          ('gsi1sk', ['id'], False),
+                          ('pk', ['id'], True),
+                          ('sk', [], True)])
+        self.assertEqual([(q['method'], q['index'], q['hash_fields'],
+                           q['range_attr'], q['range_fields'])
+                          for q in order['queries']],
+                         [('query', None, ['user_id'], 'sk',
+                           ['date', 'order_id']),
+                          ('query_by_score', 'by-score', [], None, []),
+                          ('query_gsi1', 'gsi1', [], None, [])])
+        self.assertEqual([(q['method'], q['range_attr'], q['range_fields'])
+                          for q in user['queries']],
+                         [('query', 'sk', []),
+                          ('query_by_score', None, []),
+                          ('query_gsi1', 'gsi1sk', ['id'])])
+
+    def test_get_entities_hash_only_table(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['entities'] = {
+            'user': {'keys': {'id': 'USER#{id}'}}}
+        entities = dynamodb._get_entities(cfg)
+        self.assertEqual(len(entities), 1)
+        self.assertEqual(entities[0]['queries'], [])
+
+    def test_get_entities_errors(self):
+        cfg = self._get_entities_config()
+        cfg['dynamodb_tables']['app']['entities']['user']['keys'][
+            'foo'] = 'FOO'
+        self.assertRaises(ValueError, dynamodb._get_entities, cfg)
+        cfg = self._get_entities_config()
+        del cfg['dynamodb_tables']['app']['entities']['user']['keys']['sk']
+        self.assertRaises(ValueError, dynamodb._get_entities, cfg)
+        cfg = self._get_entities_config()
+        cfg['dynamodb_tables']['app']['entities']['1user'] = \
+            cfg['dynamodb_tables']['app']['entities']['user']
+        self.assertRaises(ValueError, dynamodb._get_entities, cfg)
+
+    def test_build_entities(self):
+        cwd = os.getcwd()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.chdir(tmpdir)
+            os.mkdir('.slam')
+            self.assertEqual(dynamodb.build(self._get_entities_config()),
+                             ['.slam/slam_dynamodb.py',
+                              '.slam/slam_entities.py'])
+            with open('.slam/slam_entities.py') as f:
+                source = f.read()
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+        client = mock.MagicMock()
+        client.get_item.return_value = {'Item': {'pk': {'S': 'USER#1'}}}
+        client.query.side_effect = [
+            {'Items': [{'pk': {'S': 'USER#1'}}],
+             'LastEvaluatedKey': {'pk': {'S': 'USER#1'}}},
+            {'Items': [{'pk': {'S': 'USER#1'}}]}]
+        slam_dynamodb = mock.MagicMock()
+        slam_dynamodb.get_client.return_value = client
+        slam_dynamodb.table_name.side_effect = lambda name: 'dev.' + name
+        slam_dynamodb._serialize.side_effect = lambda item: item
+        slam_dynamodb._deserialize.side_effect = lambda item: item
+        module = {}
+        with mock.patch.dict(sys.modules, {'slam_dynamodb': slam_dynamodb}):
+            exec(compile(source, 'slam_entities.py', 'exec'), module)
+        User = module['User']
+        OrderItem = module['OrderItem']
+
+        self.assertEqual(User.key(1), {'pk': u'USER#1', 'sk': u'PROFILE'})
+        self.assertEqual(OrderItem.key('u', '2020', 3),
+                         {'pk': u'USER#u', 'sk': u'ORDER#2020#3'})
+        self.assertEqual(User.item(id=1, name='foo'),
+                         {'id': 1, 'name': 'foo', 'pk': u'USER#1',
+                          'sk': u'PROFILE', 'gsi1sk': u'USER#1'})
+        self.assertEqual(OrderItem.item(user_id='u', date='d', order_id=1,
+                                        total=5),
+                         {'user_id': 'u', 'date': 'd', 'order_id': 1,
+                          'total': 5, 'pk': u'USER#u', 'sk': u'ORDER#d#1',
+                          'gsi1pk': u'ORDERS', 'score': 5})
+        self.assertRaises(ValueError, OrderItem.item, user_id='u', date='d')
+
+        self.assertEqual(User.get(1), {'pk': {'S': 'USER#1'}})
+        client.get_item.assert_called_once_with(
+            TableName='dev.app', Key={'pk': u'USER#1', 'sk': u'PROFILE'},
+            ConsistentRead=False)
+        User.delete(1)
+        client.delete_item.assert_called_once_with(
+            TableName='dev.app', Key={'pk': u'USER#1', 'sk': u'PROFILE'})
+        User.put(id=1)
+        client.put_item.assert_called_once_with(
+            TableName='dev.app', Item={'id': 1, 'pk': u'USER#1',
+                                       'sk': u'PROFILE',
+                                       'gsi1sk': u'USER#1'})
+
+        self.assertEqual(len(OrderItem.query('u', '2020')), 2)
+        self.assertEqual(client.query.call_count, 2)
+        kwargs = client.query.call_args[1]
+        self.assertEqual(kwargs['KeyConditionExpression'],
+                         '#h = :h AND begins_with(#r, :r)')
+        self.assertEqual(kwargs['ExpressionAttributeNames'],
+                         {'#h': 'pk', '#r': 'sk'})
+        self.assertEqual(kwargs['ExpressionAttributeValues'],
+                         {':h': u'USER#u', ':r': u'ORDER#2020#'})
+        self.assertEqual(kwargs['ExclusiveStartKey'],
+                         {'pk': {'S': 'USER#1'}})
+        self.assertNotIn('IndexName', kwargs)
+
+        client.query.side_effect = None
+        client.query.return_value = {'Items': [{'pk': {'S': 'USER#1'}}],
+                                     'LastEvaluatedKey': {}}
+        self.assertEqual(len(User.query_gsi1('a@b.c', limit=1,
+                                             ascending=False)), 1)
+        kwargs = client.query.call_args[1]
+        self.assertEqual(kwargs['IndexName'], 'gsi1')
+        self.assertEqual(kwargs['Limit'], 1)
+        self.assertFalse(kwargs['ScanIndexForward'])
+        self.assertEqual(kwargs['ExpressionAttributeValues'],
+                         {':h': u'EMAIL#a@b.c', ':r': u'USER#'})
+
+    def test_stage_overrides_dax_and_actions(self):
+        cfg = deepcopy(config)
+        cfg['aws']['lambda_subnet_ids'] = ['subnet1']
+        cfg['dynamodb_tables']['t1']['dax'] = {'record_ttl': 1000}
+        cfg['dynamodb_tables']['t1']['actions'] = 'read_only'
+        cfg['dynamodb_tables']['t1']['stages'] = {
+            'dev': {'dax': None, 'actions': 'batch'},
+            'prod': {'dax': {'nodes': 3}}}
+        res = dynamodb._get_dax_resources(cfg)
+        self.assertNotIn('DevT1DaxCluster', res)
+        self.assertNotIn('DevT1DaxParameterGroup', res)
+        self.assertEqual(
+            res['ProdT1DaxCluster']['Properties']['ReplicationFactor'], 3)
+        self.assertEqual(
+            res['ProdT1DaxParameterGroup']['Properties'][
+                'ParameterNameValues']['record-ttl-millis'], '1000')
+        self.assertEqual(
+            res['StagingT1DaxCluster']['Properties']['ReplicationFactor'], 1)
+        statement = res['DaxServiceRole']['Properties']['Policies'][0][
+            'PolicyDocument']['Statement'][0]
+        self.assertEqual(len(statement['Resource']), 4)
+        self.assertEqual(
+            dynamodb._get_dax_policies(cfg)[0]['PolicyDocument'][
+                'Statement'][0]['Resource'],
+            [{'Fn::GetAtt': ['ProdT1DaxCluster', 'Arn']},
+             {'Fn::GetAtt': ['StagingT1DaxCluster', 'Arn']}])
+        self.assertEqual(sorted(dynamodb._get_dax_environment(cfg).keys()),
+                         ['SLAM_PROD__DAX_ENDPOINT_T1',
+                          'SLAM_STAGING__DAX_ENDPOINT_T1'])
+
+        statements = dynamodb._get_dynamodb_policies(cfg)[0][
+            'PolicyDocument']['Statement']
+        read_only = [s for s in statements
+                     if 'dynamodb:PutItem' not in s['Action']]
+        self.assertEqual(len(read_only), 1)
+        self.assertNotIn(dynamodb._get_table_arn('dev', 't1'),
+                         read_only[0]['Resource'])
+        self.assertIn(dynamodb._get_table_arn('prod', 't1'),
+                      read_only[0]['Resource'])
+
+    def test_stage_overrides_stream_handler(self):
+        cfg = deepcopy(config)
+        cfg['dynamodb_tables']['t1']['stream'] = 'new_image'
+        cfg['dynamodb_tables']['t1']['stages'] = {
+            'prod': {'stream': {'handler': 'foo:bar'}}}
+        self.assertEqual(dynamodb._get_stream_tables(cfg), [('prod', 't1')])
+        self.assertEqual(list(dynamodb._get_stream_resources(cfg).keys()),
+                         ['ProdT1StreamEventSourceMapping'])
+        self.assertEqual(
+            dynamodb._get_stream_policies(cfg)[0]['PolicyDocument'][
+                'Statement'][0]['Resource'],
+            [dynamodb._get_table_arn('prod', 't1', '/stream/*')])
@@ -0,0 +1,127 @@
+from decimal import Decimal
+import mock
+import os
+import unittest
+
+from slam.plugins import dynamodb_runtime as runtime
+
+
+class DynamoDBRuntimeTests(unittest.TestCase):
+    def setUp(self):
+        runtime._table_names.clear()
+        self.saved_stage = os.environ.get('STAGE')
+        os.environ['STAGE'] = 'prod'
+        self.client = mock.MagicMock()
+        patcher = mock.patch(
+            'slam.plugins.dynamodb_runtime.get_client',
+            return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('slam.plugins.dynamodb_runtime._backoff')
+        self.backoff = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        if self.saved_stage is None:
+            del os.environ['STAGE']
+        else:
+            os.environ['STAGE'] = self.saved_stage
+        runtime.TABLES = None
+
+    def test_table_name(self):
+        self.assertEqual(runtime.table_name('foo'), 'prod.foo')
+        os.environ['STAGE'] = 'dev'
+        self.assertEqual(runtime.table_name('foo'), 'dev.foo')
+        self.assertEqual(runtime._table_names, {('prod', 'foo'): 'prod.foo',
+                                                ('dev', 'foo'): 'dev.foo'})
+        runtime.TABLES = ['foo']
+        self.assertEqual(runtime.table_name('foo'), 'dev.foo')
+        self.assertRaises(ValueError, runtime.table_name, 'bar')
+
+    def test_put_items(self):
+        self.client.batch_write_item.return_value = {}
+        items = [{'id': str(i), 'n': i} for i in range(60)]
+        runtime.put_items('foo', items)
+        self.assertEqual(self.client.batch_write_item.call_count, 3)
+        sizes = []
+        for call in self.client.batch_write_item.call_args_list:
+            requests = call[1]['RequestItems']['prod.foo']
+            sizes.append(len(requests))
+        self.assertEqual(sorted(sizes), [10, 25, 25])
+        self.client.batch_write_item.assert_any_call(RequestItems={
+            'prod.foo': [{'PutRequest': {'Item': {
+                'id': {'S': str(i)}, 'n': {'N': str(i)}}}}
+                for i in range(25)]})
+
+    def test_put_no_items(self):
+        runtime.put_items('foo', [])
+        self.client.batch_write_item.assert_not_called()
+
+    def test_put_items_retry(self):
+        unprocessed = [{'PutRequest': {'Item': {'id': {'S': '1'}}}}]
+        self.client.batch_write_item.side_effect = [
+            {'UnprocessedItems': {'prod.foo': unprocessed}},
+            {'UnprocessedItems': {}}]
+        runtime.put_items('foo', [{'id': '0'}, {'id': '1'}])
+        self.assertEqual(self.client.batch_write_item.call_count, 2)
+        self.client.batch_write_item.assert_called_with(
+            RequestItems={'prod.foo': unprocessed})
+        self.backoff.assert_called_once_with(1)
+
+    def test_put_items_retry_limit(self):
+        unprocessed = [{'PutRequest': {'Item': {'id': {'S': '1'}}}}]
+        self.client.batch_write_item.return_value = {
+            'UnprocessedItems': {'prod.foo': unprocessed}}
+        self.assertRaises(RuntimeError, runtime.put_items, 'foo',
+                          [{'id': '1'}])
+        self.assertEqual(self.client.batch_write_item.call_count,
+                         runtime.MAX_RETRIES + 1)
+
+    def test_delete_items(self):
+        self.client.batch_write_item.return_value = {}
+        runtime.delete_items('foo', [{'id': '1'}])
+        self.client.batch_write_item.assert_called_once_with(RequestItems={
+            'prod.foo': [{'DeleteRequest': {'Key': {'id': {'S': '1'}}}}]})
+
+    def test_get_items(self):
+        def batch_get_item(RequestItems):
+            keys = RequestItems['prod.foo']['Keys']
+            self.assertTrue(RequestItems['prod.foo']['ConsistentRead'])
+            return {'Responses': {'prod.foo': [
+                dict(key, n={'N': key['id']['S']}) for key in keys]}}
+
+        self.client.batch_get_item.side_effect = batch_get_item
+        keys = [{'id': str(i)} for i in range(150)]
+        items = runtime.get_items('foo', keys, consistent_read=True)
+        self.assertEqual(self.client.batch_get_item.call_count, 2)
+        self.assertEqual(sorted(items, key=lambda item: int(item['id'])),
+                         [{'id': str(i), 'n': Decimal(i)}
+                          for i in range(150)])
+
+    def test_get_items_retry(self):
+        self.client.batch_get_item.side_effect = [
+            {'Responses': {'prod.foo': [{'id': {'S': '1'}}]},
+             'UnprocessedKeys': {'prod.foo': {
+                 'Keys': [{'id': {'S': '2'}}], 'ConsistentRead': False}}},
+            {'Responses': {'prod.foo': [{'id': {'S': '2'}}]}}]
+        items = runtime.get_items('foo', [{'id': '1'}, {'id': '2'}])
+        self.assertEqual(items, [{'id': '1'}, {'id': '2'}])
+        self.client.batch_get_item.assert_called_with(RequestItems={
+            'prod.foo': {'Keys': [{'id': {'S': '2'}}],
+                         'ConsistentRead': False}})
+        self.backoff.assert_called_once_with(1)
+
+    def test_get_items_retry_limit(self):
+        self.client.batch_get_item.return_value = {
+            'UnprocessedKeys': {'prod.foo': {'Keys': [{'id': {'S': '1'}}]}}}
+        self.assertRaises(RuntimeError, runtime.get_items, 'foo',
+                          [{'id': '1'}])
+
+
+class BackoffTests(unittest.TestCase):
+    @mock.patch('slam.plugins.dynamodb_runtime.time.sleep')
+    def test_backoff(self, sleep):
+        runtime._backoff(1)
+        self.assertTrue(0 <= sleep.call_args[0][0] <= 0.1)
+        runtime._backoff(20)
+        self.assertTrue(0 <= sleep.call_args[0][0] <= runtime.MAX_BACKOFF)
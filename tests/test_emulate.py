@@ -0,0 +1,143 @@
+import json
+import mock
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+from slam import cli
+from .test_deploy import config
+
+BUILTIN = '__builtin__'
+if sys.version_info >= (3, 0):
+    BUILTIN = 'builtins'
+
+handler_code = '''import os
+import time
+time.sleep(0.05)
+counter = {'n': 0}
+
+
+def lambda_handler(event, context):
+    if event.get('fail'):
+        raise ValueError('boom')
+    counter['n'] += 1
+    print('this goes to stderr')
+    return {'n': counter['n'], 'pid': os.getpid(),
+            'function': context.function_name,
+            'arn': context.invoked_function_arn,
+            'remaining': context.get_remaining_time_in_millis(),
+            'root': os.environ['LAMBDA_TASK_ROOT']}
+'''
+
+
+class EmulateTests(unittest.TestCase):
+    def setUp(self):
+        self.sandbox = tempfile.mkdtemp()
+        with open(os.path.join(self.sandbox, 'handler.py'), 'w') as f:
+            f.write(handler_code)
+
+    def tearDown(self):
+        shutil.rmtree(self.sandbox)
+
+    def test_worker(self):
+        worker = cli._EmulatorWorker(self.sandbox, config)
+        try:
+            self.assertGreater(worker.init_duration, 40)
+            context = cli._LambdaContext(config, 'dev', 7)
+            rv = worker.invoke({}, context, 7)
+            self.assertEqual(rv['result']['n'], 1)
+            self.assertEqual(rv['result']['function'], 'foo')
+            self.assertEqual(rv['result']['arn'],
+                             'arn:aws:lambda:local:000000000000:function:'
+                             'foo:dev')
+            self.assertTrue(0 < rv['result']['remaining'] <= 7000)
+            self.assertEqual(rv['result']['root'], self.sandbox)
+            self.assertIn('duration', rv)
+            rv = worker.invoke({}, context, 7)
+            self.assertEqual(rv['result']['n'], 2)
+            rv = worker.invoke({'fail': True}, context, 7)
+            self.assertEqual(rv['error'], 'ValueError: boom')
+            self.assertEqual(worker.invocations, 3)
+        finally:
+            worker.close()
+
+    def test_worker_import_error(self):
+        with open(os.path.join(self.sandbox, 'handler.py'), 'w') as f:
+            f.write('import not_a_module\n')
+        self.assertRaises(RuntimeError, cli._EmulatorWorker, self.sandbox,
+                          config)
+
+    def test_emulate_warm_reuse(self):
+        results = cli._emulate(config, self.sandbox, [{}, {}, {}], 'dev', 1)
+        self.assertEqual([rv['cold'] for rv in results],
+                         [True, False, False])
+        self.assertEqual([rv['worker'] for rv in results], [1, 1, 1])
+        self.assertEqual([rv['result']['n'] for rv in results], [1, 2, 3])
+        self.assertEqual(len(set(rv['result']['pid'] for rv in results)), 1)
+        self.assertIsNotNone(results[0]['init'])
+        self.assertIsNone(results[1]['init'])
+
+    def test_emulate_concurrency(self):
+        results = cli._emulate(config, self.sandbox, [{}] * 6, 'dev', 2)
+        self.assertLessEqual(len([rv for rv in results if rv['cold']]), 2)
+        self.assertLessEqual(len(set(rv['result']['pid'] for rv in results)),
+                             2)
+        self.assertEqual(sum(rv['result']['n'] for rv in results
+                             if rv['cold']),
+                         len([rv for rv in results if rv['cold']]))
+
+    def test_percentile(self):
+        self.assertEqual(cli._percentile([], 50), 0.0)
+        self.assertEqual(cli._percentile([3, 1, 2], 50), 2)
+        self.assertEqual(cli._percentile(list(range(100)), 99), 99)
+
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_emulate_command(self, _load_config):
+        package = os.path.join(self.sandbox, 'package.zip')
+        with zipfile.ZipFile(package, 'w') as z:
+            z.write(os.path.join(self.sandbox, 'handler.py'), 'handler.py')
+        payload = os.path.join(self.sandbox, 'event.json')
+        with open(payload, 'w') as f:
+            json.dump([{}, {'fail': True}], f)
+        output = []
+        with mock.patch(BUILTIN + '.print',
+                        side_effect=lambda *args: output.append(args[0])):
+            cli.main(['emulate', '--lambda-package', package, '--payload',
+                      payload, '--count', '2'])
+        self.assertEqual(output[0],
+                         'Emulating foo:dev with 4 invocation(s)...')
+        self.assertTrue(output[1].startswith(
+            'REPORT #1 Container: 1 (cold) Init Duration: '))
+        self.assertTrue(output[2].startswith(
+            'REPORT #2 Container: 1 (warm) Duration: '))
+        self.assertTrue(output[2].endswith('Error: ValueError: boom'))
+        self.assertEqual(output[5], 'Summary:')
+        self.assertEqual(output[6],
+                         '  Invocations: 4 (1 cold, 3 warm, 2 errors)')
+        self.assertTrue(output[7].startswith('  Init duration: avg '))
+        self.assertTrue(output[9].startswith('  Warm invocations: avg '))
+        self.assertTrue(os.path.exists(package))
+
+    @mock.patch('slam.cli._load_config', return_value=config)
+    @mock.patch('slam.cli._build')
+    def test_emulate_command_build(self, _build, _load_config):
+        package = os.path.join(self.sandbox, 'package.zip')
+        with zipfile.ZipFile(package, 'w') as z:
+            z.write(os.path.join(self.sandbox, 'handler.py'), 'handler.py')
+        _build.return_value = package
+        output = []
+        with mock.patch(BUILTIN + '.print',
+                        side_effect=lambda *args: output.append(args[0])):
+            cli.main(['emulate', '--stage', 'prod'])
+        _build.assert_called_once_with(config)
+        self.assertEqual(output[1],
+                         'Emulating foo:prod with 1 invocation(s)...')
+        self.assertFalse(os.path.exists(package))
+
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_emulate_invalid_stage(self, _load_config):
+        self.assertRaises(ValueError, cli.main,
+                          ['emulate', '--stage', 'invalid'])
@@ -1,9 +1,35 @@
 from collections import namedtuple
+import json
 import os
+import shutil
+import sys
+import tempfile
+import time
 import unittest
 
+import mock
+
 from slam.cli import _generate_lambda_handler
 
+BUILTIN = '__builtin__'
+if sys.version_info >= (3, 0):
+    BUILTIN = 'builtins'
+
+# generated handlers are written to a temporary directory, so that they are
+# not added to the slam package
+HANDLER_DIR = tempfile.mkdtemp()
+sys.path.insert(0, HANDLER_DIR)
+
+
+def tearDownModule():
+    sys.path.remove(HANDLER_DIR)
+    shutil.rmtree(HANDLER_DIR)
+
+
+def generate_handler(config, name):
+    _generate_lambda_handler(config, os.path.join(HANDLER_DIR, name + '.py'))
+
+
 LambdaContext = namedtuple('LambdaContext', ['function_version',
                                              'invoked_function_arn'])
 
@@ -31,7 +57,7 @@ class HandlerTests(unittest.TestCase):
                   'stage_environments': {'dev': {'FOODEV': 'bardev'},
                                          'prod': {'FOOPROD': 'barprod'}},
                   'wsgi': {'deploy_api_gateway': True}}
-        _generate_lambda_handler(config, 'slam/_handler.py')
+        generate_handler(config, '_handler')
 
     @classmethod
     def tearDownClass(cls):
@@ -42,14 +68,18 @@ class HandlerTests(unittest.TestCase):
             function_version='foo-version',
             invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
                                  'foo-function:dev')
+        app.status = '200 OK'
+        app.headers = []
+        app.write = None
+        app.body = [b'']
 
     def tearDown(self):
-        for var in ['STAGE', 'FOO', 'FOODEV', 'FOOPROD']:
+        for var in ['STAGE', 'FOO', 'FOODEV', 'FOOPROD', 'SLAM_STAGE']:
             if var in os.environ:
                 del os.environ[var]
 
     def test_default_request(self):
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         rv = lambda_handler({}, self.context)
         self.assertEqual(app.environ['lambda.event'], {})
         self.assertEqual(app.environ['lambda.context'], self.context)
@@ -62,7 +92,7 @@ class HandlerTests(unittest.TestCase):
         self.assertEqual(rv['statusCode'], 200)
 
     def test_prod_request(self):
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         context = LambdaContext(
             function_version='foo-version',
             invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
@@ -78,8 +108,37 @@ class HandlerTests(unittest.TestCase):
         self.assertEqual(os.environ.get('FOOPROD'), 'barprod')
         self.assertEqual(rv['statusCode'], 200)
 
+    def test_version_request(self):
+        from _handler import lambda_handler
+        context = LambdaContext(
+            function_version='7',
+            invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
+                                 'foo-function:7')
+        os.environ['SLAM_STAGE'] = 'prod'
+        lambda_handler({}, context)
+        self.assertEqual(os.environ.get('STAGE'), 'prod')
+        self.assertEqual(os.environ.get('FOOPROD'), 'barprod')
+
+    def test_deployed_stage_variables(self):
+        from _handler import lambda_handler
+        context = LambdaContext(
+            function_version='foo-version',
+            invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
+                                 'foo-function:prod')
+        os.environ['SLAM_PROD__FOO_ENDPOINT'] = 'prod-endpoint'
+        os.environ['SLAM_DEV__FOO_ENDPOINT'] = 'dev-endpoint'
+        try:
+            lambda_handler({}, context)
+            self.assertEqual(os.environ.get('FOO_ENDPOINT'), 'prod-endpoint')
+            lambda_handler({}, self.context)
+            self.assertEqual(os.environ.get('FOO_ENDPOINT'), 'dev-endpoint')
+        finally:
+            for var in ['SLAM_PROD__FOO_ENDPOINT', 'SLAM_DEV__FOO_ENDPOINT',
+                        'FOO_ENDPOINT']:
+                del os.environ[var]
+
     def test_no_stage_request(self):
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         context = LambdaContext(
             function_version='foo-version',
             invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
@@ -96,25 +155,25 @@ class HandlerTests(unittest.TestCase):
         self.assertEqual(rv['statusCode'], 200)
 
     def test_request_method(self):
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         for method in ['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'HEAD']:
             lambda_handler({'httpMethod': method}, self.context)
         self.assertEqual(app.environ['REQUEST_METHOD'], method)
 
     def test_path(self):
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         lambda_handler({'path': '/foo/bar'}, self.context)
         self.assertEqual(app.environ['PATH_INFO'], '/foo/bar')
 
     def test_query_string(self):
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         lambda_handler({'queryStringParameters': {
             'foo': 'bar', 'a?': 'b&'}}, self.context)
         self.assertTrue(app.environ['QUERY_STRING'] == 'a%3F=b%26&foo=bar' or
                         app.environ['QUERY_STRING'] == 'foo=bar&a%3F=b%26')
 
     def test_body(self):
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         app.write = b'baz'
         app.body = [b'foo', b'bar']
         rv = lambda_handler({'body': 'foo'}, self.context)
@@ -123,7 +182,7 @@ class HandlerTests(unittest.TestCase):
         self.assertFalse(rv['isBase64Encoded'])
 
     def test_body_binary(self):
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         app.write = b'baz\x88'
         app.body = [b'foo\x99', b'\xaabar']
         rv = lambda_handler({'body': 'foo'}, self.context)
@@ -132,7 +191,7 @@ class HandlerTests(unittest.TestCase):
         self.assertTrue(rv['isBase64Encoded'])
 
     def test_headers(self):
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         app.headers = [('bar', 'baz')]
         rv = lambda_handler({'headers': {'a': 'b', 'foo-bar': 'baz'}},
                             self.context)
@@ -141,13 +200,13 @@ class HandlerTests(unittest.TestCase):
         self.assertEqual(rv['headers'], {'bar': 'baz'})
 
     def test_status_code(self):
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         app.status = '401 UNAUTHORIZED'
         rv = lambda_handler({}, self.context)
         self.assertEqual(rv['statusCode'], 401)
 
     def test_environment(self):
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         lambda_handler({'stageVariables': {'foo': 'bar'}}, self.context)
         self.assertEqual(os.environ['foo'], 'bar')
         self.assertEqual(os.environ['LAMBDA_VERSION'],
@@ -159,8 +218,731 @@ class HandlerTests(unittest.TestCase):
             yield b'bar'
             yield b'baz'
 
-        from slam._handler import lambda_handler
+        from _handler import lambda_handler
         app.write = None
         app.body = g()
         rv = lambda_handler({}, self.context)
         self.assertEqual(rv['body'], 'foobarbaz')
+
+    def test_base64_body(self):
+        from _handler import lambda_handler
+        app.body = [b'']
+        lambda_handler({'body': 'Zm9vmQ==', 'isBase64Encoded': True},
+                       self.context)
+        self.assertEqual(app.environ['wsgi.input'].read(), b'foo\x99')
+
+    def test_function_url_request(self):
+        from _handler import lambda_handler
+        app.status = '200 OK'
+        app.headers = [('Content-Type', 'text/plain'),
+                       ('Set-Cookie', 'a=b'), ('Set-Cookie', 'c=d')]
+        app.write = None
+        app.body = [b'foo']
+        rv = lambda_handler({
+            'version': '2.0',
+            'rawPath': '/foo/bar',
+            'rawQueryString': 'a=b&c=d%20e',
+            'cookies': ['x=y', 'z=w'],
+            'headers': {'accept': 'text/plain'},
+            'requestContext': {'http': {'method': 'PUT'}},
+            'body': 'foo'
+        }, self.context)
+        self.assertEqual(app.environ['REQUEST_METHOD'], 'PUT')
+        self.assertEqual(app.environ['PATH_INFO'], '/foo/bar')
+        self.assertEqual(app.environ['QUERY_STRING'], 'a=b&c=d%20e')
+        self.assertEqual(app.environ['HTTP_ACCEPT'], 'text/plain')
+        self.assertEqual(app.environ['HTTP_COOKIE'], 'x=y; z=w')
+        self.assertEqual(app.environ['wsgi.input'].read(), b'foo')
+        self.assertEqual(rv, {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'text/plain'},
+            'cookies': ['a=b', 'c=d'],
+            'body': 'foo',
+            'isBase64Encoded': False
+        })
+
+    def test_function_url_post(self):
+        from _handler import lambda_handler
+        app.body = [b'']
+        lambda_handler({
+            'version': '2.0',
+            'rawPath': '/foo',
+            'headers': {'content-type': 'application/json',
+                        'content-length': '9'},
+            'requestContext': {'http': {'method': 'POST'}},
+            'body': '{"a": 1}\n'
+        }, self.context)
+        self.assertEqual(app.environ['REQUEST_METHOD'], 'POST')
+        self.assertEqual(app.environ['CONTENT_TYPE'], 'application/json')
+        self.assertEqual(app.environ['CONTENT_LENGTH'], '9')
+        self.assertEqual(app.environ['wsgi.input'].read(), b'{"a": 1}\n')
+
+    def test_alb_post(self):
+        from _handler import lambda_handler
+        app.body = [b'']
+        lambda_handler({
+            'requestContext': {'elb': {'targetGroupArn': 'arn:tg'}},
+            'httpMethod': 'POST',
+            'path': '/foo',
+            'headers': {'content-type': 'application/x-www-form-urlencoded'},
+            'body': 'a=b',
+            'isBase64Encoded': False
+        }, self.context)
+        self.assertEqual(app.environ['CONTENT_TYPE'],
+                         'application/x-www-form-urlencoded')
+        self.assertEqual(app.environ['CONTENT_LENGTH'], '3')
+        self.assertEqual(app.environ['wsgi.input'].read(), b'a=b')
+
+    def test_alb_request(self):
+        from _handler import lambda_handler
+        app.status = '201 CREATED'
+        app.headers = [('Content-Type', 'text/plain')]
+        app.write = None
+        app.body = [b'foo']
+        rv = lambda_handler({
+            'requestContext': {'elb': {'targetGroupArn': 'arn:tg'}},
+            'httpMethod': 'POST',
+            'path': '/foo',
+            'queryStringParameters': {'a': 'b%20c'},
+            'headers': {'accept': 'text/plain'},
+            'body': 'Zm9v',
+            'isBase64Encoded': True
+        }, self.context)
+        self.assertEqual(app.environ['REQUEST_METHOD'], 'POST')
+        self.assertEqual(app.environ['PATH_INFO'], '/foo')
+        self.assertEqual(app.environ['QUERY_STRING'], 'a=b%20c')
+        self.assertEqual(app.environ['HTTP_ACCEPT'], 'text/plain')
+        self.assertEqual(app.environ['wsgi.input'].read(), b'foo')
+        self.assertEqual(rv, {
+            'statusCode': 201,
+            'statusDescription': '201 CREATED',
+            'headers': {'Content-Type': 'text/plain'},
+            'body': 'foo',
+            'isBase64Encoded': False
+        })
+
+    def test_alb_multi_value_request(self):
+        from _handler import lambda_handler
+        app.status = '200 OK'
+        app.headers = [('Content-Type', 'text/plain'),
+                       ('Set-Cookie', 'a=b'), ('Set-Cookie', 'c=d')]
+        app.write = None
+        app.body = [b'foo']
+        rv = lambda_handler({
+            'requestContext': {'elb': {'targetGroupArn': 'arn:tg'}},
+            'httpMethod': 'GET',
+            'path': '/foo',
+            'multiValueQueryStringParameters': {'a': ['b', 'c']},
+            'multiValueHeaders': {'accept': ['text/plain', 'text/html'],
+                                  'cookie': ['x=y', 'z=w']},
+            'body': '',
+            'isBase64Encoded': False
+        }, self.context)
+        self.assertEqual(app.environ['QUERY_STRING'], 'a=b&a=c')
+        self.assertEqual(app.environ['HTTP_ACCEPT'], 'text/plain, text/html')
+        self.assertEqual(app.environ['HTTP_COOKIE'], 'x=y; z=w')
+        self.assertEqual(rv, {
+            'statusCode': 200,
+            'statusDescription': '200 OK',
+            'multiValueHeaders': {'Content-Type': ['text/plain'],
+                                  'Set-Cookie': ['a=b', 'c=d']},
+            'body': 'foo',
+            'isBase64Encoded': False
+        })
+
+
+class HandlerResponseCacheTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        config = {'function': {'module': 'tests.test_handler', 'app': 'app'},
+                  'devstage': 'dev', 'environment': {},
+                  'stage_environments': {'dev': {}},
+                  'wsgi': {'deploy_api_gateway': True,
+                           'response_cache': {'ttl': 10, 'max_entries': 2,
+                                              'vary_headers': ['Accept']}}}
+        generate_handler(config, '_handler_cache')
+
+    def setUp(self):
+        from _handler_cache import run_lambda_function
+        run_lambda_function.response_cache = None
+        self.context = LambdaContext(
+            function_version='foo-version',
+            invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
+                                 'foo-function:dev')
+        app.environ = None
+        app.status = '200 OK'
+        app.headers = []
+        app.write = None
+        app.body = [b'foo']
+
+    def test_cache_hit(self):
+        from _handler_cache import lambda_handler
+        rv = lambda_handler({'path': '/foo'}, self.context)
+        self.assertEqual(rv['body'], 'foo')
+        app.body = [b'bar']
+        app.environ = None
+        rv = lambda_handler({'path': '/foo'}, self.context)
+        self.assertEqual(rv['body'], 'foo')
+        self.assertIsNone(app.environ)
+        rv = lambda_handler({'path': '/bar'}, self.context)
+        self.assertEqual(rv['body'], 'bar')
+
+    def test_cache_key(self):
+        from _handler_cache import lambda_handler
+        lambda_handler({'path': '/foo', 'queryStringParameters': {'a': 'b'},
+                        'headers': {'Accept': 'text/html'}}, self.context)
+        app.body = [b'bar']
+        rv = lambda_handler({'path': '/foo'}, self.context)
+        self.assertEqual(rv['body'], 'bar')
+        rv = lambda_handler({'path': '/foo',
+                             'queryStringParameters': {'a': 'b'},
+                             'headers': {'accept': 'text/html'}},
+                            self.context)
+        self.assertEqual(rv['body'], 'foo')
+        rv = lambda_handler({'path': '/foo',
+                             'queryStringParameters': {'a': 'b'},
+                             'headers': {'accept': 'application/json'}},
+                            self.context)
+        self.assertEqual(rv['body'], 'bar')
+
+    def test_not_cacheable(self):
+        from _handler_cache import lambda_handler
+        lambda_handler({'path': '/foo', 'httpMethod': 'POST'}, self.context)
+        app.status = '404 NOT FOUND'
+        lambda_handler({'path': '/bar'}, self.context)
+        app.status = '200 OK'
+        app.headers = [('Cache-Control', 'private, max-age=60')]
+        lambda_handler({'path': '/baz'}, self.context)
+        app.headers = [('Set-Cookie', 'foo=bar')]
+        lambda_handler({'path': '/qux'}, self.context)
+        app.body = [b'bar']
+        for path in ['/bar', '/baz', '/qux']:
+            rv = lambda_handler({'path': path}, self.context)
+            self.assertEqual(rv['body'], 'bar')
+        rv = lambda_handler({'path': '/foo', 'httpMethod': 'POST'},
+                            self.context)
+        self.assertEqual(rv['body'], 'bar')
+
+    def test_credentials(self):
+        from _handler_cache import lambda_handler
+        app.body = [b'hello alice']
+        rv = lambda_handler({'path': '/me',
+                             'headers': {'Authorization': 'alice'}},
+                            self.context)
+        self.assertEqual(rv['body'], 'hello alice')
+        app.body = [b'hello bob']
+        rv = lambda_handler({'path': '/me',
+                             'headers': {'Authorization': 'bob'}},
+                            self.context)
+        self.assertEqual(rv['body'], 'hello bob')
+        app.body = [b'hello susan']
+        rv = lambda_handler({'path': '/me',
+                             'headers': {'Cookie': 'user=susan'}},
+                            self.context)
+        self.assertEqual(rv['body'], 'hello susan')
+
+        # responses to anonymous requests are not given to requests with
+        # credentials
+        app.body = [b'hello guest']
+        lambda_handler({'path': '/me'}, self.context)
+        rv = lambda_handler({'path': '/me'}, self.context)
+        self.assertEqual(rv['body'], 'hello guest')
+        app.body = [b'hello alice']
+        rv = lambda_handler({'path': '/me',
+                             'headers': {'authorization': 'alice'}},
+                            self.context)
+        self.assertEqual(rv['body'], 'hello alice')
+
+    def test_credentials_shared_response(self):
+        from _handler_cache import lambda_handler, run_lambda_function
+        for cache_control in ['public', 's-maxage=60']:
+            run_lambda_function.response_cache = None
+            app.body = [b'foo']
+            app.headers = [('Cache-Control', cache_control)]
+            lambda_handler({'path': '/foo',
+                            'headers': {'Authorization': 'alice'}},
+                           self.context)
+            app.body = [b'bar']
+            rv = lambda_handler({'path': '/foo',
+                                 'headers': {'Authorization': 'bob'}},
+                                self.context)
+            self.assertEqual(rv['body'], 'foo')
+            rv = lambda_handler({'path': '/foo'}, self.context)
+            self.assertEqual(rv['body'], 'foo')
+
+    def test_vary(self):
+        from _handler_cache import lambda_handler
+        app.headers = [('Vary', 'accept')]
+        lambda_handler({'path': '/foo', 'headers': {'Accept': 'text/html'}},
+                       self.context)
+        app.headers = [('Vary', 'Accept, Accept-Language')]
+        lambda_handler({'path': '/bar'}, self.context)
+        app.headers = [('Vary', '*')]
+        lambda_handler({'path': '/baz'}, self.context)
+        app.body = [b'bar']
+        rv = lambda_handler({'path': '/foo',
+                             'headers': {'Accept': 'text/html'}},
+                            self.context)
+        self.assertEqual(rv['body'], 'foo')
+        for path in ['/bar', '/baz']:
+            rv = lambda_handler({'path': path}, self.context)
+            self.assertEqual(rv['body'], 'bar')
+
+    def test_client_no_cache(self):
+        from _handler_cache import lambda_handler
+        lambda_handler({'path': '/foo'}, self.context)
+        app.body = [b'bar']
+        rv = lambda_handler({'path': '/foo',
+                             'headers': {'Cache-Control': 'no-cache'}},
+                            self.context)
+        self.assertEqual(rv['body'], 'bar')
+
+    @mock.patch('time.time')
+    def test_ttl(self, time):
+        from _handler_cache import lambda_handler
+        time.return_value = 100
+        lambda_handler({'path': '/foo'}, self.context)
+        app.headers = [('Cache-Control', 'max-age=60, s-maxage=2')]
+        lambda_handler({'path': '/bar'}, self.context)
+        app.body = [b'bar']
+        time.return_value = 105
+        rv = lambda_handler({'path': '/foo'}, self.context)
+        self.assertEqual(rv['body'], 'foo')
+        rv = lambda_handler({'path': '/bar'}, self.context)
+        self.assertEqual(rv['body'], 'bar')
+        time.return_value = 111
+        rv = lambda_handler({'path': '/foo'}, self.context)
+        self.assertEqual(rv['body'], 'bar')
+
+    def test_max_entries(self):
+        from _handler_cache import lambda_handler
+        for path in ['/a', '/b', '/a', '/c']:
+            lambda_handler({'path': path}, self.context)
+        app.body = [b'bar']
+        self.assertEqual(lambda_handler({'path': '/a'}, self.context)['body'],
+                         'foo')
+        self.assertEqual(lambda_handler({'path': '/b'}, self.context)['body'],
+                         'bar')
+
+
+class HandlerETagTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        config = {'function': {'module': 'tests.test_handler', 'app': 'app'},
+                  'devstage': 'dev', 'environment': {},
+                  'stage_environments': {'dev': {}},
+                  'wsgi': {'deploy_api_gateway': True, 'etag': True}}
+        generate_handler(config, '_handler_etag')
+
+    def setUp(self):
+        self.context = LambdaContext(
+            function_version='foo-version',
+            invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
+                                 'foo-function:dev')
+        app.environ = None
+        app.status = '200 OK'
+        app.headers = [('Content-Type', 'text/plain'),
+                       ('Cache-Control', 'max-age=60')]
+        app.write = None
+        app.body = [b'foo']
+
+    def test_etag(self):
+        from _handler_etag import lambda_handler
+        rv = lambda_handler({}, self.context)
+        self.assertEqual(rv['headers']['ETag'],
+                         'W/"acbd18db4cc2f85cedef654fccc4a4d8"')
+        self.assertEqual(rv['body'], 'foo')
+        rv = lambda_handler({'httpMethod': 'POST'}, self.context)
+        self.assertNotIn('ETag', rv['headers'])
+        app.status = '404 NOT FOUND'
+        rv = lambda_handler({}, self.context)
+        self.assertNotIn('ETag', rv['headers'])
+
+    def test_app_etag(self):
+        from _handler_etag import lambda_handler
+        app.headers = [('ETag', '"v1"')]
+        rv = lambda_handler({}, self.context)
+        self.assertEqual(rv['headers'], {'ETag': '"v1"'})
+        rv = lambda_handler({'headers': {'If-None-Match': 'W/"v1"'}},
+                            self.context)
+        self.assertEqual(rv['statusCode'], 304)
+
+    def test_not_modified(self):
+        from _handler_etag import lambda_handler
+        for tag in ['W/"acbd18db4cc2f85cedef654fccc4a4d8"',
+                    '"foo", "acbd18db4cc2f85cedef654fccc4a4d8"', '*']:
+            rv = lambda_handler({'headers': {'if-none-match': tag}},
+                                self.context)
+            self.assertEqual(rv, {
+                'statusCode': 304,
+                'headers': {'Cache-Control': 'max-age=60',
+                            'ETag': 'W/"acbd18db4cc2f85cedef654fccc4a4d8"'},
+                'body': '',
+                'isBase64Encoded': False
+            })
+
+    def test_modified(self):
+        from _handler_etag import lambda_handler
+        rv = lambda_handler({'headers': {'If-None-Match': 'W/"foo"'}},
+                            self.context)
+        self.assertEqual(rv['statusCode'], 200)
+        self.assertEqual(rv['body'], 'foo')
+
+
+def function(event, context, fail=False):
+    if fail:
+        raise ValueError('foo')
+    return {'foo': 'bar'}
+
+
+class HandlerMetricsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        config = {'name': 'foo',
+                  'function': {'module': 'tests.test_handler', 'app': 'app'},
+                  'devstage': 'dev', 'environment': {},
+                  'stage_environments': {'dev': {}, 'prod': {}},
+                  'aws': {'metrics_namespace': 'slam'},
+                  'wsgi': {'deploy_api_gateway': True}}
+        generate_handler(config, '_handler_metrics')
+        config['function']['app'] = 'function'
+        del config['wsgi']
+        generate_handler(config, '_handler_metrics_function')
+
+    def setUp(self):
+        self.context = LambdaContext(
+            function_version='foo-version',
+            invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
+                                 'foo-function:prod')
+        app.status = '200 OK'
+        app.headers = []
+        app.write = None
+        app.body = [b'foobar']
+
+    def _invoke(self, handler, event):
+        output = []
+        with mock.patch('sys.stdout') as stdout:
+            stdout.write.side_effect = output.append
+            try:
+                rv = handler.lambda_handler(event, self.context)
+            finally:
+                self.assertEqual(len(output), 1)
+                self.assertTrue(output[0].endswith('\n'))
+                self.metrics = json.loads(output[0])
+        return rv
+
+    def test_wsgi_metrics(self):
+        import _handler_metrics as handler
+        handler.cold_start = True
+        rv = self._invoke(handler, {'httpMethod': 'POST', 'path': '/',
+                                    'body': 'foo'})
+        self.assertEqual(rv['statusCode'], 200)
+        metrics = self.metrics
+        emf = metrics['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(emf['Namespace'], 'slam')
+        self.assertEqual(emf['Dimensions'], [['Function', 'Stage']])
+        self.assertEqual(emf['Metrics'], [
+            {'Name': '4XXError', 'Unit': 'Count'},
+            {'Name': '5XXError', 'Unit': 'Count'},
+            {'Name': 'ColdStart', 'Unit': 'Count'},
+            {'Name': 'Duration', 'Unit': 'Milliseconds'},
+            {'Name': 'Errors', 'Unit': 'Count'},
+            {'Name': 'RequestSize', 'Unit': 'Bytes'},
+            {'Name': 'ResponseSize', 'Unit': 'Bytes'}])
+        self.assertIsInstance(metrics['_aws']['Timestamp'], int)
+        self.assertEqual(metrics['Function'], 'foo')
+        self.assertEqual(metrics['Stage'], 'prod')
+        self.assertEqual(metrics['StatusCode'], 200)
+        self.assertEqual(metrics['ColdStart'], 1)
+        self.assertEqual(metrics['Errors'], 0)
+        self.assertEqual(metrics['4XXError'], 0)
+        self.assertEqual(metrics['5XXError'], 0)
+        self.assertEqual(metrics['RequestSize'], 3)
+        self.assertEqual(metrics['ResponseSize'], 6)
+        self.assertGreaterEqual(metrics['Duration'], 0)
+
+        app.status = '503 SERVICE UNAVAILABLE'
+        self._invoke(handler, {'httpMethod': 'GET', 'path': '/'})
+        self.assertEqual(self.metrics['ColdStart'], 0)
+        self.assertEqual(self.metrics['StatusCode'], 503)
+        self.assertEqual(self.metrics['4XXError'], 0)
+        self.assertEqual(self.metrics['5XXError'], 1)
+        self.assertEqual(self.metrics['RequestSize'], 0)
+
+    def test_function_metrics(self):
+        import _handler_metrics_function as handler
+        rv = self._invoke(handler, {'kwargs': {}})
+        self.assertEqual(rv, {'foo': 'bar'})
+        self.assertNotIn('StatusCode', self.metrics)
+        self.assertNotIn('4XXError', self.metrics)
+        self.assertEqual(self.metrics['RequestSize'],
+                         len(json.dumps({'kwargs': {}})))
+        self.assertEqual(self.metrics['ResponseSize'],
+                         len(json.dumps({'foo': 'bar'})))
+
+    def test_function_error_metrics(self):
+        import _handler_metrics_function as handler
+        self.assertRaises(ValueError, self._invoke, handler,
+                          {'kwargs': {'fail': True}})
+        self.assertEqual(self.metrics['Errors'], 1)
+        self.assertNotIn('ResponseSize', self.metrics)
+
+
+def slow_function(event, context):
+    time.sleep(0.05)
+    return 'foo'
+
+
+class HandlerProfilerTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        config = {'name': 'foo',
+                  'function': {'module': 'tests.test_handler',
+                               'app': 'slow_function'},
+                  'devstage': 'dev', 'environment': {},
+                  'stage_environments': {
+                      'dev': {'SLAM_PROFILE_RATE': '0'},
+                      'prod': {'SLAM_PROFILE_RATE': '1',
+                               'SLAM_PROFILE_INTERVAL': '1'}},
+                  'aws': {'s3_bucket': 'bucket'}}
+        generate_handler(config, '_handler_profile')
+
+    def tearDown(self):
+        for var in ['STAGE', 'SLAM_PROFILE_RATE', 'SLAM_PROFILE_INTERVAL']:
+            if var in os.environ:
+                del os.environ[var]
+
+    def _context(self, stage):
+        return LambdaContext(
+            function_version='foo-version',
+            invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
+                                 'foo-function:' + stage)
+
+    @mock.patch('boto3.client')
+    def test_profile(self, client):
+        from _handler_profile import lambda_handler
+        rv = lambda_handler({}, self._context('prod'))
+        self.assertEqual(rv, 'foo')
+        client.assert_called_once_with('s3')
+        kwargs = client().put_object.call_args[1]
+        self.assertEqual(kwargs['Bucket'], 'bucket')
+        self.assertTrue(kwargs['Key'].startswith('profiles/foo/prod/'))
+        self.assertTrue(kwargs['Key'].endswith('.folded'))
+        lines = kwargs['Body'].decode('utf-8').splitlines()
+        self.assertTrue(len(lines) > 0)
+        samples = 0
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertIn('lambda_handler (', stack)
+            samples += int(count)
+        self.assertTrue(samples > 1)
+        self.assertTrue(any(['slow_function (' in line for line in lines]))
+
+    @mock.patch('boto3.client')
+    def test_upload_error(self, client):
+        from _handler_profile import lambda_handler
+        client().put_object.side_effect = RuntimeError('foo')
+        with mock.patch('sys.stdout') as stdout:
+            rv = lambda_handler({}, self._context('prod'))
+        self.assertEqual(rv, 'foo')
+        stdout.write.assert_any_call('Profile could not be uploaded: foo')
+
+    @mock.patch('boto3.client')
+    def test_no_profile(self, client):
+        from _handler_profile import lambda_handler
+        rv = lambda_handler({}, self._context('dev'))
+        self.assertEqual(rv, 'foo')
+        client.assert_not_called()
+
+
+class HandlerTracingTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        config = {'name': 'foo',
+                  'function': {'module': 'tests.test_handler',
+                               'app': 'function'},
+                  'devstage': 'dev', 'environment': {},
+                  'stage_environments': {'dev': {}},
+                  'dynamodb_tables': {'mytable': {}},
+                  'aws': {'tracing': 'active'}}
+        generate_handler(config, '_handler_tracing')
+
+    def setUp(self):
+        import _handler_tracing
+        _handler_tracing.xray_recorder = None
+        self.context = LambdaContext(
+            function_version='foo-version',
+            invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
+                                 'foo-function:dev')
+
+    def tearDown(self):
+        if 'STAGE' in os.environ:
+            del os.environ['STAGE']
+
+    def test_tracing(self):
+        from _handler_tracing import lambda_handler
+        xray = mock.MagicMock()
+        modules = {'aws_xray_sdk': xray, 'aws_xray_sdk.core': xray.core}
+        with mock.patch.dict('sys.modules', modules):
+            rv = lambda_handler({}, self.context)
+            rv2 = lambda_handler({}, self.context)
+        self.assertEqual(rv, {'foo': 'bar'})
+        self.assertEqual(rv2, {'foo': 'bar'})
+        xray.core.patch.assert_called_once_with(['boto3', 'botocore'])
+        recorder = xray.core.xray_recorder
+        recorder.in_subsegment.assert_called_with(
+            'tests.test_handler.function')
+        self.assertEqual(recorder.in_subsegment.call_count, 2)
+        subsegment = recorder.in_subsegment().__enter__()
+        subsegment.put_annotation.assert_called_with('stage', 'dev')
+        subsegment.put_metadata.assert_called_with(
+            'dynamodb_tables', {'mytable': 'dev.mytable'})
+
+    def test_tracing_without_sdk(self):
+        from _handler_tracing import lambda_handler
+        with mock.patch.dict('sys.modules', {'aws_xray_sdk': None,
+                                             'aws_xray_sdk.core': None}):
+            with mock.patch(BUILTIN + '.print') as mock_print:
+                rv = lambda_handler({}, self.context)
+                rv = lambda_handler({}, self.context)
+        self.assertEqual(rv, {'foo': 'bar'})
+        mock_print.assert_called_once_with(
+            'The aws-xray-sdk package is not installed, subsegments will '
+            'not be recorded.')
+
+
+def process_changes(event, context):
+    return {'records': len(event['Records'])}
+
+
+class HandlerStreamTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        config = {'name': 'foo',
+                  'function': {'module': 'tests.test_handler',
+                               'app': 'function'},
+                  'devstage': 'dev', 'environment': {},
+                  'stage_environments': {'dev': {}, 'prod': {}},
+                  'dynamodb_tables': {
+                      'mytable': {'stream': {
+                          'handler': 'tests.test_handler:process_changes'},
+                          'stages': {'prod': {'stream': {'batch_size': 5}}}},
+                      'mytable2': {'stream': 'keys_only', 'stages': {
+                          'prod': {'stream': {
+                              'handler': 'tests.test_handler:'
+                                         'process_changes'}}}}}}
+        generate_handler(config, '_handler_stream')
+
+    def setUp(self):
+        self.context = LambdaContext(
+            function_version='foo-version',
+            invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
+                                 'foo-function:dev')
+
+    def tearDown(self):
+        if 'STAGE' in os.environ:
+            del os.environ['STAGE']
+
+    def _event(self, table):
+        arn = ('arn:aws:dynamodb:us-east-1:123456:table/{}/stream/'
+               '2020-01-01T00:00:00.000'.format(table))
+        return {'Records': [{'eventSource': 'aws:dynamodb',
+                             'eventSourceARN': arn},
+                            {'eventSource': 'aws:dynamodb',
+                             'eventSourceARN': arn}]}
+
+    def test_stream_event(self):
+        from _handler_stream import lambda_handler
+        rv = lambda_handler(self._event('dev.mytable'), self.context)
+        self.assertEqual(rv, {'records': 2})
+
+    def test_stream_event_stage_override(self):
+        from _handler_stream import lambda_handler
+        rv = lambda_handler(self._event('prod.mytable'), self.context)
+        self.assertEqual(rv, {'records': 2})
+        rv = lambda_handler(self._event('prod.mytable2'), self.context)
+        self.assertEqual(rv, {'records': 2})
+
+    def test_stream_without_handler(self):
+        from _handler_stream import lambda_handler
+        rv = lambda_handler(self._event('dev.mytable2'), self.context)
+        self.assertEqual(rv, {'foo': 'bar'})
+        rv = lambda_handler(self._event('dev.other'), self.context)
+        self.assertEqual(rv, {'foo': 'bar'})
+
+    def test_other_event(self):
+        from _handler_stream import lambda_handler
+        rv = lambda_handler({'Records': [{'eventSource': 'aws:sqs'}]},
+                            self.context)
+        self.assertEqual(rv, {'foo': 'bar'})
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'ASGI requires Python 3.5+')
+class HandlerASGITests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        config = {'function': {'module': 'tests.asgi_app', 'app': 'app'},
+                  'devstage': 'dev', 'environment': {},
+                  'stage_environments': {'dev': {}},
+                  'wsgi': {'deploy_api_gateway': True, 'asgi': True}}
+        generate_handler(config, '_handler_asgi')
+
+    @classmethod
+    def tearDownClass(cls):
+        from _handler_asgi import run_lambda_function
+        if getattr(run_lambda_function, 'asgi_loop', None):
+            loop = run_lambda_function.asgi_loop
+            run_lambda_function.asgi_lifespan.cancel()
+            try:
+                loop.run_until_complete(run_lambda_function.asgi_lifespan)
+            except BaseException:
+                pass
+            loop.close()
+
+    def setUp(self):
+        from tests import asgi_app
+        self.app = asgi_app.app
+        self.app.status = 200
+        self.app.headers = [(b'content-type', b'text/plain')]
+        self.app.body = [b'foo', b'bar']
+        self.context = LambdaContext(
+            function_version='foo-version',
+            invoked_function_arn='arn:aws:lambda:us-east-1:123456:function:'
+                                 'foo-function:dev')
+
+    def test_request(self):
+        from _handler_asgi import lambda_handler
+        rv = lambda_handler({'httpMethod': 'POST', 'path': '/foo',
+                             'queryStringParameters': {'a': 'b c'},
+                             'headers': {'Accept': 'text/plain'},
+                             'body': 'baz'}, self.context)
+        self.assertEqual(self.app.scope['type'], 'http')
+        self.assertEqual(self.app.scope['method'], 'POST')
+        self.assertEqual(self.app.scope['path'], '/foo')
+        self.assertEqual(self.app.scope['query_string'], b'a=b%20c')
+        self.assertEqual(self.app.scope['headers'],
+                         [(b'accept', b'text/plain')])
+        self.assertEqual(self.app.request_body, b'baz')
+        self.assertEqual(rv, {
+            'statusCode': 200,
+            'headers': {'content-type': 'text/plain'},
+            'body': 'foobar',
+            'isBase64Encoded': False
+        })
+
+    def test_status_code(self):
+        from _handler_asgi import lambda_handler
+        self.app.status = 404
+        rv = lambda_handler({}, self.context)
+        self.assertEqual(rv['statusCode'], 404)
+
+    def test_lifespan(self):
+        from _handler_asgi import lambda_handler, run_lambda_function
+        lambda_handler({}, self.context)
+        loop = run_lambda_function.asgi_loop
+        started = self.app.started
+        self.assertGreaterEqual(started, 1)
+        lambda_handler({}, self.context)
+        lambda_handler({}, self.context)
+        self.assertEqual(self.app.started, started)
+        self.assertIs(run_lambda_function.asgi_loop, loop)
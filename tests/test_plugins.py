@@ -68,3 +68,15 @@ class PluginTests(unittest.TestCase):
         tpl = cfn.get_cfn_template(cfg)
         tpl = json.loads(tpl)
         self.assertEqual(tpl['Resources']['foo'], {'x': 'y'})
+
+    @mock.patch('slam.cli.pkg_resources.iter_entry_points')
+    def test_register_plugin_commands(self, iter_entry_points):
+        plugin_module = mock.MagicMock(spec=['register_commands'])
+        plugin = mock.MagicMock()
+        plugin.name = 'baz'
+        plugin.load.return_value = plugin_module
+        iter_entry_points.return_value = [plugin]
+        with mock.patch.dict('slam.cli.plugins'):
+            cli.register_plugins()
+            self.assertEqual(cli.plugins['baz'], plugin_module)
+        plugin_module.register_commands.assert_called_once_with(cli.main)
@@ -0,0 +1,99 @@
+import mock
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from slam import cli
+from .test_deploy import config
+
+BUILTIN = '__builtin__'
+if sys.version_info >= (3, 0):
+    BUILTIN = 'builtins'
+
+
+def _get_object(profiles):
+    def get_object(Bucket, Key):
+        body = mock.MagicMock()
+        body.read.return_value = profiles[Key].encode('utf-8')
+        return {'Body': body}
+    return get_object
+
+
+class ProfileTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmpdir, 'out.folded')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @mock.patch(BUILTIN + '.print')
+    @mock.patch('slam.cli.time.time', return_value=86400 * 2)
+    @mock.patch('slam.cli.boto3.client')
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_profile(self, _load_config, client, time, mock_print):
+        mock_s3 = mock.MagicMock()
+        profiles = {
+            'profiles/foo/dev/19700102T000001-a.folded': 'a;b 2\na;c 1\n',
+            'profiles/foo/dev/19700102T000002-b.folded': 'a;b 3\n',
+            'profiles/foo/dev/19700102T000003-c.folded': 'a;b;d (x:1) 4\n',
+        }
+        keys = sorted(profiles.keys())
+        mock_s3.list_objects_v2.side_effect = [
+            {'Contents': [{'Key': keys[0]}, {'Key': keys[1]}],
+             'IsTruncated': True, 'NextContinuationToken': 'token'},
+            {'Contents': [{'Key': keys[2]}], 'IsTruncated': False}
+        ]
+        mock_s3.get_object.side_effect = _get_object(profiles)
+        client.return_value = mock_s3
+
+        cli.main(['profile', '--output', self.output])
+        client.assert_called_once_with('s3')
+        mock_s3.list_objects_v2.assert_any_call(
+            Bucket='bucket', Prefix='profiles/foo/dev/',
+            StartAfter='profiles/foo/dev/19700102T000000')
+        mock_s3.list_objects_v2.assert_any_call(
+            Bucket='bucket', Prefix='profiles/foo/dev/',
+            StartAfter='profiles/foo/dev/19700102T000000',
+            ContinuationToken='token')
+        with open(self.output) as f:
+            self.assertEqual(f.read(), 'a;b 5\na;b;d (x:1) 4\na;c 1\n')
+        mock_print.assert_called_once_with(
+            '3 profile(s) with 10 samples merged into ' + self.output + '.')
+        mock_s3.delete_object.assert_not_called()
+
+    @mock.patch(BUILTIN + '.print')
+    @mock.patch('slam.cli.time.time', return_value=86400 * 2)
+    @mock.patch('slam.cli.boto3.client')
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_profile_delete(self, _load_config, client, time, mock_print):
+        mock_s3 = mock.MagicMock()
+        profiles = {'profiles/foo/prod/19700102T220000-a.folded': 'a 1\n'}
+        mock_s3.list_objects_v2.return_value = {
+            'Contents': [{'Key': k} for k in profiles.keys()]}
+        mock_s3.get_object.side_effect = _get_object(profiles)
+        client.return_value = mock_s3
+
+        cli.main(['profile', '--stage', 'prod', '--period', '3h', '-o',
+                  self.output, '--delete'])
+        mock_s3.list_objects_v2.assert_called_once_with(
+            Bucket='bucket', Prefix='profiles/foo/prod/',
+            StartAfter='profiles/foo/prod/19700102T210000')
+        mock_s3.delete_object.assert_called_once_with(
+            Bucket='bucket', Key='profiles/foo/prod/19700102T220000-a.folded')
+
+    @mock.patch(BUILTIN + '.print')
+    @mock.patch('slam.cli.boto3.client')
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_no_profiles(self, _load_config, client, mock_print):
+        client.return_value.list_objects_v2.return_value = {}
+        cli.main(['profile', '--output', self.output])
+        mock_print.assert_called_once_with('No profiles found for foo:dev.')
+        self.assertFalse(os.path.exists(self.output))
+
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_invalid_period(self, _load_config):
+        self.assertRaises(ValueError, cli.main,
+                          ['profile', '--period', '3x'])
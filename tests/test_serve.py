@@ -0,0 +1,206 @@
+import json
+import mock
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+try:
+    from urllib.request import Request, urlopen
+except ImportError:  # pragma: no cover
+    from urllib2 import Request, urlopen
+
+from slam import cli
+from .test_deploy import config
+
+BUILTIN = '__builtin__'
+if sys.version_info >= (3, 0):
+    BUILTIN = 'builtins'
+
+handler_code = '''import os
+import time
+state = {'busy': False}
+
+
+def lambda_handler(event, context):
+    if state['busy']:
+        raise RuntimeError('concurrent invocation')
+    state['busy'] = True
+    start = time.time()
+    time.sleep(0.2)
+    state['busy'] = False
+    return {'pid': os.getpid(), 'start': start, 'end': time.time()}
+'''
+
+
+class FakeContainers(object):
+    def __init__(self, lambda_handler):
+        self.lambda_handler = lambda_handler
+
+    def invoke(self, event, context, timeout):
+        try:
+            return {'result': self.lambda_handler(event, context)}
+        except Exception as e:
+            return {'error': '{}: {}'.format(e.__class__.__name__, e)}
+
+
+class ServeTests(unittest.TestCase):
+    def test_context(self):
+        context = cli._LambdaContext(config, 'prod')
+        self.assertEqual(context.function_name, 'foo')
+        self.assertEqual(context.function_version, '$LATEST')
+        self.assertEqual(context.invoked_function_arn,
+                         'arn:aws:lambda:local:000000000000:function:foo:'
+                         'prod')
+        self.assertEqual(context.memory_limit_in_mb, '512')
+        self.assertTrue(0 < context.get_remaining_time_in_millis() <= 7000)
+
+    def test_api_gateway_event(self):
+        event = cli._get_api_gateway_event(
+            'POST', '/foo/bar?a=1&b=2&a=3&c=', [('Accept', 'text/plain')],
+            b'foo', 'dev')
+        self.assertEqual(event['httpMethod'], 'POST')
+        self.assertEqual(event['path'], '/foo/bar')
+        self.assertEqual(event['headers'], {'Accept': 'text/plain'})
+        self.assertEqual(event['queryStringParameters'],
+                         {'a': '3', 'b': '2', 'c': ''})
+        self.assertEqual(event['multiValueQueryStringParameters'],
+                         {'a': ['1', '3'], 'b': ['2'], 'c': ['']})
+        self.assertEqual(event['pathParameters'], {'proxy': 'foo/bar'})
+        self.assertEqual(event['stageVariables'], {'STAGE': 'dev'})
+        self.assertEqual(event['requestContext']['path'], '/dev/foo/bar')
+        self.assertEqual(event['body'], 'foo')
+        self.assertFalse(event['isBase64Encoded'])
+
+        event = cli._get_api_gateway_event('GET', '/', [], b'\x99', 'prod')
+        self.assertIsNone(event['queryStringParameters'])
+        self.assertIsNone(event['pathParameters'])
+        self.assertEqual(event['body'], 'mQ==')
+        self.assertTrue(event['isBase64Encoded'])
+
+        event = cli._get_api_gateway_event('GET', '/', [], b'', 'prod')
+        self.assertIsNone(event['body'])
+
+    def test_http_response(self):
+        self.assertEqual(cli._get_http_response({
+            'statusCode': 201,
+            'headers': {'Content-Type': 'text/plain'},
+            'multiValueHeaders': {'X-Foo': ['a', 'b']},
+            'cookies': ['c=d'],
+            'body': 'foo',
+            'isBase64Encoded': False
+        }), (201, [('Content-Type', 'text/plain'), ('X-Foo', 'a'),
+                   ('X-Foo', 'b'), ('Set-Cookie', 'c=d')], b'foo'))
+        self.assertEqual(cli._get_http_response({
+            'statusCode': 200, 'body': 'mQ==', 'isBase64Encoded': True
+        }), (200, [], b'\x99'))
+        self.assertEqual(cli._get_http_response({'foo': 'bar'}), (
+            200, [('Content-Type', 'application/json')], b'{"foo": "bar"}'))
+
+    @mock.patch(BUILTIN + '.print')
+    def test_request_handler(self, mock_print):
+        def lambda_handler(event, context):
+            if event['path'] == '/error':
+                raise ValueError('foo')
+            return {'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json'},
+                    'body': json.dumps({'path': event['path'],
+                                        'method': event['httpMethod'],
+                                        'body': event['body'],
+                                        'arn': context.invoked_function_arn}),
+                    'isBase64Encoded': False}
+
+        server = cli._ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            cli._get_request_handler_class(config, 'dev',
+                                           FakeContainers(lambda_handler)))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+            rv = urlopen(Request(url + '/foo', data=b'bar'))
+            self.assertEqual(rv.getcode(), 200)
+            self.assertEqual(json.loads(rv.read().decode('utf-8')), {
+                'path': '/foo', 'method': 'POST', 'body': 'bar',
+                'arn': 'arn:aws:lambda:local:000000000000:function:foo:dev'})
+            try:
+                urlopen(url + '/error')
+            except Exception as e:
+                self.assertEqual(e.code, 502)
+                self.assertEqual(e.read(), b'ValueError: foo\n')
+            else:  # pragma: no cover
+                self.fail('error not raised')
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        output = [c[0][0] for c in mock_print.call_args_list]
+        self.assertTrue(output[0].startswith('POST /foo 200 '))
+        self.assertTrue(output[-1].startswith('GET /error 502 '))
+
+    @mock.patch(BUILTIN + '.print')
+    def test_concurrent_requests(self, mock_print):
+        sandbox = tempfile.mkdtemp()
+        with open(os.path.join(sandbox, 'handler.py'), 'w') as f:
+            f.write(handler_code)
+        containers = cli._EmulatorPool(config, sandbox, 2)
+        server = cli._ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            cli._get_request_handler_class(config, 'dev', containers))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+        responses = []
+
+        def request():
+            rv = urlopen(url)
+            responses.append((rv.getcode(),
+                              json.loads(rv.read().decode('utf-8'))))
+
+        try:
+            clients = [threading.Thread(target=request) for i in range(6)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+            containers.close()
+            shutil.rmtree(sandbox)
+
+        self.assertEqual([status for status, _ in responses], [200] * 6)
+        self.assertEqual(containers.workers, [])
+        pids = {}
+        for _, rv in responses:
+            pids.setdefault(rv['pid'], []).append((rv['start'], rv['end']))
+        self.assertEqual(len(pids), 2)
+        for invocations in pids.values():
+            invocations.sort()
+            for i in range(1, len(invocations)):
+                self.assertGreaterEqual(invocations[i][0],
+                                        invocations[i - 1][1])
+
+    @mock.patch(BUILTIN + '.print')
+    @mock.patch('slam.cli._ThreadingHTTPServer')
+    @mock.patch('slam.cli._EmulatorPool')
+    @mock.patch('slam.cli._generate_lambda_handler')
+    @mock.patch('slam.cli.os.path.exists', return_value=True)
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_serve(self, _load_config, exists, _generate_lambda_handler,
+                   _EmulatorPool, server, mock_print):
+        cli.main(['serve', '--stage', 'prod', '--port', '8000',
+                  '--workers', '2'])
+        _generate_lambda_handler.assert_called_once_with(config)
+        _EmulatorPool.assert_called_once_with(
+            config, os.getcwd(), 2, path=[os.path.abspath('.slam')])
+        _EmulatorPool().close.assert_called_once_with()
+        self.assertEqual(server.call_args[0][0], ('127.0.0.1', 8000))
+        server().serve_forever.assert_called_once_with()
+        server().server_close.assert_called_once_with()
+
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_serve_invalid_stage(self, _load_config):
+        self.assertRaises(ValueError, cli.main, ['serve', '--stage', 'bad'])
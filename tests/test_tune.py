@@ -0,0 +1,195 @@
+import base64
+import mock
+import sys
+import unittest
+
+import botocore
+
+from slam import cli
+from .test_deploy import config, describe_stacks_response
+
+BUILTIN = '__builtin__'
+if sys.version_info >= (3, 0):
+    BUILTIN = 'builtins'
+
+
+def _log(duration, billed, init=None):
+    log = ('START RequestId: abc Version: 1\n'
+           'REPORT RequestId: abc\tDuration: {} ms\tBilled Duration: {} ms\t'
+           'Memory Size: 128 MB\tMax Memory Used: 70 MB\t').format(
+               duration, billed)
+    if init:
+        log += 'Init Duration: {} ms\t'.format(init)
+    return base64.b64encode((log + '\n').encode('utf-8')).decode('utf-8')
+
+
+class TuneTests(unittest.TestCase):
+    def test_parse_lambda_report(self):
+        self.assertEqual(cli._parse_lambda_report(''), {})
+        log = base64.b64decode(_log(10.5, 11, 200.25)).decode('utf-8')
+        self.assertEqual(cli._parse_lambda_report(log),
+                         {'duration': 10.5, 'billed': 11, 'init': 200.25})
+
+    def test_tune_memory_size(self):
+        lmb = mock.MagicMock()
+        lmb.invoke.side_effect = [
+            {'LogResult': _log(300, 300, 100)},
+            {'LogResult': _log(10, 10)},
+            {'LogResult': _log(20, 20), 'FunctionError': 'Unhandled'},
+        ]
+        result = cli._tune_memory_size(lmb, 'foo', '3', 1024, [{'a': 1}], 3,
+                                       1)
+        lmb.invoke.assert_called_with(FunctionName='foo', Qualifier='3',
+                                      Payload='{"a": 1}', LogType='Tail')
+        self.assertEqual(result['memory'], 1024)
+        self.assertEqual(result['cold'], 1)
+        self.assertEqual(result['errors'], 1)
+        self.assertEqual(result['duration'], 15)
+        self.assertEqual(result['billed'], 15)
+        self.assertAlmostEqual(result['cost'],
+                               0.015 * cli._LAMBDA_GB_SECOND_PRICE +
+                               cli._LAMBDA_REQUEST_PRICE)
+
+    @mock.patch('slam.cli.boto3.client')
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_tune(self, _load_config, client):
+        mock_cfn = mock.MagicMock()
+        mock_lambda = mock.MagicMock()
+        mock_cfn.describe_stacks.return_value = describe_stacks_response
+        mock_lambda.get_function_configuration.side_effect = [
+            {'MemorySize': 512, 'CodeSha256': 'abc',
+             'Environment': {'Variables': {'FOO': 'bar'}}},
+            {'MemorySize': 512, 'CodeSha256': 'def'}]
+        mock_lambda.publish_version.side_effect = [{'Version': '7'},
+                                                   {'Version': '8'}]
+        mock_lambda.invoke.side_effect = [
+            {'LogResult': _log(100, 100, 50)}, {'LogResult': _log(100, 100)},
+            {'LogResult': _log(40, 40, 50)}, {'LogResult': _log(40, 40)}]
+        client.side_effect = [mock_cfn, mock_lambda]
+
+        output = []
+        with mock.patch(BUILTIN + '.print',
+                        side_effect=lambda *args: output.append(args[0])):
+            cli.main(['tune', '--stage', 'prod', '--memory', '128,512',
+                      '--invocations', '2', '--concurrency', '1'])
+        mock_lambda.get_function_configuration.assert_any_call(
+            FunctionName='foo', Qualifier='2')
+        mock_lambda.update_function_configuration.assert_any_call(
+            FunctionName='foo', MemorySize=128,
+            Environment={'Variables': {'FOO': 'bar', 'SLAM_STAGE': 'prod'}})
+        mock_lambda.update_function_configuration.assert_any_call(
+            FunctionName='foo', MemorySize=512,
+            Environment={'Variables': {'FOO': 'bar', 'SLAM_STAGE': 'prod'}})
+        mock_lambda.update_function_configuration.assert_called_with(
+            FunctionName='foo', MemorySize=512,
+            Environment={'Variables': {'FOO': 'bar'}})
+        mock_lambda.get_waiter.assert_called_once_with('function_updated')
+        self.assertEqual(mock_lambda.get_waiter().wait.call_count, 3)
+        mock_lambda.publish_version.assert_any_call(
+            FunctionName='foo', Description='slam tune 128 MB')
+        mock_lambda.invoke.assert_any_call(
+            FunctionName='foo', Qualifier='7', Payload='{"kwargs": {}}',
+            LogType='Tail')
+        mock_lambda.invoke.assert_any_call(
+            FunctionName='foo', Qualifier='8', Payload='{"kwargs": {}}',
+            LogType='Tail')
+        mock_lambda.delete_function.assert_any_call(FunctionName='foo',
+                                                    Qualifier='7')
+        mock_lambda.delete_function.assert_any_call(FunctionName='foo',
+                                                    Qualifier='8')
+        self.assertEqual(output[0], 'Warning: the prod stage is not running '
+                                    'the latest deployed code, which is the '
+                                    'code that will be tuned.')
+        self.assertEqual(output[1], 'Testing 128 MB...')
+        self.assertEqual(output[2], 'Testing 512 MB...')
+        self.assertEqual(output[3], 'Cleaning up...')
+        self.assertIn('128 MB', output[5])
+        self.assertIn('100.00 ms', output[5])
+        self.assertIn('$0.41', output[5])
+        self.assertIn('512 MB', output[6])
+        self.assertEqual(output[7], 'Recommended memory size for lowest '
+                                    'cost: 128 MB (currently 512 MB).')
+
+    @mock.patch('slam.cli.boto3.client')
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_tune_speed(self, _load_config, client):
+        mock_cfn = mock.MagicMock()
+        mock_lambda = mock.MagicMock()
+        mock_cfn.describe_stacks.return_value = describe_stacks_response
+        mock_lambda.get_function_configuration.return_value = {
+            'MemorySize': 128, 'CodeSha256': 'abc'}
+        mock_lambda.publish_version.side_effect = [{'Version': '7'},
+                                                   {'Version': '8'}]
+        mock_lambda.invoke.side_effect = [{'LogResult': _log(100, 100)},
+                                          {'LogResult': _log(40, 40)}]
+        client.side_effect = [mock_cfn, mock_lambda]
+
+        output = []
+        with mock.patch(BUILTIN + '.print',
+                        side_effect=lambda *args: output.append(args[0])):
+            cli.main(['tune', '--memory', '128,512', '--invocations', '1',
+                      '--strategy', 'speed'])
+        mock_lambda.get_function_configuration.assert_called_once_with(
+            FunctionName='foo')
+        mock_lambda.update_function_configuration.assert_called_with(
+            FunctionName='foo', MemorySize=128,
+            Environment={'Variables': {}})
+        self.assertEqual(output[-1], 'Recommended memory size for lowest '
+                                     'duration: 512 MB (currently 512 MB).')
+
+    @mock.patch('slam.cli.boto3.client')
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_tune_errors(self, _load_config, client):
+        mock_cfn = mock.MagicMock()
+        mock_lambda = mock.MagicMock()
+        mock_cfn.describe_stacks.return_value = describe_stacks_response
+        mock_lambda.get_function_configuration.return_value = {
+            'MemorySize': 128, 'CodeSha256': 'abc'}
+        mock_lambda.publish_version.return_value = {'Version': '7'}
+        mock_lambda.invoke.return_value = {'LogResult': _log(100, 100),
+                                           'FunctionError': 'Unhandled'}
+        client.side_effect = [mock_cfn, mock_lambda]
+
+        output = []
+        with mock.patch(BUILTIN + '.print',
+                        side_effect=lambda *args: output.append(args[0])):
+            cli.main(['tune', '--memory', '128', '--invocations', '1'])
+        self.assertEqual(output[-1],
+                         'No memory size could be tested without errors.')
+
+    @mock.patch('slam.cli.boto3.client')
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_tune_cleanup_on_error(self, _load_config, client):
+        mock_cfn = mock.MagicMock()
+        mock_lambda = mock.MagicMock()
+        mock_cfn.describe_stacks.return_value = describe_stacks_response
+        mock_lambda.get_function_configuration.return_value = {
+            'MemorySize': 128, 'CodeSha256': 'abc'}
+        mock_lambda.publish_version.return_value = {'Version': '7'}
+        mock_lambda.invoke.side_effect = RuntimeError('foo')
+        client.side_effect = [mock_cfn, mock_lambda]
+
+        with mock.patch(BUILTIN + '.print'):
+            self.assertRaises(RuntimeError, cli.main,
+                              ['tune', '--memory', '128,256'])
+        mock_lambda.publish_version.assert_called_once_with(
+            FunctionName='foo', Description='slam tune 128 MB')
+        mock_lambda.update_function_configuration.assert_called_with(
+            FunctionName='foo', MemorySize=128,
+            Environment={'Variables': {}})
+        mock_lambda.delete_function.assert_called_once_with(
+            FunctionName='foo', Qualifier='7')
+
+    @mock.patch('slam.cli.boto3.client')
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_tune_not_deployed(self, _load_config, client):
+        mock_cfn = mock.MagicMock()
+        mock_cfn.describe_stacks.side_effect = \
+            botocore.exceptions.ClientError({'Error': {}}, 'operation')
+        client.side_effect = [mock_cfn, mock.MagicMock()]
+        self.assertRaises(RuntimeError, cli.main, ['tune'])
+
+    @mock.patch('slam.cli._load_config', return_value=config)
+    def test_tune_invalid_arguments(self, _load_config):
+        self.assertRaises(ValueError, cli.main, ['tune', '--stage', 'foo'])
+        self.assertRaises(ValueError, cli.main, ['tune', '--memory', 'a,b'])
@@ -16,6 +16,15 @@ class WSGITests(unittest.TestCase):
         self.assertEqual(plugin_config['deploy_api_gateway'], True)
         self.assertEqual(plugin_config['log_stages'], ['dev'])
 
+    def test_init_asgi(self):
+        plugin_config = wsgi.init.func(config=deploy_config, wsgi=False,
+                                       no_api_gateway=True, asgi=True)
+        self.assertEqual(plugin_config, {'deploy_api_gateway': False,
+                                         'log_stages': ['dev'],
+                                         'asgi': True})
+        self.assertIsNone(wsgi.init.func(config=deploy_config, wsgi=False,
+                                         no_api_gateway=False, asgi=False))
+
     def test_wsgi_resources(self):
         res = wsgi._get_wsgi_resources(config)
         self.assertIn('Api', res)
@@ -37,12 +46,308 @@ class WSGITests(unittest.TestCase):
             res['ProdApiDeployment']['Properties']['StageDescription']
             ['MethodSettings'][0]['LoggingLevel'], 'ERROR')
 
+    def test_wsgi_tracing(self):
+        cfg = deepcopy(config)
+        res = wsgi._get_wsgi_resources(cfg)
+        self.assertNotIn('TracingEnabled', res['DevApiDeployment'][
+            'Properties']['StageDescription'])
+        cfg['aws']['tracing'] = 'active'
+        res = wsgi._get_wsgi_resources(cfg)
+        for stage in ['Dev', 'Staging', 'Prod']:
+            self.assertTrue(res[stage + 'ApiDeployment']['Properties'][
+                'StageDescription']['TracingEnabled'])
+
+    def test_wsgi_cache_and_throttling(self):
+        cfg = deepcopy(config)
+        cfg['wsgi']['cache'] = {
+            'prod': {'cluster_size': 1.6, 'ttl': 60,
+                     'methods': [{'path': '/{proxy+}', 'ttl': 10}]}
+        }
+        cfg['wsgi']['cache_key_query_strings'] = ['page']
+        cfg['wsgi']['cache_key_headers'] = ['Accept']
+        cfg['wsgi']['throttling'] = {
+            'prod': {'burst_limit': 500, 'rate_limit': 1000},
+            'staging': {'rate_limit': 10}
+        }
+        res = wsgi._get_wsgi_resources(cfg)
+        prod = res['ProdApiDeployment']['Properties']['StageDescription']
+        self.assertTrue(prod['CacheClusterEnabled'])
+        self.assertEqual(prod['CacheClusterSize'], '1.6')
+        self.assertEqual(prod['MethodSettings'], [
+            {'ResourcePath': '/*', 'HttpMethod': '*', 'LoggingLevel': 'ERROR',
+             'ThrottlingBurstLimit': 500, 'ThrottlingRateLimit': 1000},
+            {'ResourcePath': '/', 'HttpMethod': 'GET',
+             'LoggingLevel': 'ERROR', 'CachingEnabled': True,
+             'CacheTtlInSeconds': 60, 'ThrottlingBurstLimit': 500,
+             'ThrottlingRateLimit': 1000},
+            {'ResourcePath': '/~1{proxy+}', 'HttpMethod': 'GET',
+             'LoggingLevel': 'ERROR', 'CachingEnabled': True,
+             'CacheTtlInSeconds': 10, 'ThrottlingBurstLimit': 500,
+             'ThrottlingRateLimit': 1000}])
+        self.assertEqual(res['ProdApiDeployment']['DependsOn'],
+                         ['ApiRootMethod', 'ApiMethod', 'ApiRootGetMethod',
+                          'ApiGetMethod'])
+        staging = res['StagingApiDeployment']['Properties'][
+            'StageDescription']
+        self.assertNotIn('CacheClusterEnabled', staging)
+        self.assertEqual(staging['MethodSettings'], [
+            {'ResourcePath': '/*', 'HttpMethod': '*', 'LoggingLevel': 'ERROR',
+             'ThrottlingRateLimit': 10}])
+        dev = res['DevApiDeployment']['Properties']['StageDescription']
+        self.assertNotIn('CacheClusterEnabled', dev)
+        self.assertEqual(dev['MethodSettings'], [
+            {'ResourcePath': '/*', 'HttpMethod': '*', 'LoggingLevel': 'INFO'}])
+
+        # requests with other methods go to the ANY methods, which are not
+        # cached
+        for name in ['ApiRootMethod', 'ApiMethod']:
+            self.assertEqual(res[name]['Properties']['HttpMethod'], 'ANY')
+            self.assertNotIn('RequestParameters', res[name]['Properties'])
+            self.assertNotIn('CacheKeyParameters',
+                             res[name]['Properties']['Integration'])
+        method = res['ApiGetMethod']['Properties']
+        self.assertEqual(method['HttpMethod'], 'GET')
+        self.assertEqual(method['ResourceId'], {'Ref': 'ApiResource'})
+        self.assertEqual(method['RequestParameters'], {
+            'method.request.path.proxy': True,
+            'method.request.querystring.page': False,
+            'method.request.header.Accept': False})
+        self.assertEqual(method['Integration']['CacheKeyParameters'], [
+            'method.request.path.proxy', 'method.request.querystring.page',
+            'method.request.header.Accept'])
+        self.assertEqual(method['Integration']['RequestParameters'], {
+            'integration.request.path.proxy': 'method.request.path.proxy',
+            'integration.request.querystring.page':
+                'method.request.querystring.page',
+            'integration.request.header.Accept':
+                'method.request.header.Accept'})
+        root_method = res['ApiRootGetMethod']['Properties']
+        self.assertEqual(root_method['HttpMethod'], 'GET')
+        self.assertEqual(root_method['Integration']['CacheKeyParameters'], [
+            'method.request.querystring.page',
+            'method.request.header.Accept'])
+
+    def test_wsgi_cache_method_settings(self):
+        cfg = deepcopy(config)
+        cfg['wsgi']['cache'] = {
+            'prod': {'methods': [{'path': '/', 'method': 'GET', 'ttl': 0}]}}
+        settings = wsgi._get_wsgi_method_settings(cfg, 'prod', False)
+        self.assertEqual(
+            [(s['ResourcePath'], s['HttpMethod'], s.get('CachingEnabled'),
+              s.get('CacheTtlInSeconds')) for s in settings],
+            [('/*', '*', None, None), ('/', 'GET', False, 0),
+             ('/~1{proxy+}', 'GET', True, 300)])
+        cfg['wsgi']['cache'] = {
+            'prod': {'methods': [{'path': '/foo/bar', 'ttl': 30}]}}
+        self.assertRaises(ValueError, wsgi._get_wsgi_method_settings, cfg,
+                          'prod', False)
+        cfg['wsgi']['cache'] = {
+            'prod': {'methods': [{'path': '/', 'method': 'ANY', 'ttl': 30}]}}
+        self.assertRaises(ValueError, wsgi._get_wsgi_method_settings, cfg,
+                          'prod', False)
+
     def test_wsgi_outputs(self):
         outputs = wsgi._get_wsgi_outputs(config)
         self.assertIn('DevEndpoint', outputs)
         self.assertIn('StagingEndpoint', outputs)
         self.assertIn('ProdEndpoint', outputs)
 
+    def test_cdn_resources(self):
+        cfg = deepcopy(config)
+        cfg['wsgi']['cdn'] = {'stages': ['prod', 'bad'], 'default_ttl': 5,
+                              'headers': ['Accept'], 'cookies': 'all',
+                              'price_class': 'PriceClass_100'}
+        res = wsgi._get_cdn_resources(cfg)
+        self.assertEqual(list(res.keys()), ['ProdCdnCachePolicy',
+                                            'ProdCdnDistribution'])
+        policy = res['ProdCdnCachePolicy']['Properties']['CachePolicyConfig']
+        self.assertEqual(policy['DefaultTTL'], 5)
+        self.assertEqual(policy['MinTTL'], 0)
+        params = policy['ParametersInCacheKeyAndForwardedToOrigin']
+        self.assertEqual(params['HeadersConfig'],
+                         {'HeaderBehavior': 'whitelist',
+                          'Headers': ['Accept']})
+        self.assertEqual(params['CookiesConfig'], {'CookieBehavior': 'all'})
+        self.assertEqual(params['QueryStringsConfig'],
+                         {'QueryStringBehavior': 'all'})
+        dist = res['ProdCdnDistribution']['Properties']['DistributionConfig']
+        self.assertEqual(dist['PriceClass'], 'PriceClass_100')
+        self.assertEqual(dist['Origins'][0]['OriginPath'], '/prod')
+        self.assertEqual(dist['DefaultCacheBehavior']['CachePolicyId'],
+                         {'Ref': 'ProdCdnCachePolicy'})
+
+        cfg['wsgi']['cdn'] = {'headers': 'all'}
+        self.assertRaises(ValueError, wsgi._get_cdn_resources, cfg)
+
+    def test_cdn_cache_key_config(self):
+        self.assertEqual(wsgi._get_cdn_cache_key_config('QueryString', 'none'),
+                         {'QueryStringBehavior': 'none'})
+        self.assertEqual(wsgi._get_cdn_cache_key_config('Cookie', None),
+                         {'CookieBehavior': 'none'})
+        self.assertEqual(wsgi._get_cdn_cache_key_config('Cookie', 'all'),
+                         {'CookieBehavior': 'all'})
+        self.assertEqual(wsgi._get_cdn_cache_key_config('Cookie', ['a']),
+                         {'CookieBehavior': 'whitelist', 'Cookies': ['a']})
+        self.assertRaises(ValueError, wsgi._get_cdn_cache_key_config,
+                          'Cookie', 'session')
+
+        cfg = deepcopy(config)
+        cfg['wsgi']['cdn'] = {'query_strings': 'none', 'cookies': 'none'}
+        params = wsgi._get_cdn_resources(cfg)['ProdCdnCachePolicy'][
+            'Properties']['CachePolicyConfig'][
+            'ParametersInCacheKeyAndForwardedToOrigin']
+        self.assertEqual(params['QueryStringsConfig'],
+                         {'QueryStringBehavior': 'none'})
+        self.assertEqual(params['CookiesConfig'], {'CookieBehavior': 'none'})
+
+    def test_cdn_outputs(self):
+        cfg = deepcopy(config)
+        cfg['wsgi']['cdn'] = {'default_ttl': 5}
+        outputs = wsgi._get_cdn_outputs(cfg)
+        self.assertEqual(set(outputs.keys()), {'DevCdnEndpoint',
+                                               'StagingCdnEndpoint',
+                                               'ProdCdnEndpoint'})
+        self.assertEqual(outputs['DevCdnEndpoint']['Value']['Fn::Join'][1][1],
+                         {'Fn::GetAtt': ['DevCdnDistribution', 'DomainName']})
+
+    def test_function_url_resources(self):
+        res = wsgi._get_function_url_resources(config)
+        for stage in ['Dev', 'Staging', 'Prod']:
+            self.assertEqual(
+                res[stage + 'FunctionUrl']['Properties'],
+                {'TargetFunctionArn': {'Ref': stage + 'FunctionAlias'},
+                 'AuthType': 'NONE', 'InvokeMode': 'BUFFERED'})
+            self.assertEqual(
+                res[stage + 'FunctionUrlPermission']['Properties']['Action'],
+                'lambda:InvokeFunctionUrl')
+            self.assertEqual(
+                res[stage + 'FunctionUrlInvokePermission']['Properties'],
+                {'Action': 'lambda:InvokeFunction',
+                 'FunctionName': {'Ref': stage + 'FunctionAlias'},
+                 'Principal': '*', 'InvokedViaFunctionUrl': True})
+        outputs = wsgi._get_function_url_outputs(config)
+        self.assertEqual(outputs['DevFunctionUrl'], {
+            'Value': {'Fn::GetAtt': ['DevFunctionUrl', 'FunctionUrl']}})
+
+    def test_function_url_iam_auth(self):
+        cfg = deepcopy(config)
+        cfg['wsgi']['function_url'] = {'auth': 'aws_iam'}
+        res = wsgi._get_function_url_resources(cfg)
+        self.assertEqual(sorted(res.keys()),
+                         ['DevFunctionUrl', 'ProdFunctionUrl',
+                          'StagingFunctionUrl'])
+        self.assertEqual(res['DevFunctionUrl']['Properties']['AuthType'],
+                         'AWS_IAM')
+        cfg['wsgi']['function_url'] = {'auth': 'foo'}
+        self.assertRaises(ValueError, wsgi._get_function_url_resources, cfg)
+
+    def test_function_url_without_api_gateway(self):
+        tpl = wsgi.cfn_template({
+            'stage_environments': {'dev': {}},
+            'wsgi': {'deploy_api_gateway': False, 'function_url': True}},
+            {'Resources': {}, 'Outputs': {}})
+        self.assertEqual(list(tpl['Resources'].keys()),
+                         ['DevFunctionUrl', 'DevFunctionUrlPermission',
+                          'DevFunctionUrlInvokePermission'])
+        self.assertEqual(list(tpl['Outputs'].keys()), ['DevFunctionUrl'])
+
+    def test_status_with_function_url(self):
+        stack = {'Outputs': [
+            {'OutputKey': 'DevFunctionUrl', 'OutputValue': 'https://a.com'}
+        ]}
+        self.assertEqual(wsgi.status(config, stack),
+                         {'dev': '(URL: https://a.com)'})
+        self.assertIsNone(wsgi.status(config, {'Outputs': []}))
+
+    def test_alb_resources(self):
+        cfg = deepcopy(config)
+        cfg['wsgi']['alb'] = {
+            'listener_arn': 'arn:listener',
+            'multi_value_headers': False,
+            'stages': {
+                'prod': {'priority': 10, 'host': 'api.example.com'},
+                'dev': {'priority': 20, 'path': ['/dev/*', '/test/*']}
+            }
+        }
+        res = wsgi._get_alb_resources(cfg)
+        self.assertEqual(set(res.keys()), {
+            'ProdAlbLambdaPermission', 'ProdAlbTargetGroup',
+            'ProdAlbListenerRule', 'DevAlbLambdaPermission',
+            'DevAlbTargetGroup', 'DevAlbListenerRule'})
+        self.assertEqual(
+            res['ProdAlbLambdaPermission']['Properties']['Principal'],
+            'elasticloadbalancing.amazonaws.com')
+        tg = res['ProdAlbTargetGroup']['Properties']
+        self.assertEqual(tg['TargetType'], 'lambda')
+        self.assertEqual(tg['Targets'], [{'Id': {'Ref': 'ProdFunctionAlias'}}])
+        self.assertEqual(tg['TargetGroupAttributes'][0]['Value'], 'false')
+        rule = res['ProdAlbListenerRule']['Properties']
+        self.assertEqual(rule['ListenerArn'], 'arn:listener')
+        self.assertEqual(rule['Priority'], 10)
+        self.assertEqual(rule['Conditions'], [
+            {'Field': 'path-pattern',
+             'PathPatternConfig': {'Values': ['/*']}},
+            {'Field': 'host-header',
+             'HostHeaderConfig': {'Values': ['api.example.com']}}])
+        self.assertEqual(rule['Actions'], [
+            {'Type': 'forward',
+             'TargetGroupArn': {'Ref': 'ProdAlbTargetGroup'}}])
+        rule = res['DevAlbListenerRule']['Properties']
+        self.assertEqual(rule['Conditions'], [
+            {'Field': 'path-pattern',
+             'PathPatternConfig': {'Values': ['/dev/*', '/test/*']}}])
+
+    def test_alb_errors(self):
+        cfg = deepcopy(config)
+        cfg['wsgi']['alb'] = {'stages': {'prod': {'priority': 10}}}
+        self.assertRaises(ValueError, wsgi._get_alb_resources, cfg)
+        cfg['wsgi']['alb'] = {'listener_arn': 'arn:listener',
+                              'stages': {'bad': {'priority': 10}}}
+        self.assertRaises(ValueError, wsgi._get_alb_resources, cfg)
+        cfg['wsgi']['alb'] = {'listener_arn': 'arn:listener',
+                              'stages': {'prod': {}}}
+        self.assertRaises(ValueError, wsgi._get_alb_resources, cfg)
+
+    @mock.patch('slam.plugins.wsgi._get_alb_resources',
+                return_value={'a': 'b'})
+    def test_alb_without_api_gateway(self, _get_alb_resources):
+        tpl = wsgi.cfn_template({
+            'wsgi': {'deploy_api_gateway': False, 'alb': {'foo': 'bar'}}},
+            {'Resources': {}, 'Outputs': {}})
+        self.assertEqual(tpl, {'Resources': {'a': 'b'}, 'Outputs': {}})
+
+    @mock.patch('slam.plugins.wsgi._get_cdn_outputs', return_value={'c': 'd'})
+    @mock.patch('slam.plugins.wsgi._get_cdn_resources',
+                return_value={'a': 'b'})
+    @mock.patch('slam.plugins.wsgi._get_wsgi_outputs',
+                return_value={'o': 'p'})
+    @mock.patch('slam.plugins.wsgi._get_wsgi_resources',
+                return_value={'r': 's'})
+    def test_cfn_template_with_cdn(self, _get_wsgi_resources,
+                                   _get_wsgi_outputs, _get_cdn_resources,
+                                   _get_cdn_outputs):
+        cfg = deepcopy(config)
+        cfg['wsgi']['cdn'] = {'stages': ['prod']}
+        tpl = {'Resources': {}, 'Outputs': {}}
+        tpl = wsgi.cfn_template(cfg, tpl)
+        self.assertEqual(tpl, {
+            'Resources': {'r': 's', 'a': 'b'},
+            'Outputs': {'o': 'p', 'c': 'd'}
+        })
+
+    def test_status_with_cdn(self):
+        stack = {'Outputs': [
+            {'OutputKey': 'DevEndpoint', 'OutputValue': 'https://a.com'},
+            {'OutputKey': 'StagingEndpoint', 'OutputValue': 'https://b.com'},
+            {'OutputKey': 'ProdEndpoint', 'OutputValue': 'https://c.com'},
+            {'OutputKey': 'ProdCdnEndpoint', 'OutputValue': 'https://d.com'}
+        ]}
+        self.assertEqual(wsgi.status(config, stack), {
+            'dev': 'https://a.com',
+            'staging': 'https://b.com',
+            'prod': 'https://c.com (CDN: https://d.com)'
+        })
+
     @mock.patch('slam.plugins.wsgi._get_wsgi_outputs',
                 return_value={'o': 'p'})
     @mock.patch('slam.plugins.wsgi._get_wsgi_resources',